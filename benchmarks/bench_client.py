@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the client against a local fake rhizome server.
+
+Reports, for each case, throughput, per-run latency and peak memory: that
+allocated, traced with tracemalloc, or on Python 2 the growth of the peak
+resident set size of a forked child making a run. Save the results of one
+version with --save and compare another against them with --compare.
+
+Usage: python benchmarks/bench_client.py [--latency SECONDS] [--repeat N]
+           [--scale X] [--only NAME] [--save FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from xylem.batch import BatchWriter
+from xylem.connection import Connection, values_to_dict
+from xylem.testing import FakeRhizome
+
+RESOLUTION = 60 * 30
+START = datetime(2014, 1, 1, 0, 0, 0, 0, pytz.utc)
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def cases(server, conn, scale):
+    """(name, items per run, function making one run) of each benchmark."""
+    days = int(365 * scale) or 1
+    year = (START, START + timedelta(days=days))
+    points = days * 48 + 1
+    slugs = ['places.{0}.elec'.format(n) for n in range(int(200 * scale))]
+    listed = len(server.channels)
+    values = server.values(
+        'a.b.c', 0, (points - 1) * RESOLUTION, RESOLUTION, 'accum', ['kWh'])
+
+    def write_batched():
+        with BatchWriter(conn, max_points=1000) as writer:
+            for ix in range(points // 10):
+                writer.write(slugs[ix % 10], values[ix][0], 1.0)
+
+    def write_each():
+        for ix in range(points // 100):
+            conn.write_channel_values(slugs[ix % 10], [[values[ix][0], 1.0]])
+
+    result = [
+        ('read', points,
+         lambda: conn.read_channel_values(slugs[0], *year)),
+        ('read windowed', points,
+         lambda: conn.read_channel_values(
+             slugs[0], *year, window_points=2000)),
+        ('read many', len(slugs) * 49,
+         lambda: conn.read_many_channel_values(
+             slugs, START, START + timedelta(days=1))),
+        ('list', listed, lambda: conn.list_channels()),
+        ('list concurrent', listed, lambda: conn.list_channels(workers=4)),
+        ('list large pages', listed,
+         lambda: conn.list_channels(page_size=1000)),
+        ('write each', points // 100, write_each),
+        ('write batched', points // 10, write_batched),
+        ('parse', points, lambda: values_to_dict(values, ['kWh'])),
+        ('parse regular', points,
+         lambda: values_to_dict(values, ['kWh'], RESOLUTION)),
+    ]
+    try:
+        import numpy  # noqa
+    except ImportError:
+        return result
+    result.append(('read timeseries', points,
+                   lambda: conn.read_channel_values(
+                       slugs[0], *year, as_timeseries=True)))
+    return result
+
+
+def measure(fn, items, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        latencies.append(time.time() - start)
+    latencies.sort()
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif resource is not None and hasattr(os, 'fork'):
+        peak = peak_rss_growth(fn)
+    median = latencies[len(latencies) // 2]
+    return {
+        'items': items,
+        'per_second': items / median,
+        'median': median,
+        'max': latencies[-1],
+        'peak_bytes': peak,
+    }
+
+
+def peak_rss_growth(fn):
+    """Bytes by which a run raises the peak resident set size.
+
+    The run is made in a forked child, whose peak starts from its resident
+    size rather than from the highest of any case run before.
+
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            before = _max_rss()
+            fn()
+            os.write(write_end, str(_max_rss() - before).encode('ascii'))
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as f:
+        output = f.read()
+    os.waitpid(pid, 0)
+    return int(output) if output else None
+
+
+def _max_rss():
+    """Peak resident set size of this process, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Given in kilobytes, except on macOS.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def report(results, baseline=None):
+    print('{0:>18} {1:>12} {2:>10} {3:>10} {4:>10} {5:>9}'.format(
+        'case', 'items/s', 'median s', 'max s', 'peak MB', 'vs base'))
+    for name, r in results:
+        peak = '-' if r['peak_bytes'] is None else '{0:.1f}'.format(
+            r['peak_bytes'] / 1e6)
+        base = (baseline or {}).get(name)
+        ratio = '-' if base is None else '{0:.2f}x'.format(
+            r['per_second'] / base['per_second'])
+        print('{0:>18} {1:>12.0f} {2:>10.4f} {3:>10.4f} {4:>10} {5:>9}'.format(
+            name, r['per_second'], r['median'], r['max'], peak, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='seconds the server waits before each answer')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies the size of every case')
+    parser.add_argument('--only', action='append',
+                        help='run only this case (may be repeated)')
+    parser.add_argument('--save', help='write the results to this file')
+    parser.add_argument('--compare', help='results file to compare against')
+    args = parser.parse_args()
+
+    with FakeRhizome(latency=args.latency) as server:
+        server.add_channels('places.{0}.elec', int(2000 * args.scale))
+        with Connection('fake', 'fake', root=server.root) as conn:
+            results = []
+            for name, items, fn in cases(server, conn, args.scale):
+                if args.only and name not in args.only:
+                    continue
+                results.append((name, measure(fn, items, args.repeat)))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'latency': args.latency,
+                'scale': args.scale,
+                'results': dict(results),
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare timestamp decoding of a large value array against iso8601.
+
+Usage: python benchmarks/bench_timestamps.py [points]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+import iso8601
+
+from xylem.timestamps import parse_epochs, parse_timestamps
+
+RESOLUTION = 60 * 30
+
+
+def make_strings(points):
+    start = datetime(2010, 1, 1, 0, 0, 0, 0, iso8601.UTC)
+    step = timedelta(seconds=RESOLUTION)
+    return [(start + step * ix).isoformat() for ix in range(points)]
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return time.time() - start, result
+
+
+def main(points=100000):
+    strings = make_strings(points)
+    irregular = strings[:]
+    del irregular[points // 2]
+
+    baseline, expected = timed(
+        lambda: [iso8601.parse_date(s) for s in strings])
+    cases = [
+        ('fixed format', parse_timestamps, strings, None),
+        ('regular series', parse_timestamps, strings, RESOLUTION),
+        ('irregular series', parse_timestamps, irregular, RESOLUTION),
+        ('epochs, fixed format', parse_epochs, strings, None),
+        ('epochs, regular series', parse_epochs, strings, RESOLUTION),
+    ]
+    print('{0} points, iso8601.parse_date: {1:.3f}s'.format(
+        points, baseline))
+    for name, fn, data, resolution in cases:
+        elapsed, result = timed(fn, data, resolution)
+        if fn is parse_timestamps and data is strings:
+            assert result == expected
+        print('{0:>24}: {1:.3f}s ({2:.1f}x)'.format(
+            name, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
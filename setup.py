@@ -18,6 +18,9 @@ setup(
     packages=find_packages(),
     # Any executable scripts, typically in 'bin'. E.g 'bin/do-something.py'
     scripts=[],
+    entry_points={
+        'console_scripts': ['xylem-export = xylem.export:main'],
+    },
     # REQUIRED: Your project's URL
     url='http://github.com/CarbonCulture/xylem',
     # Put your license here. See LICENSE.txt for more information
@@ -32,6 +35,13 @@ setup(
         'iso8601',
     ],
     tests_require=tests_require,
-    extras_require={'test': tests_require},
+    extras_require={
+        'test': tests_require,
+        'numpy': ['numpy'],
+        'async': ['aiohttp'],
+        'stream': ['ijson>=3.1'],
+        'msgpack': ['msgpack>=0.5.2'],
+        'parquet': ['numpy', 'pyarrow'],
+    },
     test_suite="nose.collector",
 )
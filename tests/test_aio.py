@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import threading
+from datetime import datetime, timedelta
+from unittest import TestCase, SkipTest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+import pytz
+
+try:
+    import asyncio
+    from xylem import aio
+except (ImportError, SyntaxError):  # Python 2, or aiohttp isn't installed
+    aio = None
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(requests):
+    """Handler serving a channel 'a.b.c' and its listing, and datausers."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, body):
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            requests.append((self.command, url.path, query))
+            if url.path == '/api/v1':
+                return self.send_json(200, {
+                    'channel': {'list_endpoint': '/api/v1/channel/'},
+                    'datauser': {'list_endpoint': '/api/v1/datauser/'},
+                })
+            if 'values__earliest' in query:
+                earliest = datetime.strptime(
+                    query['values__earliest'][0][:19], '%Y-%m-%dT%H:%M:%S')
+                latest = datetime.strptime(
+                    query['values__latest'][0][:19], '%Y-%m-%dT%H:%M:%S')
+                values = []
+                ts = earliest
+                while ts <= latest:
+                    values.append([
+                        ts.replace(tzinfo=pytz.utc).isoformat(),
+                        (ts - earliest).total_seconds() / 1800,
+                    ])
+                    ts += timedelta(minutes=30)
+                return self.send_json(200, {'meta': {}, 'objects': [{
+                    'slug': 'a.b.c', 'unit': 'kWh', 'value_type': 'accum',
+                    'values': values,
+                }]})
+            offset = int(query.get('offset', ['0'])[0])
+            objects = [{'slug': 'places.1.elec'}, {'slug': 'places.1.gas'}]
+            return self.send_json(200, {
+                'meta': {
+                    'next': None if offset else '/api/v1/channel/?offset=1',
+                },
+                'objects': objects[offset:offset + 1],
+            })
+
+        def do_PATCH(self):
+            length = int(self.headers['Content-Length'])
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            requests.append((self.command, self.path, body))
+            self.send_json(202, {})
+
+        do_POST = do_PATCH
+
+    return Handler
+
+
+class AsyncConnectionTests(TestCase):
+
+    def setUp(self):
+        if aio is None:
+            raise SkipTest("AsyncConnection needs Python 3.5+ and aiohttp")
+        self.requests = []
+        self.server = ThreadingServer(
+            ('127.0.0.1', 0), make_handler(self.requests))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.root = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def connect(self):
+        xc = aio.AsyncConnection('fake', 'fake', root=self.root)
+        self.addCleanup(lambda: self.wait(xc.close()))
+        return xc
+
+    def test_discovery_and_listing(self):
+        xc = self.connect()
+        resources = self.wait(aio.discover_available_resources(xc, 1))
+        self.assertEqual(sorted(resources), ['elec', 'gas'])
+        self.assertEqual(len(self.requests), 3)
+
+    def test_concurrent_windowed_read(self):
+        xc = self.connect()
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, pytz.utc)
+        latest = earliest + timedelta(days=1)
+        whole, windowed = self.wait(asyncio.gather(
+            xc.read_channel_values('a.b.c', earliest, latest),
+            xc.read_channel_values(
+                'a.b.c', earliest, latest, window_points=10, workers=3),
+        ))
+        self.assertEqual(len(whole), 49)
+        self.assertEqual(windowed, whole)
+        self.assertEqual(whole[latest], {'kWh': 48.0})
+        # Both reads waited on the same discovery request.
+        self.assertEqual(
+            len([r for r in self.requests if r[1] == '/api/v1']), 1)
+
+    def test_writes(self):
+        xc = self.connect()
+        self.wait(aio.write_app_event(xc, 'app', 'event', {'x': 1}, 2))
+        responses = self.wait(xc.create_datausers(['a', 'b', 'c'], workers=2))
+        self.assertEqual([code for code, _ in responses], [202, 202, 202])
+        writes = [r for r in self.requests if r[0] != 'GET']
+        self.assertEqual(
+            writes[0][1], '/api/v1/channel/communities.2.apps.app.events.event')
+        self.assertEqual(
+            sorted(body['access_name'] for _, _, body in writes[1:]),
+            ['a', 'b', 'c'])
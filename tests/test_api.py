@@ -1,18 +1,33 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import json
+import os
+import shutil
+import tempfile
+import threading
 
 from iso8601.iso8601 import Utc
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest import TestCase
 
 import httpretty
 
-from xylem.connection import Connection, ROOT
+from xylem.batch import BatchWriter
+from xylem.cache import HistoryCache
+from xylem.connection import (
+    Connection, DeadlineExceeded, ROOT, batch_slugs, merge_windows,
+    split_range,
+)
+from xylem.instrumentation import Instrumentation, Metrics
+from xylem.parallel import (
+    RateLimiter, deadline, first_completed, map_bounded, remaining,
+)
 from xylem.subjects import (
-    discover_available_resources, minimum_data_presence_for_range
+    data_presence_for_subjects, discover_available_resources,
+    minimum_data_presence_for_range, write_app_event,
 )
+from xylem.testing import FakeRhizome
 
 
 BASIC_RESOURCES_AVAILABLE = """
@@ -111,6 +126,44 @@ VALUES_RESPONSE_MULTI_UNIT = {
 }
 
 
+def fake_accum_channel(request, uri, headers):
+    """Serve a half-hourly channel whose usage in period k is k kWh."""
+    import iso8601
+
+    query = request.querystring
+    # httpretty decodes the '+' of the UTC offset as a space.
+    earliest = iso8601.parse_date(
+        query['values__earliest'][0].replace(' ', '+'))
+    latest = iso8601.parse_date(query['values__latest'][0].replace(' ', '+'))
+    value_type = query.get('value_type', ['accum'])[0]
+    origin = datetime(2014, 1, 1, 0, 0, 0, 0, Utc())
+    step = timedelta(minutes=30)
+
+    def accum(ts):
+        k = (ts - origin).total_seconds() // 1800
+        return k * (k + 1) / 2.0
+
+    values = []
+    ts = earliest if value_type == 'accum' else earliest + step
+    while ts <= latest:
+        if value_type == 'accum':
+            value = accum(ts) - accum(earliest)
+        else:
+            value = accum(ts) - accum(ts - step)
+        values.append([ts.isoformat(), value])
+        ts += step
+    body = {
+        "meta": {},
+        "objects": [{
+            "slug": query['slug'][0],
+            "unit": "kWh",
+            "value_type": "accum",
+            "values": values,
+        }],
+    }
+    return (200, headers, json.dumps(body))
+
+
 class XylemTestCase(TestCase):
 
     @httpretty.activate
@@ -129,6 +182,45 @@ class XylemTestCase(TestCase):
 
         self.assertEqual(sorted(resources.keys()), sorted(['elec', 'gas']))
 
+    @httpretty.activate
+    def test_list_channels_by_offset(self):
+        """Fetching pages by offset should list the same channels."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake')
+        slugs = ['places.{0}.elec'.format(n) for n in range(5)]
+
+        def listing(request, uri, headers):
+            limit = int(request.querystring.get('limit', ['2'])[0])
+            offset = int(request.querystring.get('offset', ['0'])[0])
+            more = offset + limit < len(slugs)
+            return (200, headers, json.dumps({
+                'meta': {
+                    'limit': limit, 'offset': offset,
+                    'total_count': len(slugs),
+                    'next': '/api/v1/channel/?limit={0}&offset={1}'.format(
+                        limit, offset + limit) if more else None,
+                },
+                'objects': [{'slug': slug}
+                            for slug in slugs[offset:offset + limit]],
+            }))
+
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'], body=listing)
+        followed = xc.list_channels()
+        self.assertEqual(sorted(followed), slugs)
+        # httpretty isn't thread-safe, so fetch the pages one at a time.
+        self.assertEqual(xc.list_channels(workers=1), followed)
+        offsets = [r.querystring.get('offset')
+                   for r in httpretty.HTTPretty.latest_requests[-3:]]
+        self.assertEqual(offsets, [None, ['2'], ['4']])
+
+        self.assertEqual(xc.list_channels(page_size=5, workers=1), followed)
+        self.assertEqual(
+            httpretty.last_request().querystring['limit'], ['5'])
+
     @httpretty.activate
     def test_read_values_multi_units(self):
         """Should get a dict keyed by timestamp, of dicts keyed by unit."""
@@ -153,9 +245,731 @@ class XylemTestCase(TestCase):
         self.assertTrue('pence' in result[earliest])
         self.assertTrue('kgCO2e' in result[earliest])
 
+    @httpretty.activate
+    def test_read_values_windowed(self):
+        """Windowed reads should match a single read of the whole range."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake')
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'],
+            body=fake_accum_channel, content_type="application/json"
+        )
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        latest = datetime(2014, 12, 3, 0, 0, 0, 0, Utc())
+        for value_type in ['accum', 'usage']:
+            whole = xc.read_channel_values(
+                'a.b.c', earliest, latest, value_type=value_type)
+            requests_made = len(httpretty.HTTPretty.latest_requests)
+            # httpretty isn't thread-safe, so fetch the windows one by one.
+            windowed = xc.read_channel_values(
+                'a.b.c', earliest, latest, value_type=value_type,
+                window_points=10, workers=1)
+            self.assertEqual(
+                len(httpretty.HTTPretty.latest_requests) - requests_made, 10)
+            self.assertEqual(windowed, whole)
+
+    @httpretty.activate
+    def test_iter_values(self):
+        """Iterating should yield a single read's values, window by window."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake')
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'],
+            body=fake_accum_channel, content_type="application/json"
+        )
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        latest = datetime(2014, 12, 2, 0, 0, 0, 0, Utc())
+        for value_type in ['accum', 'usage']:
+            whole = xc.read_channel_values(
+                'a.b.c', earliest, latest, value_type=value_type)
+            requests_made = len(httpretty.HTTPretty.latest_requests)
+            points = xc.iter_channel_values(
+                'a.b.c', earliest, latest, value_type=value_type,
+                window_points=10)
+            first = next(points)
+            self.assertEqual(
+                len(httpretty.HTTPretty.latest_requests) - requests_made, 1)
+            self.assertEqual([first] + list(points), sorted(whole.items()))
+
+            series = xc.read_channel_values(
+                'a.b.c', earliest, latest, value_type=value_type,
+                window_points=10, workers=1, as_timeseries=True)
+            self.assertEqual(series.to_dict(), whole)
+
+        batches = list(xc.iter_channel_values(
+            'a.b.c', earliest, latest, window_points=10, batch_size=20))
+        self.assertEqual([len(b) for b in batches], [20, 20, 9])
+
+    @httpretty.activate
+    def test_read_many_values(self):
+        """Each slug should get its values, or an error, not both."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake')
+
+        def many_channels(request, uri, headers):
+            slugs = request.querystring['slug__in'][0].split(',')
+            objects = []
+            for slug in slugs:
+                if slug == 'a.3':
+                    values = {'error': 'No history for a.3'}
+                else:
+                    values = [
+                        ["2014-12-01T00:00:00+00:00", 0],
+                        ["2014-12-01T00:30:00+00:00", len(slug)],
+                    ]
+                if slug != 'a.4':
+                    objects.append(
+                        {'slug': slug, 'unit': 'kWh', 'values': values})
+            body = {
+                'meta': {'next': None, 'total_count': len(objects)},
+                'objects': objects,
+            }
+            return (200, headers, json.dumps(body))
+
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'],
+            body=many_channels, content_type="application/json"
+        )
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        latest = datetime(2014, 12, 1, 0, 30, 0, 0, Utc())
+        results, errors = xc.read_many_channel_values(
+            ['a.1', 'a.22', 'a.3', 'a.4'], earliest, latest, batch_size=2,
+            workers=1)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 3)
+        self.assertEqual(sorted(results), ['a.1', 'a.22'])
+        self.assertEqual(results['a.22'][latest], {'kWh': 4})
+        self.assertEqual(sorted(errors), ['a.3', 'a.4'])
+        self.assertTrue('No history' in str(errors['a.3']))
+
+    def test_batch_slugs(self):
+        slugs = ['a.{0}'.format(ix) for ix in range(10)]
+        self.assertEqual(batch_slugs(slugs, 4), [
+            slugs[:4], slugs[4:8], slugs[8:]])
+        self.assertEqual(batch_slugs(slugs, max_chars=7), [
+            slugs[:2], slugs[2:4], slugs[4:6], slugs[6:8], slugs[8:]])
+
+    def test_split_range(self):
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        windows = split_range(
+            earliest, earliest + timedelta(hours=5), timedelta(hours=2))
+        self.assertEqual(
+            [(s - earliest, e - earliest) for s, e in windows],
+            [
+                (timedelta(hours=0), timedelta(hours=2)),
+                (timedelta(hours=2), timedelta(hours=4)),
+                (timedelta(hours=4), timedelta(hours=5)),
+            ]
+        )
+
+    def test_merge_windows_gap_at_boundary(self):
+        """A unit missing at a window boundary carries its last total on."""
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        ts = [earliest + timedelta(minutes=30 * n) for n in range(5)]
+        merged = merge_windows([
+            ('accum', {
+                ts[0]: {'kWh': 0.0, 'pence': 0.0},
+                ts[1]: {'kWh': 5.0, 'pence': 50.0},
+                ts[2]: {'kWh': None, 'pence': 80.0},
+            }),
+            ('accum', {
+                ts[2]: {'kWh': None, 'pence': 0.0},
+                ts[3]: {'kWh': 4.0, 'pence': 10.0},
+                ts[4]: {'kWh': 1.0, 'pence': None},
+            }),
+        ])
+        self.assertEqual(merged, {
+            ts[0]: {'kWh': 0.0, 'pence': 0.0},
+            ts[1]: {'kWh': 5.0, 'pence': 50.0},
+            ts[2]: {'kWh': None, 'pence': 80.0},
+            ts[3]: {'kWh': 9.0, 'pence': 90.0},
+            ts[4]: {'kWh': 6.0, 'pence': None},
+        })
+
+
+class HistoryCacheTests(TestCase):
+
+    def setUp(self):
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        self.cache = HistoryCache(':memory:', recent=timedelta(0))
+        self.xc = Connection('fake', 'fake', history_cache=self.cache)
+        httpretty.register_uri(
+            httpretty.GET, self.xc.services['channel'],
+            body=fake_accum_channel, content_type="application/json"
+        )
+        httpretty.register_uri(
+            httpretty.PATCH, self.xc.services['channel'] + 'a.b.c',
+            status=202, body=''
+        )
+        self.day = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def assertReadsLikeServer(self, requests_expected, earliest, latest,
+                              **kwargs):
+        requests_made = len(httpretty.HTTPretty.latest_requests)
+        # httpretty isn't thread-safe, so fetch any gaps one by one.
+        cached = self.xc.read_channel_values('a.b.c', earliest, latest,
+                                             workers=1, **kwargs)
+        self.assertEqual(
+            len(httpretty.HTTPretty.latest_requests) - requests_made,
+            requests_expected)
+        self.assertEqual(cached, self.xc.read_channel_values(
+            'a.b.c', earliest, latest, use_cache=False, **kwargs))
+
+    def test_only_gaps_are_read(self):
+        one_day = timedelta(days=1)
+        for value_type in ['accum', 'usage']:
+            self.cache.invalidate()
+            self.assertReadsLikeServer(
+                1, self.day, self.day + one_day, value_type=value_type)
+            self.assertReadsLikeServer(
+                0, self.day, self.day + one_day, value_type=value_type)
+            self.assertReadsLikeServer(
+                0, self.day + timedelta(hours=6), self.day + one_day,
+                value_type=value_type)
+            self.assertReadsLikeServer(
+                2, self.day - one_day, self.day + 2 * one_day,
+                value_type=value_type)
+
+        # The channel's own value type, accum here, isn't known up front.
+        self.assertReadsLikeServer(1, self.day, self.day + one_day)
+        self.assertReadsLikeServer(
+            0, self.day + timedelta(hours=1), self.day + one_day)
+
+    def test_recent_values_are_read_again(self):
+        self.cache.recent = timedelta(days=365 * 100)
+        self.assertReadsLikeServer(
+            1, self.day, self.day + timedelta(days=1), value_type='usage')
+        self.assertReadsLikeServer(
+            1, self.day, self.day + timedelta(days=1), value_type='usage')
+
+    def test_invalidate(self):
+        one_day = timedelta(days=1)
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage')
+        self.cache.invalidate('a.b.c', self.day + timedelta(hours=12))
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage')
+        self.cache.invalidate('a.b.c')
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage')
+        self.assertEqual(
+            self.xc.write_channel_values('a.b.c', [])[0], 202)
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage')
+
+    def test_eviction(self):
+        one_day = timedelta(days=1)
+        self.xc.read_channel_values(
+            'a.b.c', self.day, self.day + one_day, value_type='usage')
+        self.cache.max_bytes = self.cache.size()
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage', units='kWh')
+        self.assertTrue(self.cache.size() <= self.cache.max_bytes)
+        self.assertReadsLikeServer(
+            1, self.day, self.day + one_day, value_type='usage')
+
+
+class BatchWriterTests(TestCase):
+
+    def setUp(self):
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        self.xc = Connection('fake', 'fake')
+        self.failed = []
+        self.sent = []
+        # httpretty isn't thread-safe, so send batches one by one.
+        self.writer = BatchWriter(
+            self.xc, backoff=0.01, workers=1, max_delay=60,
+            on_error=lambda *args: self.failed.append(args))
+
+    def tearDown(self):
+        self.writer.close()
+        httpretty.disable()
+        httpretty.reset()
+
+    def accept(self, slug, *statuses):
+        """Answer PATCHes to slug with statuses in turn, then the last."""
+        statuses = list(statuses or [202])
+
+        def patch(request, uri, headers):
+            self.sent.append((slug, json.loads(request.body.decode('utf-8'))))
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            return (status, headers, '')
+
+        httpretty.register_uri(
+            httpretty.PATCH, self.xc.services['channel'] + slug, body=patch)
+
+    def patches(self):
+        # httpretty's latest_requests may hold a request twice.
+        return list(self.sent)
+
+    def test_writes_are_merged(self):
+        for slug in ['a.1', 'a.2']:
+            self.accept(slug)
+        threads = [
+            threading.Thread(target=lambda n=n: [
+                self.writer.write(
+                    'a.{0}'.format(ix % 2 + 1), '2014-12-01T00:00:0{0}'.format(
+                        n), ix, overwrite=ix > 7)
+                for ix in range(10)
+            ])
+            for n in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.writer.flush()
+
+        patches = self.patches()
+        self.assertEqual(
+            sorted((slug, body['overwrite']) for slug, body in patches),
+            [('a.1', False), ('a.1', True), ('a.2', False), ('a.2', True)])
+        self.assertEqual(
+            sum(len(body['values']) for slug, body in patches), 30)
+        self.assertEqual(self.failed, [])
+
+    def test_size_threshold_and_app_events(self):
+        slug = 'communities.1.apps.app.events.event'
+        self.accept(slug)
+        self.writer.max_points = 2
+        write_app_event(self.xc, 'app', 'event', {'n': 1}, 1,
+                        writer=self.writer)
+        self.assertEqual(self.patches(), [])
+        write_app_event(self.xc, 'app', 'event', {'n': 2}, 1,
+                        writer=self.writer)
+        self.writer.flush()
+        patches = self.patches()
+        self.assertEqual(len(patches), 1)
+        self.assertEqual(
+            [value for ts, value in patches[0][1]['values']],
+            [{'n': 1}, {'n': 2}])
+
+    def test_retries(self):
+        self.accept('a.1', 503, 202)
+        self.accept('a.2', 401)
+        self.writer.write('a.1', '2014-12-01T00:00:00', 1)
+        self.writer.write('a.2', '2014-12-01T00:00:00', 1)
+        self.writer.close()
+        self.assertEqual(
+            [slug for slug, body in self.patches()], ['a.1', 'a.1', 'a.2'])
+        self.assertEqual(len(self.failed), 1)
+        self.assertEqual(self.failed[0][0], 'a.2')
+
+    def test_failing_on_error_and_flush_after_close(self):
+        self.accept('a.1', 401)
+
+        def on_error(*args):
+            self.failed.append(args)
+            raise RuntimeError('broken handler')
+
+        self.writer.on_error = on_error
+        self.writer.write('a.1', '2014-12-01T00:00:00', 1)
+        self.writer.flush()
+        self.writer.write('a.1', '2014-12-01T00:30:00', 1)
+        self.writer.flush()
+        self.assertEqual(len(self.failed), 2)
+        self.writer.close()
+        with self.assertRaises(ValueError):
+            self.writer.flush()
+
+    def test_write_racing_close_is_sent(self):
+        import time
+
+        self.accept('a.1')
+        put = self.writer._queue.put
+        queueing = threading.Event()
+
+        def slow_put(item, timeout=None):
+            # The write has got past the closed check, but not queued yet.
+            queueing.set()
+            time.sleep(0.1)
+            put(item, timeout=timeout)
+
+        self.writer._queue.put = slow_put
+        writing = threading.Thread(
+            target=self.writer.write, args=('a.1', '2014-12-01T00:00:00', 1))
+        writing.start()
+        queueing.wait()
+        self.writer._queue.put = put
+        self.writer.close()
+        writing.join()
+        self.assertEqual(
+            [body['values'] for slug, body in self.patches()],
+            [[['2014-12-01T00:00:00', 1]]])
+
+
+class ParallelTests(TestCase):
+
+    def test_map_bounded_keeps_order(self):
+        import time
+
+        def slow_square(x):
+            time.sleep(0.01 * (5 - x))
+            return x * x
+
+        self.assertEqual(
+            map_bounded(slow_square, range(5), workers=3), [0, 1, 4, 9, 16])
+        self.assertEqual(map_bounded(slow_square, []), [])
+
+    def test_map_bounded_raises(self):
+        def fail(x):
+            raise ValueError(x)
+
+        self.assertRaises(ValueError, map_bounded, fail, range(3), 2)
+
+
+    def test_rate_limiter_spaces_calls(self):
+        import time
+
+        limiter = RateLimiter(50)
+        start = time.time()
+        map_bounded(lambda x: limiter.wait(), range(6), workers=3)
+        self.assertTrue(time.time() - start >= 5 * limiter.interval * 0.9)
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ResilienceTests(TestCase):
+
+    def connect(self, responses, **kwargs):
+        """Connection whose requests take the next of responses: a status
+        code, an exception to raise, or a (delay, status code) pair."""
+        import time
+
+        xc = Connection('fake', 'fake', lazy=True, backoff=0.001, **kwargs)
+        self.timeouts = []
+        self.responses = []
+        lock = threading.Lock()
+
+        def request(method, url, timeout=None, **kwargs):
+            with lock:
+                self.timeouts.append(timeout)
+                response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            if isinstance(response, tuple):
+                delay, response = response
+                time.sleep(delay)
+            response = FakeResponse(response)
+            with lock:
+                self.responses.append(response)
+            return response
+
+        xc.session.request = request
+        return xc
+
+    def test_retries(self):
+        xc = self.connect([IOError('reset'), 503, 200], retries=2)
+        self.assertEqual(xc.get('http://x/').status_code, 200)
+        self.assertEqual(len(self.timeouts), 3)
+        # The retried response is closed, releasing its connection.
+        self.assertEqual([r.closed for r in self.responses], [True, False])
+
+        xc = self.connect([503, 503], retries=1)
+        self.assertEqual(xc.get('http://x/').status_code, 503)
+        xc = self.connect([IOError('reset')], retries=0)
+        self.assertRaises(IOError, xc.get, 'http://x/')
+        # Writes aren't retried.
+        xc = self.connect([503, 200], retries=2)
+        self.assertEqual(xc.post('http://x/', data={}).status_code, 503)
+
+    def test_deadline(self):
+        xc = self.connect([200, 200, 200])
+        with deadline(30):
+            xc.get('http://x/')
+            with deadline(60):
+                self.assertTrue(remaining() <= 30)
+            # The budget reaches requests made on other threads.
+            map_bounded(lambda _: xc.get('http://x/'), range(2), workers=2)
+        self.assertEqual(remaining(), None)
+        self.assertTrue(all(timeout <= 30 for timeout in self.timeouts))
+        with deadline(0):
+            self.assertRaises(DeadlineExceeded, xc.get, 'http://x/')
+
+    def test_hedging(self):
+        xc = self.connect([(0.5, 500), 200], hedge_percentile=90)
+        # Not hedged until there are enough latencies to go on.
+        self.assertEqual(xc._hedge_delay(), None)
+        xc._latencies.extend([0.01] * 20)
+        self.assertEqual(xc.get('http://x/').status_code, 200)
+        self.assertEqual(len(self.timeouts), 2)
+
+    def test_first_completed(self):
+        import time
+
+        calls = []
+
+        def fail_then_succeed():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.05)
+                raise ValueError
+            return len(calls)
+
+        self.assertEqual(first_completed(fail_then_succeed, 0.01), 2)
+        self.assertEqual(first_completed(lambda: 1, 1), 1)
+
+    def test_first_completed_closes_loser(self):
+        import threading
+        import time
+
+        class Result(object):
+
+            def __init__(self, n):
+                self.n = n
+                self.closed = threading.Event()
+
+            def close(self):
+                self.closed.set()
+
+        results = []
+
+        def slow_then_fast():
+            result = Result(len(results))
+            results.append(result)
+            if result.n == 0:
+                time.sleep(0.05)
+            return result
+
+        winner = first_completed(slow_then_fast, 0.01)
+        self.assertEqual(winner.n, 1)
+        self.assertTrue(results[0].closed.wait(1))
+        self.assertFalse(winner.closed.is_set())
+
+
+class InstrumentationTests(TestCase):
+
+    @httpretty.activate
+    def test_metrics(self):
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        metrics = Metrics()
+        xc = Connection('fake', 'fake', instrumentation=metrics)
+        body = json.dumps(VALUES_RESPONSE_MULTI_UNIT)
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'], body=body,
+            content_type="application/json"
+        )
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+        xc.read_channel_values(
+            'a.b.c', earliest, earliest + timedelta(minutes=30),
+            units=['kWh', 'pence', 'kgCO2e'])
+
+        snapshot = metrics.snapshot()
+        get = (('method', 'get'),)
+        self.assertEqual(
+            snapshot['counters'][
+                ('requests', (('method', 'get'), ('status', '200')))], 2)
+        self.assertEqual(snapshot['counters'][('retries', get)], 0)
+        self.assertEqual(
+            snapshot['counters'][('bytes_received', get)],
+            len(BASIC_RESOURCES_AVAILABLE) + len(body))
+        self.assertEqual(
+            snapshot['histograms'][('request_seconds', get)]['count'], 2)
+        for phase in ['decode', 'parse']:
+            self.assertEqual(snapshot['histograms'][
+                ('phase_seconds', (('phase', phase),))]['count'], 1)
+        text = metrics.prometheus()
+        self.assertTrue(
+            'xylem_requests_total{method="get",status="200"} 2\n' in text)
+        self.assertTrue(
+            'xylem_request_seconds_bucket{method="get",le="+Inf"} 2\n'
+            in text)
+
+    def test_failed_requests_are_reported(self):
+        events = []
+        xc = Connection('fake', 'fake', lazy=True, retries=1, backoff=0)
+
+        class Recorder(Instrumentation):
+            def request(self, event):
+                events.append(event)
+
+        def request(*args, **kwargs):
+            raise IOError('reset')
+
+        xc.instrumentation = Recorder()
+        xc.session.request = request
+        self.assertRaises(IOError, xc.get, 'http://x/')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].status_code, None)
+        self.assertEqual(events[0].retries, 1)
+        self.assertTrue(isinstance(events[0].error, IOError))
+
+
+class BulkCreateTests(TestCase):
+
+    @httpretty.activate
+    def test_failures_are_reported_per_item(self):
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake')
+
+        def create(request, uri, headers):
+            slug = json.loads(request.body.decode('utf-8'))['slug']
+            if slug == 'taken':
+                return (400, headers, '{"error": "exists"}')
+            return (201, headers, '{}')
+
+        httpretty.register_uri(
+            httpretty.POST, xc.services['channel'], body=create)
+        channels = [{'slug': slug} for slug in ['a', 'taken', 'b']]
+        # httpretty isn't thread-safe, so make the requests one at a time.
+        results = xc.bulk_create_channels(channels, workers=1, rate=1000)
+        self.assertEqual([r.item for r in results], channels)
+        self.assertEqual(
+            [r.status_code for r in results], [201, 400, 201])
+        self.assertTrue(all(r.elapsed >= 0 for r in results))
+
+        def broken(name):
+            if name == 'b':
+                raise IOError('connection reset')
+            return (201, '{}')
+
+        xc.create_datauser = broken
+        results = xc.bulk_create_datausers(['a', 'b', 'c'], workers=2)
+        self.assertEqual([r.status_code for r in results], [201, None, 201])
+        self.assertTrue(isinstance(results[1].error, IOError))
+
+
+class PermissionSyncTests(TestCase):
+
+    def test_only_differences_are_sent(self):
+        with FakeRhizome() as server:
+            server.add_channels('places.{0}.elec', 250)
+            server.permissions[('someone', 'places.1.elec')] = ['read']
+            server.permissions[('someone', 'places.2.elec')] = [
+                'write', 'read']
+            server.permissions[('someone', 'places.3.elec')] = ['read']
+            xc = Connection('fake', 'fake', root=server.root)
+            wanted = dict(
+                ('places.{0}.elec'.format(n), ['read']) for n in range(250))
+            wanted['places.2.elec'] = ['read', 'write']
+            wanted['places.3.elec'] = []
+            wanted['places.nope.elec'] = ['read']
+
+            requests = server.requests
+            result = xc.sync_permissions('someone', wanted, batch_size=100)
+            # Three reads, and a write per change.
+            self.assertEqual(server.requests - requests, 3 + 248)
+            self.assertEqual(len(result.changed), 248)
+            self.assertEqual(result.changed['places.3.elec'], (['read'], []))
+            self.assertEqual(
+                result.unchanged, ['places.1.elec', 'places.2.elec'])
+            self.assertEqual(list(result.failed), ['places.nope.elec'])
+            self.assertEqual(
+                server.permissions[('someone', 'places.0.elec')], ['read'])
+            self.assertEqual(
+                server.permissions[('someone', 'places.3.elec')], [])
+
+            requests = server.requests
+            del wanted['places.nope.elec']
+            result = xc.sync_permissions('someone', wanted, batch_size=100)
+            self.assertEqual(server.requests - requests, 3)
+            self.assertEqual(result.changed, {})
+            self.assertEqual(len(result.unchanged), 250)
+
+    def test_missing_permissions_field_fails_per_channel(self):
+        with FakeRhizome() as server:
+            server.add_channels('places.{0}.elec', 3)
+            xc = Connection('fake', 'fake', root=server.root)
+            public = server._public
+
+            def without_permissions(channel, user=None):
+                obj = public(channel, user)
+                if channel['slug'] == 'places.1.elec':
+                    del obj['permissions']
+                return obj
+
+            server._public = without_permissions
+            result = xc.sync_permissions('someone', dict(
+                ('places.{0}.elec'.format(n), ['read']) for n in range(3)))
+            self.assertEqual(sorted(result.changed),
+                             ['places.0.elec', 'places.2.elec'])
+            self.assertEqual(list(result.failed), ['places.1.elec'])
+            self.assertTrue(
+                'permissions' in str(result.failed['places.1.elec']))
+
+    def test_user_not_given_back_fails(self):
+        with FakeRhizome() as server:
+            server.add_channels('places.{0}.elec', 3)
+            server.permissions[('fake', 'places.1.elec')] = ['read']
+            xc = Connection('fake', 'fake', root=server.root)
+            list_channels = server.list_channels
+
+            def ignoring_user(path, query):
+                # Like a server without the user param: the caller's own
+                # permissions, and no user in the meta.
+                query = dict(query, user=['fake'])
+                meta, objects = list_channels(path, query)
+                del meta['user']
+                return meta, objects
+
+            server.list_channels = ignoring_user
+            requests = server.requests
+            result = xc.sync_permissions(
+                'someone', {'places.1.elec': ['read']})
+            self.assertEqual(server.requests - requests, 1)
+            self.assertEqual(result.unchanged, [])
+            self.assertEqual(list(result.failed), ['places.1.elec'])
+            self.assertTrue('user' in str(result.failed['places.1.elec']))
+            self.assertFalse(
+                ('someone', 'places.1.elec') in server.permissions)
+
 
 class QATests(TestCase):
 
+    def test_presence_for_subjects(self):
+        with FakeRhizome() as server:
+            server.add_channels('places.{0}.elec', 30, presence=0.75)
+            server.add_channels('places.{0}.gas', 10, presence=0.5)
+            xc = Connection('fake', 'fake', root=server.root)
+            earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+            before = server.requests
+            presence, errors = data_presence_for_subjects(
+                xc, earliest, earliest + timedelta(days=1), range(1, 33),
+                utilities=['elec', 'gas'], batch_size=20, workers=2)
+            self.assertEqual(server.requests - before, 4)
+        self.assertEqual(len(presence), 29 + 9)
+        self.assertEqual(presence['places.1.elec'], [(earliest, 0.75)])
+        self.assertEqual(presence['places.9.gas'], [(earliest, 0.5)])
+        self.assertEqual(
+            sorted(errors),
+            sorted(['places.{0}.gas'.format(n) for n in range(10, 33)] +
+                   ['places.{0}.elec'.format(n) for n in range(30, 33)]))
+        self.assertTrue('403' in str(errors['places.30.elec']))
+
     @httpretty.activate
     def test_min_presence_check(self):
         httpretty.register_uri(
@@ -210,3 +1024,72 @@ class QATests(TestCase):
             xc, datetime.now(), datetime.now(), slug='a.b.c'
         )
         self.assertEqual(min_presence, 0.5)
+
+
+class ConnectionPoolTests(TestCase):
+
+    @httpretty.activate
+    def test_requests_share_pooled_session(self):
+        """Every call should go through the connection's own session."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake', pool_maxsize=4)
+        adapter = xc.session.get_adapter(ROOT)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+        httpretty.register_uri(
+            httpretty.GET, xc.services['channel'],
+            body=PLACE_BASIC_UTILS, content_type="application/json"
+        )
+        calls = []
+        request = xc.session.request
+
+        def counting_request(method, *args, **kwargs):
+            calls.append(method)
+            return request(method, *args, **kwargs)
+
+        xc.session.request = counting_request
+        self.assertEqual(
+            sorted(xc.list_channels().keys()),
+            ['places.N.elec', 'places.N.gas'])
+        self.assertEqual(calls, ['get'])
+        xc.close()
+
+
+class LazyDiscoveryTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmpdir, 'services.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @httpretty.activate
+    def test_lazy_discovery_uses_cache(self):
+        """A lazy connection with a fresh cache should not hit the root."""
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=BASIC_RESOURCES_AVAILABLE, content_type="application/json"
+        )
+        xc = Connection('fake', 'fake', lazy=True, discovery_cache=self.cache)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 0)
+        self.assertEqual(
+            xc.services['channel'], ROOT + '/api/v1/channel/')
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 1)
+
+        xc = Connection('fake', 'fake', lazy=True, discovery_cache=self.cache)
+        self.assertEqual(
+            xc.services['channel'], ROOT + '/api/v1/channel/')
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 1)
+
+        # Another user's services aren't shared, nor are expired entries.
+        xc = Connection('other', 'fake', lazy=True, discovery_cache=self.cache)
+        xc.services
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 2)
+        xc = Connection('fake', 'fake', lazy=True, discovery_cache=self.cache,
+                        discovery_ttl=-1)
+        xc.services
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 3)
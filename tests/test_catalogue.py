@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+from unittest import TestCase
+
+import httpretty
+
+from xylem.catalogue import ChannelCatalogue
+from xylem.connection import Connection, ROOT
+from xylem.subjects import (
+    discover_available_resources, discover_installed_apps,
+)
+
+
+RESOURCES = json.dumps({
+    "channel": {
+        "list_endpoint": "/api/v1/channel/",
+        "schema": "/api/v1/channel/schema/",
+    },
+})
+
+
+class ChannelCatalogueTests(TestCase):
+
+    def setUp(self):
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "{0}/api/v1".format(ROOT),
+            body=RESOURCES, content_type="application/json"
+        )
+        self.slugs = [
+            'communities.2.apps.quiz.events.answer',
+            'communities.2.apps.quiz.score',
+            'communities.2.apps.vote.events.cast',
+            'places.1.elec', 'places.1.gas',
+            'places.10.elec', 'places.2.elec',
+        ]
+        httpretty.register_uri(
+            httpretty.GET, ROOT + '/api/v1/channel/', body=self.listing)
+        self.conn = Connection('fake', 'fake')
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def listing(self, request, uri, headers):
+        prefix = request.querystring.get('slug__startswith', [''])[0]
+        objects = [{'slug': slug} for slug in self.slugs
+                   if slug.startswith(prefix)]
+        return (200, headers, json.dumps({
+            'meta': {'next': None, 'total_count': len(objects)},
+            'objects': objects,
+        }))
+
+    def requests(self):
+        return len(httpretty.HTTPretty.latest_requests)
+
+    def test_subject_helpers_answer_from_catalogue(self):
+        catalogue = ChannelCatalogue(self.conn)
+        resources = discover_available_resources(
+            self.conn, 1, catalogue=catalogue)
+        self.assertEqual(sorted(resources), ['elec', 'gas'])
+        self.assertEqual(discover_available_resources(self.conn, 1), resources)
+        before = self.requests()
+
+        apps = discover_installed_apps(self.conn, 2, catalogue=catalogue)
+        self.assertEqual(sorted(apps), ['quiz', 'vote'])
+        self.assertEqual(len(apps['quiz']), 2)
+        self.assertEqual(catalogue.subject_ids(), ['1', '10', '2'])
+        self.assertEqual(catalogue.subject_ids('communities'), ['2'])
+        self.assertEqual(self.requests(), before)
+
+    def test_refresh_prefix(self):
+        catalogue = ChannelCatalogue(self.conn)
+        self.slugs.remove('places.1.gas')
+        self.slugs.append('places.1.water')
+        self.slugs.append('places.3.elec')
+        catalogue.refresh('places.1.')
+        self.assertEqual(
+            httpretty.last_request().querystring['slug__startswith'],
+            ['places.1.'])
+        self.assertEqual(
+            sorted(catalogue.startswith('places.1.')),
+            ['places.1.elec', 'places.1.water'])
+        self.assertFalse('places.1.gas' in catalogue)
+        # Outside the refreshed prefix, the catalogue is unchanged.
+        self.assertFalse('places.3.elec' in catalogue)
+        self.assertEqual(len(catalogue), 7)
+        catalogue.refresh()
+        self.assertEqual(len(catalogue), 8)
+        self.assertEqual(
+            catalogue.get('places.3.elec'), {'slug': 'places.3.elec'})
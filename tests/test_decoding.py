@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from unittest import TestCase, SkipTest
+
+import pytz
+import requests
+
+from xylem.connection import Connection
+from xylem.decoding import IncrementalDecoder, JSONDecoder
+from xylem.testing import FakeRhizome
+
+
+class DecoderTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 3)
+        self.earliest = datetime(2014, 12, 1, 0, 0, 0, 0, pytz.utc)
+        self.latest = self.earliest + timedelta(days=7)
+
+    def connect(self, decoder, **kwargs):
+        conn = Connection(
+            'fake', 'fake', root=self.server.root, decoder=decoder, **kwargs)
+        self.addCleanup(conn.close)
+        return conn
+
+    def read(self, conn):
+        return (
+            conn.read_channel_values(
+                'places.1.elec', self.earliest, self.latest,
+                units='kWh,pence'),
+            conn.read_many_channel_values(
+                ['places.0.elec', 'places.2.elec'], self.earliest,
+                self.latest)[0],
+        )
+
+    def test_custom_loads(self):
+        calls = []
+
+        def loads(content):
+            calls.append(len(content))
+            return json.loads(content)
+
+        conn = self.connect(JSONDecoder(loads))
+        self.assertEqual(self.read(conn), self.read(self.connect(None)))
+        self.assertEqual(len(calls), 2)
+
+    def incremental(self):
+        try:
+            return IncrementalDecoder(buffer_size=1024)
+        except ImportError:
+            raise SkipTest("ijson isn't installed")
+
+    def test_incremental(self):
+        # With a single blocking connection, each streamed response must be
+        # read to its end and released for the next request to be made.
+        conn = self.connect(
+            self.incremental(), pool_maxsize=1, pool_block=True)
+        expected = self.read(self.connect(None))
+        windowed = self.connect(None).read_channel_values(
+            'places.1.elec', self.earliest, self.latest, window_points=100)
+        for _ in range(3):
+            self.assertEqual(self.read(conn), expected)
+            self.assertEqual(
+                list(conn.iter_channel_values(
+                    'places.1.elec', self.earliest, self.latest,
+                    window_points=100)),
+                sorted(windowed.items()))
+
+    def test_values_decoded_as_they_arrive(self):
+        values = [
+            ['2014-12-01T00:00:00+00:00', float(n)] for n in range(20000)]
+        body = json.dumps(OrderedDict([
+            ('meta', {'units': ['kWh']}),
+            ('objects', [OrderedDict([
+                ('slug', 'a.b.c'), ('values', values),
+                ('value_type', 'usage'),
+            ])]),
+        ])).encode('utf-8')
+        response = requests.Response()
+        response.raw = io.BytesIO(body)
+        meta, channel, points = self.incremental().decode_values(response)
+        self.assertEqual(meta, {'units': ['kWh']})
+        self.assertEqual(next(points), values[0])
+        self.assertTrue(response.raw.tell() < len(body) // 10)
+        # Fields after the values are added once they have all been read.
+        self.assertFalse('value_type' in channel)
+        self.assertEqual([values[0]] + list(points), values)
+        self.assertEqual(channel, {'slug': 'a.b.c', 'value_type': 'usage'})
+        self.assertTrue(response.raw.closed)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase, SkipTest
+
+import pytz
+
+from xylem.connection import Connection
+from xylem.export import COMPLETED, export, main, resolve_slugs
+from xylem.testing import FakeRhizome
+
+EARLIEST = datetime(2014, 1, 1, tzinfo=pytz.utc)
+LATEST = datetime(2014, 1, 11, tzinfo=pytz.utc)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 12)
+        self.server.add_channels('places.{0}.gas', 3)
+        self.conn = Connection('fake', 'fake', root=self.server.root)
+        self.addCleanup(self.conn.close)
+        self.out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out)
+
+    def export(self, **kwargs):
+        return export(self.conn, ['places.1*.elec', 'places.2.gas'],
+                      EARLIEST, LATEST, self.out, partition_days=4, **kwargs)
+
+    def test_resolve_slugs(self):
+        self.assertEqual(
+            resolve_slugs(self.conn, ['places.1*.elec', 'places.2.gas']),
+            ['places.1.elec', 'places.10.elec', 'places.11.elec',
+             'places.2.gas'])
+
+    def test_csv_export_resumes(self):
+        summary = self.export(units=['kWh', 'pence'], processes=2)
+        self.assertEqual(summary, {'written': 12, 'skipped': 0, 'failed': {}})
+        with open(os.path.join(
+                self.out, 'places.2.gas', '20140109T000000.csv')) as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], 'timestamp,kWh,pence')
+        self.assertEqual(len(rows), 1 + 2 * 48)
+        self.assertTrue(rows[1].startswith('2014-01-09T00:30:00+00:00,'))
+
+        # Interrupted before the last two partitions were recorded.
+        completed = os.path.join(self.out, COMPLETED)
+        with open(completed) as f:
+            lines = f.readlines()
+        with open(completed, 'w') as f:
+            f.writelines(lines[:-2])
+            f.write(lines[-2][:10])
+        requests = self.server.requests
+        summary = self.export(units=['kWh', 'pence'], processes=0)
+        self.assertEqual(summary, {'written': 2, 'skipped': 10, 'failed': {}})
+        self.assertEqual(self.server.requests - requests, 2)
+
+        with self.assertRaises(ValueError):
+            self.export(units=['kWh'])
+
+    def test_npz_export(self):
+        try:
+            import numpy
+        except ImportError:
+            raise SkipTest("numpy is not installed")
+        self.export(fmt='npz', processes=0)
+        with open(os.path.join(
+                self.out, 'places.1.elec', '20140101T000000.npz'), 'rb') as f:
+            arrays = numpy.load(f)
+            self.assertEqual(sorted(arrays.files), ['kWh', 'timestamp'])
+            self.assertEqual(len(arrays['kWh']), 4 * 48)
+            self.assertEqual(arrays['timestamp'][0], 1388536200)
+
+    def test_main(self):
+        code = main([
+            'places.3.*', '--earliest', EARLIEST.isoformat(),
+            '--latest', LATEST.isoformat(), '--out', self.out,
+            '--processes', '0', '--root', self.server.root,
+            '--access-name', 'fake', '--api-key', 'fake'])
+        self.assertEqual(code, 0)
+        with open(os.path.join(self.out, 'manifest.json')) as f:
+            self.assertEqual(json.load(f)['slugs'], ['places.3.elec'])
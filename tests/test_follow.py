@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from xylem.connection import Connection
+from xylem.follow import BACKOFF
+from xylem.testing import FakeRhizome
+
+
+class FollowTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 5)
+        self.conn = Connection('fake', 'fake', root=self.server.root)
+        self.addCleanup(self.conn.close)
+        self.slugs = sorted(self.server.channels)
+        self.now = datetime.utcnow().replace(microsecond=0, tzinfo=pytz.utc)
+
+    def test_poll_yields_only_new_points(self):
+        since = self.now - timedelta(seconds=60)
+        follower = self.conn.follow(
+            self.slugs, since=since, resolution=10, batch_size=2)
+        requests = self.server.requests
+        points = follower.poll()
+        self.assertEqual(self.server.requests - requests, 3)
+        self.assertEqual(set(slug for slug, _, _ in points), set(self.slugs))
+        for slug in self.slugs:
+            timestamps = [ts for s, ts, _ in points if s == slug]
+            self.assertEqual(timestamps, sorted(set(timestamps)))
+            self.assertTrue(timestamps[0] > since)
+
+        again = follower.poll()
+        for slug, ts, _ in again:
+            self.assertTrue(ts > max(t for s, t, _ in points if s == slug))
+
+    def test_interval_adapts(self):
+        follower = self.conn.follow(
+            self.slugs[:1], since=self.now - timedelta(seconds=600),
+            resolution=60, max_interval=1000)
+        channel = follower.channels[0]
+        follower.poll()
+        self.assertEqual(channel.interval, 60)
+        # Nothing new a moment later: back off.
+        channel.mark = self.now + timedelta(seconds=60)
+        follower.poll()
+        self.assertEqual(channel.interval, 60 * BACKOFF)
+
+    def test_iterate_until_closed(self):
+        follower = self.conn.follow(
+            self.slugs, since=self.now - timedelta(seconds=2), resolution=1,
+            min_interval=0.1)
+        seen = set()
+        for slug, ts, value in follower:
+            self.assertFalse((slug, ts) in seen)
+            seen.add((slug, ts))
+            if ts > self.now:
+                follower.close()
+        self.assertTrue(len(seen) >= len(self.slugs) * 2)
+
+    def test_batches_grouped_by_mark(self):
+        follower = self.conn.follow(
+            self.slugs[:2] + ['places.nope.elec'],
+            since=self.now - timedelta(days=30), max_interval=60,
+            on_error=lambda slug, error: None)
+        follower.poll()
+        reads = []
+        read = follower._read
+
+        def spy(channel_slugs, earliest, latest):
+            reads.append((sorted(channel_slugs), earliest))
+            return read(channel_slugs, earliest, latest)
+
+        follower._read = spy
+        marks = dict((ch.slug, ch.mark) for ch in follower.channels)
+        follower.poll()
+        self.assertEqual(sorted(reads), sorted([
+            (['places.nope.elec'], self.now - timedelta(days=30)),
+            (self.slugs[:2], marks[self.slugs[0]]),
+        ]))
+        self.assertTrue(self.now - marks[self.slugs[0]] < timedelta(hours=1))
+
+    def test_nothing_to_follow(self):
+        self.assertEqual(list(self.conn.follow([])), [])
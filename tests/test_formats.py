@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest import TestCase, SkipTest
+
+import pytz
+
+from xylem.connection import Connection
+from xylem.formats import (
+    CSV, CSVCodec, JSON, MSGPACK, accept_header, codec_for,
+)
+from xylem.testing import FakeRhizome
+
+
+def needs_msgpack():
+    try:
+        import msgpack  # noqa
+    except ImportError:
+        raise SkipTest("msgpack isn't installed")
+
+
+class CodecTests(TestCase):
+
+    def test_accept_header(self):
+        self.assertEqual(accept_header([JSON]), JSON)
+        self.assertEqual(
+            accept_header([MSGPACK, CSV]),
+            'application/x-msgpack, text/csv;q=0.9, application/json;q=0.8')
+        self.assertEqual(codec_for('text/csv; charset=utf-8').content_type,
+                         CSV)
+        self.assertEqual(codec_for('text/html'), None)
+
+    def test_csv_round_trip(self):
+        objects = [
+            {'slug': 'a', 'unit': 'kWh', 'value_type': 'accum',
+             'values': [['t1', [1.5, None]], ['t2', [2, 3]]]},
+            {'slug': 'b', 'values': [['t1', [0.1, 0.2]]]},
+            {'slug': 'c', 'unit': 'm3', 'values': []},
+        ]
+        content = CSVCodec.encode_values(['kWh', 'pence'], objects)
+        decoded = codec_for(CSV).decode(content)
+        self.assertEqual(decoded['meta']['units'], ['kWh', 'pence'])
+        self.assertEqual(
+            [(ch['slug'], ch['values']) for ch in decoded['objects']], [
+                ('a', [['t1', [1.5, None]], ['t2', [2.0, 3.0]]]),
+                ('b', [['t1', [0.1, 0.2]]]),
+                ('c', []),
+            ])
+        self.assertEqual(decoded['objects'][0]['value_type'], 'accum')
+        self.assertFalse('value_type' in decoded['objects'][1])
+        self.assertEqual(decoded['objects'][2]['unit'], 'm3')
+
+    def test_msgpack_round_trip(self):
+        needs_msgpack()
+        codec = codec_for(MSGPACK)
+        document = {'values': [['2014-12-01T00:00:00+00:00', 1.5]],
+                    'overwrite': False}
+        self.assertEqual(codec.decode(codec.encode(document)), document)
+
+
+class NegotiationTests(TestCase):
+
+    def setUp(self):
+        self.earliest = datetime(2014, 12, 1, 0, 0, 0, 0, pytz.utc)
+        self.latest = self.earliest + timedelta(days=1)
+
+    def serve(self, formats):
+        server = FakeRhizome(formats=formats)
+        server.start()
+        self.addCleanup(server.stop)
+        server.add_channel('a.b.c')
+        return server
+
+    def connect(self, server, format=None):
+        conn = Connection('fake', 'fake', root=server.root, format=format)
+        self.addCleanup(conn.close)
+        return conn
+
+    def read(self, conn):
+        return conn.read_channel_values(
+            'a.b.c', self.earliest, self.latest, units='kWh,pence')
+
+    def test_msgpack(self):
+        needs_msgpack()
+        server = self.serve((JSON, MSGPACK))
+        expected = self.read(self.connect(server))
+        conn = self.connect(server, [MSGPACK])
+        self.assertEqual(self.read(conn), expected)
+        self.assertEqual(conn._write_format(), MSGPACK)
+        code, _ = conn.write_channel_values(
+            'a.b.c', [[self.earliest.isoformat(), 1.0]])
+        self.assertEqual(code, 202)
+        self.assertEqual(server.written, {'a.b.c': 1})
+
+    def test_csv_values(self):
+        server = self.serve((JSON, CSV))
+        expected = self.read(self.connect(server))
+        conn = self.connect(server, [CSV])
+        self.assertEqual(self.read(conn), expected)
+        # Other responses, and writes, stay JSON.
+        self.assertEqual(sorted(conn.list_channels()), ['a.b.c'])
+        self.assertEqual(conn._write_format(), JSON)
+
+    def test_csv_windowed_accum(self):
+        server = self.serve((JSON, CSV))
+        latest = self.earliest + timedelta(days=5)
+        expected = self.connect(server).read_channel_values(
+            'a.b.c', self.earliest, latest)
+        conn = self.connect(server, [CSV])
+        windowed = conn.read_channel_values(
+            'a.b.c', self.earliest, latest, window_points=48)
+        self.assertEqual(sorted(windowed), sorted(expected))
+        for ts, point in expected.items():
+            self.assertAlmostEqual(windowed[ts]['kWh'], point['kWh'])
+        streamed = list(conn.iter_channel_values(
+            'a.b.c', self.earliest, latest, window_points=48))
+        self.assertAlmostEqual(
+            streamed[-1][1]['kWh'], expected[latest]['kWh'])
+        try:
+            import numpy  # noqa
+        except ImportError:
+            return
+        series = conn.read_channel_values(
+            'a.b.c', self.earliest, latest, as_timeseries=True)
+        self.assertEqual(series.value_type, 'accum')
+
+    def test_fall_back_to_json(self):
+        needs_msgpack()
+        server = self.serve((JSON,))
+        expected = self.read(self.connect(server))
+        conn = self.connect(server, [MSGPACK])
+        self.assertEqual(self.read(conn), expected)
+        self.assertEqual(conn._write_format(), JSON)
+        # A server refusing a format it answered in is written JSON.
+        conn._answered.add(MSGPACK)
+        code, _ = conn.write_channel_values(
+            'a.b.c', [[self.earliest.isoformat(), 1.0]])
+        self.assertEqual(code, 202)
+        self.assertEqual(conn._write_format(), JSON)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+from unittest import TestCase
+
+from xylem.catalogue import ChannelCatalogue
+from xylem.connection import Connection
+from xylem.httpcache import ResponseCache
+from xylem.testing import FakeRhizome
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 45)
+        self.server.datausers['someone'] = {'access_name': 'someone'}
+        self.cache = ResponseCache()
+        self.conn = Connection(
+            'fake', 'fake', root=self.server.root, response_cache=self.cache)
+        self.addCleanup(self.conn.close)
+
+    def test_fresh_responses_are_reused(self):
+        channels = self.conn.list_channels()
+        requests = self.server.requests
+        self.assertEqual(self.conn.list_channels(), channels)
+        self.assertEqual(self.conn.get_datauser('someone')[0], 200)
+        self.assertEqual(self.conn.get_datauser('someone')[0], 200)
+        self.assertEqual(self.server.requests - requests, 1)
+
+        other = Connection(
+            'fake', 'fake', root=self.server.root, response_cache=self.cache)
+        self.addCleanup(other.close)
+        self.assertEqual(other.list_channels(), channels)
+        self.assertEqual(self.server.requests - requests, 1)
+
+    def test_stale_responses_are_revalidated(self):
+        self.cache.ttls['datauser'] = 0
+        status, content = self.conn.get_datauser('someone')
+        self.assertEqual(self.conn.get_datauser('someone'), (status, content))
+        self.assertEqual(self.cache.revalidated, 1)
+        self.assertEqual(json.loads(content.decode('utf-8')),
+                         {'access_name': 'someone'})
+
+        # Changed behind the connection's back: fetched again.
+        self.server.datausers['someone']['permissions'] = ['view']
+        status, content = self.conn.get_datauser('someone')
+        self.assertEqual(self.cache.revalidated, 1)
+        self.assertTrue('permissions' in json.loads(content.decode('utf-8')))
+
+    def test_writes_invalidate(self):
+        self.assertEqual(len(self.conn.list_channels()), 45)
+        self.conn.create_channel({'slug': 'places.99.gas'})
+        self.assertEqual(len(self.conn.list_channels()), 46)
+
+        self.conn.list_datausers()
+        self.conn.create_datauser('another')
+        self.assertTrue(b'another' in self.conn.list_datausers()[1])
+
+    def test_least_recently_used_dropped(self):
+        self.cache.max_entries = 3
+        for ix in range(5):
+            self.conn.list_channels(slug__startswith='places.{0}'.format(ix))
+        self.assertEqual(len(self.cache), 3)
+        requests = self.server.requests
+        self.conn.list_channels(slug__startswith='places.4')
+        self.conn.list_channels(slug__startswith='places.0')
+        self.assertEqual(self.server.requests - requests, 1)
+
+    def test_catalogue_refresh_bypasses_cache(self):
+        catalogue = ChannelCatalogue(self.conn, page_size=20)
+        self.assertEqual(len(catalogue), 45)
+        # Added behind the connection's back: the cached pages are still
+        # fresh, but a refresh asks the server.
+        self.server.add_channels('places.{0}.gas', 2)
+        self.assertEqual(len(self.conn.list_channels(page_size=20)), 45)
+        catalogue.refresh()
+        self.assertEqual(len(catalogue), 47)
+        self.assertEqual(len(self.conn.list_channels(page_size=20)), 47)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from unittest import TestCase, SkipTest
+
+import pytz
+
+from xylem.timeseries import TimeSeries, from_epoch, to_epoch
+
+HALF_HOUR = 1800
+
+
+class ResampleTests(TestCase):
+
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            raise SkipTest("numpy is not installed")
+        self.np = numpy
+        # Half-hourly usage of 1 kWh from 2014-03-29 to 2014-04-01 UTC,
+        # across the start of British Summer Time on the 30th.
+        self.earliest = to_epoch(datetime(2014, 3, 29, tzinfo=pytz.utc))
+        timestamps = numpy.arange(
+            self.earliest + HALF_HOUR, self.earliest + 3 * 86400 + 1,
+            HALF_HOUR)
+        self.usage = TimeSeries(
+            timestamps, {'kWh': numpy.ones(len(timestamps))}, 'usage')
+
+    def test_usage_utc_days(self):
+        daily = self.usage.resample('day')
+        self.assertEqual(
+            daily.datetimes(),
+            [datetime(2014, 3, day, tzinfo=pytz.utc) for day in [30, 31]] +
+            [datetime(2014, 4, 1, tzinfo=pytz.utc)])
+        self.assertEqual(daily['kWh'].tolist(), [48, 48, 48])
+        self.assertEqual(self.usage.resample(86400)['kWh'].tolist(),
+                         [48, 48, 48])
+
+    def test_usage_local_days(self):
+        london = pytz.timezone('Europe/London')
+        daily = self.usage.resample('day', tz='Europe/London')
+        self.assertEqual(
+            [ts.astimezone(london).strftime('%d %H:%M')
+             for ts in daily.datetimes()],
+            ['30 00:00', '31 00:00', '01 00:00', '02 00:00'])
+        # The 30th is 23 hours long; the last period is the hour of the 1st
+        # of April (local time) that the series reaches.
+        self.assertEqual(daily['kWh'].tolist(), [48, 46, 48, 2])
+        self.assertEqual(daily['kWh'].sum(), len(self.usage))
+
+    def test_weeks_and_months(self):
+        weekly = self.usage.resample('week')
+        # 2014-03-31 is a Monday.
+        self.assertEqual(
+            weekly.datetimes(),
+            [datetime(2014, 3, 31, tzinfo=pytz.utc),
+             datetime(2014, 4, 7, tzinfo=pytz.utc)])
+        self.assertEqual(weekly['kWh'].tolist(), [96, 48])
+        # The last point is usage up to midnight, so in March.
+        monthly = self.usage.resample('month')
+        self.assertEqual(monthly.datetimes(),
+                         [datetime(2014, 4, 1, tzinfo=pytz.utc)])
+        self.assertEqual(monthly['kWh'].tolist(), [144])
+
+    def test_accum(self):
+        accum = self.usage.to_accum(HALF_HOUR)
+        daily = accum.resample('day')
+        self.assertEqual(daily.value_type, 'accum')
+        self.assertEqual(daily.timestamps[0], self.earliest)
+        self.assertEqual(daily['kWh'].tolist(), [0, 48, 96, 144])
+        self.assertTrue(self.np.array_equal(
+            daily.to_usage()['kWh'], self.usage.resample('day')['kWh']))
+
+    def test_gaps_and_means(self):
+        values = self.usage['kWh'].copy()
+        values[:48] = self.np.nan
+        values[48] = 3
+        usage = TimeSeries(self.usage.timestamps, {'kWh': values}, 'usage')
+        self.assertTrue(self.np.isnan(usage.resample('day')['kWh'][0]))
+        self.assertEqual(usage.resample('day')['kWh'][1], 50)
+
+        readings = TimeSeries(
+            self.usage.timestamps, {'C': values}, 'instant')
+        hourly = readings.resample(3600)
+        self.assertEqual(len(hourly), 72)
+        self.assertTrue(self.np.isnan(hourly['C'][0]))
+        self.assertEqual(hourly['C'][24], 2)
+        self.assertEqual(hourly.timestamps[24],
+                         to_epoch(from_epoch(self.earliest + 25 * 3600)))
+
+    def test_unknown_value_type(self):
+        series = TimeSeries(self.usage.timestamps, self.usage.columns)
+        self.assertRaises(ValueError, series.resample, 'day')
+        self.assertRaises(ValueError, self.usage.resample, 7000, 'UTC')
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase, SkipTest
+
+import pytz
+
+from xylem.connection import Connection
+from xylem.testing import FakeRhizome
+from xylem.timeseries import to_epoch
+
+EARLIEST = datetime(2014, 1, 1, tzinfo=pytz.utc)
+
+
+class SeriesStoreTests(TestCase):
+
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            raise SkipTest("numpy is not installed")
+        self.np = numpy
+        from xylem.store import SeriesStore
+
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 3)
+        self.conn = Connection('fake', 'fake', root=self.server.root)
+        self.addCleanup(self.conn.close)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = SeriesStore(self.directory)
+
+    def test_fill_and_read(self):
+        latest = EARLIEST + timedelta(days=10)
+        appended = self.store.fill(
+            self.conn, 'places.1.elec', EARLIEST, latest,
+            units=['kWh', 'pence'])
+        self.assertEqual(appended, 480)
+        self.assertEqual(
+            os.path.getsize(self.store.path('places.1.elec', 'kWh')), 480 * 16)
+        self.assertEqual(self.store.slugs(), ['places.1.elec'])
+        self.assertEqual(self.store.units('places.1.elec'), ['kWh', 'pence'])
+
+        expected = self.conn.read_channel_values(
+            'places.1.elec', EARLIEST, latest, as_timeseries=True,
+            value_type='usage')
+        timestamps, values = self.store.read('places.1.elec', 'kWh')
+        self.assertTrue(self.np.array_equal(timestamps, expected.timestamps))
+        self.assertTrue(self.np.allclose(values, expected.columns['kWh']))
+
+        day = EARLIEST + timedelta(days=2)
+        timestamps, values = self.store.read(
+            'places.1.elec', 'kWh', day, day + timedelta(days=1))
+        self.assertEqual(len(timestamps), 49)
+        self.assertEqual(timestamps[0], to_epoch(day))
+        self.assertFalse(values.flags.writeable)
+
+        series = self.store.read_series(
+            'places.1.elec', ['kWh', 'pence'], day, value_type='usage')
+        self.assertEqual(series.units, ['kWh', 'pence'])
+        self.assertTrue(self.np.allclose(
+            series.columns['pence'], series.columns['kWh'] * 14.5))
+
+    def test_fill_resumes(self):
+        self.store.fill(self.conn, 'places.2.elec', EARLIEST,
+                        EARLIEST + timedelta(days=1))
+        requests = self.server.requests
+        appended = self.store.fill(self.conn, 'places.2.elec', EARLIEST,
+                                   EARLIEST + timedelta(days=2))
+        self.assertEqual(appended, 48)
+        self.assertEqual(self.server.requests - requests, 1)
+        timestamps, _ = self.store.read('places.2.elec', 'kWh')
+        self.assertEqual(len(timestamps), 96)
+        self.assertTrue(self.np.all(self.np.diff(timestamps) == 1800))
+
+    def test_partial_record_ignored(self):
+        self.store.append('places.1.elec', 'kWh', [10, 20], [1.0, 2.0])
+        with open(self.store.path('places.1.elec', 'kWh'), 'ab') as f:
+            f.write(b'\x00' * 5)
+        self.assertEqual(len(self.store.records('places.1.elec', 'kWh')), 2)
+        self.assertEqual(self.store.append(
+            'places.1.elec', 'kWh', [20, 30], [2.0, 3.0]), 1)
+        timestamps, values = self.store.read('places.1.elec', 'kWh')
+        self.assertEqual(list(timestamps), [10, 20, 30])
+        self.assertEqual(list(values), [1.0, 2.0, 3.0])
+        with self.assertRaises(ValueError):
+            self.store.append('places.1.elec', 'kWh', [50, 40], [1.0, 1.0])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import pytz
+
+from xylem.connection import Connection
+from xylem.testing import FakeRhizome
+
+
+class FakeRhizomeTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeRhizome()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.server.add_channels('places.{0}.elec', 45)
+        self.conn = Connection('fake', 'fake', root=self.server.root)
+        self.addCleanup(self.conn.close)
+
+    def test_listing(self):
+        channels = self.conn.list_channels(slug__startswith='places.1')
+        self.assertEqual(len(channels), 11)
+        self.assertEqual(self.conn.list_channels(workers=3),
+                         self.conn.list_channels(page_size=1000))
+        self.assertEqual(len(self.conn.list_channels()), 45)
+
+    def test_values(self):
+        earliest = datetime(2014, 12, 1, 0, 0, 0, 0, pytz.utc)
+        latest = earliest + timedelta(days=1)
+        accum = self.conn.read_channel_values('places.1.elec', earliest, latest)
+        self.assertEqual(len(accum), 49)
+        self.assertEqual(accum[earliest], {'kWh': 0.0})
+        usage = self.conn.read_channel_values(
+            'places.1.elec', earliest, latest, value_type='usage',
+            units='kWh,pence')
+        self.assertEqual(len(usage), 48)
+        self.assertAlmostEqual(
+            sum(point['kWh'] for point in usage.values()),
+            accum[latest]['kWh'])
+        self.assertAlmostEqual(
+            usage[latest]['pence'], usage[latest]['kWh'] * 14.5)
+
+    def test_writes(self):
+        code, _ = self.conn.write_channel_values(
+            'places.1.elec', [['2014-12-01T00:00:00+00:00', 1]])
+        self.assertEqual(code, 202)
+        self.assertEqual(self.server.written, {'places.1.elec': 1})
+        self.assertEqual(
+            self.conn.create_channel({'slug': 'places.1.gas'})[0], 201)
+        self.assertTrue('places.1.gas' in self.server.channels)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest import TestCase, SkipTest
+
+from iso8601.iso8601 import Utc
+
+from xylem.timeseries import TimeSeries, to_epoch
+
+
+VALUES = [
+    ["2014-12-01T00:00:00+00:00", [0, 0]],
+    ["2014-12-01T00:30:00+00:00", [1.5, 15]],
+    ["2014-12-01T01:00:00+00:00", [4.0, None]],
+    ["2014-12-01T01:30:00+00:00", [4.5, 45]],
+]
+
+
+class TimeSeriesTests(TestCase):
+
+    def setUp(self):
+        try:
+            import numpy
+        except ImportError:
+            raise SkipTest("numpy is not installed")
+        self.np = numpy
+        self.series = TimeSeries.from_values(
+            VALUES, ['kWh', 'pence'], 'accum')
+        self.earliest = datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+
+    def test_columns(self):
+        self.assertEqual(self.series.units, ['kWh', 'pence'])
+        self.assertEqual(len(self.series), 4)
+        self.assertEqual(self.series.timestamps.dtype, self.np.int64)
+        self.assertEqual(self.series['kWh'].dtype, self.np.float64)
+        self.assertEqual(self.series.timestamps[0], to_epoch(self.earliest))
+        self.assertTrue(self.np.isnan(self.series['pence'][2]))
+
+    def test_legacy_dict(self):
+        result = self.series.to_dict()
+        self.assertEqual(result[self.earliest], {'kWh': 0, 'pence': 0})
+        self.assertEqual(
+            result[self.earliest + timedelta(hours=1)],
+            {'kWh': 4.0, 'pence': None})
+        self.assertEqual(
+            TimeSeries.from_dict(result, 'accum').to_dict(), result)
+
+    def test_slicing(self):
+        window = self.series[
+            self.earliest + timedelta(minutes=30):
+            self.earliest + timedelta(hours=1)]
+        self.assertEqual(len(window), 2)
+        self.assertEqual(list(window['kWh']), [1.5, 4.0])
+        self.assertTrue(self.np.may_share_memory(
+            window['kWh'], self.series['kWh']))
+        self.assertEqual(len(self.series[1:]), 3)
+        self.assertEqual(
+            self.series[1],
+            (self.earliest + timedelta(minutes=30),
+             {'kWh': 1.5, 'pence': 15.0}))
+
+    def test_usage_and_accum(self):
+        usage = self.series.to_usage()
+        self.assertEqual(usage.value_type, 'usage')
+        self.assertEqual(list(usage['kWh']), [1.5, 2.5, 0.5])
+        self.assertEqual(usage.timestamps[0], self.series.timestamps[1])
+
+        accum = usage.to_accum()
+        self.assertEqual(list(accum.timestamps), list(self.series.timestamps))
+        self.assertEqual(list(accum['kWh']), list(self.series['kWh']))
+
+    def test_to_numpy(self):
+        timestamps, values = self.series.to_numpy()
+        self.assertEqual(values.shape, (4, 2))
+        self.assertEqual(list(values[1]), [1.5, 15.0])
+
+    def test_stitch(self):
+        first = TimeSeries.from_values(VALUES[:3], ['kWh', 'pence'], 'accum')
+        second = TimeSeries.from_values(
+            [[ts, [kwh - 4.0, 0]] for ts, (kwh, _) in VALUES[2:]],
+            ['kWh', 'pence'], 'accum')
+        stitched = TimeSeries.stitch([('accum', first), ('accum', second)])
+        self.assertEqual(list(stitched['kWh']), [0, 1.5, 4.0, 4.5])
+
+    def test_stitch_gap_at_boundary(self):
+        """A unit missing at a window boundary carries its last total on,
+        as stitching dicts does.
+        """
+        from xylem.connection import merge_windows
+
+        first = TimeSeries.from_values(VALUES[:3], ['kWh', 'pence'], 'accum')
+        second = TimeSeries.from_values(
+            [[ts, [kwh - 4.0, None if pence is None else pence - 45]]
+             for ts, (kwh, pence) in VALUES[2:]],
+            ['kWh', 'pence'], 'accum')
+        stitched = TimeSeries.stitch([('accum', first), ('accum', second)])
+        self.assertEqual(list(stitched['kWh']), [0, 1.5, 4.0, 4.5])
+        self.assertEqual(list(stitched['pence'][[0, 1, 3]]), [0, 15, 15])
+        self.assertEqual(stitched.to_dict(), merge_windows([
+            ('accum', first.to_dict()), ('accum', second.to_dict())]))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import iso8601
+import pytz
+from iso8601.iso8601 import Utc
+
+from xylem.timeseries import to_epoch
+from xylem.timestamps import parse_epochs, parse_timestamp, parse_timestamps
+
+
+def half_hourly(n, start=None):
+    start = start or datetime(2014, 12, 1, 0, 0, 0, 0, Utc())
+    return [
+        (start + timedelta(minutes=30 * ix)).isoformat() for ix in range(n)
+    ]
+
+
+class TimestampTests(TestCase):
+
+    def assertParsesLikeIso8601(self, strings, resolution=None):
+        expected = [iso8601.parse_date(s) for s in strings]
+        parsed = parse_timestamps(strings, resolution)
+        self.assertEqual(parsed, expected)
+        self.assertEqual(
+            [ts.utcoffset() for ts in parsed],
+            [ts.utcoffset() for ts in expected])
+        self.assertEqual(
+            parse_epochs(strings, resolution),
+            [to_epoch(ts) for ts in expected])
+
+    def test_fixed_format(self):
+        self.assertParsesLikeIso8601(half_hourly(100))
+        self.assertParsesLikeIso8601([
+            '2014-03-30T00:30:00+00:00',
+            '2014-03-30T02:30:00+01:00',
+            '2014-12-01T00:00:00-05:30',
+        ])
+
+    def test_other_formats(self):
+        self.assertParsesLikeIso8601([
+            '2014-12-01T00:00:00Z',
+            '2014-12-01T00:00:00.500000+00:00',
+            '2014-12-01T00:00:00',
+        ])
+        self.assertEqual(
+            parse_timestamp('2014-12-01T00:00:00Z'),
+            datetime(2014, 12, 1, 0, 0, 0, 0, Utc()))
+
+    def test_regular_series(self):
+        self.assertParsesLikeIso8601(half_hourly(1000), 1800)
+
+    def test_irregular_series(self):
+        strings = half_hourly(1000)
+        del strings[500]
+        strings.append(half_hourly(1, iso8601.parse_date(strings[-1]) +
+                                   timedelta(minutes=30))[0])
+        self.assertParsesLikeIso8601(strings, 1800)
+        self.assertParsesLikeIso8601(half_hourly(1000), 3600)
+
+    def test_offset_changes_within_series(self):
+        # A year in London: +00:00 at both ends, +01:00 through the summer.
+        london = pytz.timezone('Europe/London')
+        start = datetime(2014, 1, 1, 0, 0, 0, 0, pytz.utc)
+        strings = [
+            (start + timedelta(minutes=30 * ix)).astimezone(london).isoformat()
+            for ix in range(365 * 48)]
+        self.assertEqual(strings[0][19:], strings[-1][19:])
+        self.assertParsesLikeIso8601(strings, 1800)
+        summer = parse_timestamps(strings, 1800)[181 * 48]
+        self.assertEqual((summer.hour, summer.utcoffset()),
+                         (1, timedelta(hours=1)))
@@ -0,0 +1,525 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Asyncio client for CarbonCulture's Data API.
+
+AsyncConnection has the same methods as xylem.connection.Connection, as
+coroutines, and this module has coroutine versions of the xylem.subjects
+helpers. Requires Python 3.5+ and aiohttp.
+"""
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+from xylem import __version__, subjects
+from xylem.connection import (
+    API_PREFIX, DEFAULT_BATCH_POINTS, DEFAULT_POOL_MAXSIZE,
+    DEFAULT_RESOLUTION, DEFAULT_TIMEOUT, ROOT, APIError, HttpError,
+    _window_length, batch_slugs, merge_windows, quote, split_range, urljoin,
+    values_to_dict,
+)
+from xylem.parallel import DEFAULT_WORKERS
+from xylem.timeseries import TimeSeries
+from xylem.timestamps import parse_timestamps
+
+# Maximum number of connections open at once, to any host.
+DEFAULT_POOL_LIMIT = 100
+
+log = logging.getLogger(__name__)
+
+
+class Response(object):
+    """Status, headers and body of a response, once read."""
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+async def gather_bounded(fn, items, workers=None):
+    """Await fn(item) for each of items, at most `workers` at a time.
+
+    :param coroutine function fn: function of one argument.
+    :param iterable items: arguments to call fn with.
+    :param int workers: Default DEFAULT_WORKERS, maximum concurrent calls.
+    :rtype list: results, in the order of items.
+
+    """
+    semaphore = asyncio.Semaphore(workers or DEFAULT_WORKERS)
+
+    async def bounded(item):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*[bounded(item) for item in items])
+
+
+class AsyncConnection(object):
+    """Asyncio version of xylem.connection.Connection.
+
+    Services are discovered on first use, or on entering `async with`. All
+    requests share one aiohttp session, so create the connection in the
+    event loop that will use it and close() it when done.
+
+    """
+
+    def __init__(self, access_name, api_key, root=None, format=None,
+                 pool_limit=None, pool_maxsize=None,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        :param str access_name: API user name.
+        :param str api_key: API key for access_name.
+        :param str root: Default ROOT, the base URL of the API server.
+        :param str format: Default 'application/json', sent as Accept.
+        :param int pool_limit: Default DEFAULT_POOL_LIMIT, maximum number of
+            connections open at once.
+        :param int pool_maxsize: Default DEFAULT_POOL_MAXSIZE, maximum number
+            of connections open at once to any one host.
+        :param int timeout: Default DEFAULT_TIMEOUT, seconds allowed for each
+            request.
+
+        """
+        self.access_name = access_name
+        self.api_key = api_key
+        self.root = root or ROOT
+        self.endpoint = '/'.join([self.root, API_PREFIX])
+        self.format = format or 'application/json'
+
+        self.headers = {
+            'Authorization': 'ApiKey {0}:{1}'.format(
+                self.access_name, self.api_key),
+            'User-Agent': 'Xylem Version {0}'.format(__version__),
+            'Accept': self.format,
+        }
+        self.pool_limit = pool_limit or DEFAULT_POOL_LIMIT
+        self.pool_maxsize = pool_maxsize or DEFAULT_POOL_MAXSIZE
+        self.timeout = timeout
+        self.services = None
+        self._session = None
+        self._discovery = None
+
+    async def __aenter__(self):
+        await self.discover()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_limit,
+                    limit_per_host=self.pool_maxsize,
+                ),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """Close any pooled connections held open to the server."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, endpoint=None, method=None, params=None,
+                       data=None, extra_headers=None):
+        """Generic request, default to GET.
+
+        :rtype Response:
+
+        """
+        method = method or 'get'
+        log.debug(
+            '{0}: {1}'.format(method, endpoint or self.endpoint),
+            extra={
+                'params': params,
+                'data': data,
+            }
+        )
+        async with self.session.request(
+                method.upper(),
+                endpoint or self.endpoint,
+                params=_encode_params(params),
+                data=data,
+                headers=extra_headers) as r:
+            content = await r.read()
+            return Response(r.status, content, r.headers)
+
+    async def get(self, endpoint=None, params=None):
+        """Make a get."""
+        return await self._request(endpoint, params=params)
+
+    async def patch(self, endpoint=None, params=None, data=None):
+        """Partial update to resource (e.g. put history or change meta)."""
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        return await self._request(
+            endpoint, params=params, data=data, method='patch',
+            extra_headers={
+                'Content-Type': 'application/json',
+            }
+        )
+
+    async def post(self, endpoint=None, params=None, data=None):
+        """Create resource."""
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        return await self._request(
+            endpoint, params=params, data=data, method='post',
+            extra_headers={
+                'Content-Type': 'application/json',
+            }
+        )
+
+    async def discover(self):
+        """Ping the endpoint and get the list of accessible services.
+
+        Concurrent callers share a single request.
+
+        :rtype dict: map of service name to list endpoint
+        :raises: HttpError if the endpoint doesn't give a 200
+
+        """
+        if self.services is None:
+            if self._discovery is None:
+                self._discovery = asyncio.ensure_future(self._discover())
+            try:
+                self.services = await self._discovery
+            finally:
+                self._discovery = None
+        return self.services
+
+    async def _discover(self):
+        r = await self.get()
+        if r.status_code != 200:
+            raise HttpError(
+                "Got response code {0} from {1}".format(
+                    r.status_code, self.endpoint))
+        return dict(
+            (key, self.root + meta['list_endpoint'])
+            for key, meta in r.json().items()
+        )
+
+    async def service(self, name):
+        """List endpoint of a service, discovering services if need be."""
+        return (await self.discover())[name]
+
+    async def list_channels(self, **kwargs):
+        """Get a list of channels, maybe filtered with kwargs"""
+        r = await self.get(await self.service('channel'), params=kwargs)
+        if r.status_code == 200:
+            content = r.json()
+
+            channels = dict([(ch['slug'], ch) for ch in content['objects']])
+            while content['meta']['next'] is not None:
+                r = await self.get(self.root + content['meta']['next'])
+                content = r.json()
+                channels.update(dict(
+                    [(ch['slug'], ch) for ch in content['objects']]))
+            return channels
+        else:
+            raise HttpError(
+                "Got response code {0} from {1}".format(
+                    r.status_code, self.endpoint))
+
+    async def write_channel_values(self, channel_slug, values,
+                                   overwrite=False):
+        """See Connection.write_channel_values."""
+        _r = await self.patch(
+            await self.service('channel') + channel_slug,
+            data={
+                'values': values,
+                'overwrite': overwrite,
+            },
+        )
+
+        return (_r.status_code, _r.content)
+
+    async def read_channel_values(self, channel_slug, earliest, latest,
+                                  window_points=None, workers=None,
+                                  as_timeseries=False, **kwargs):
+        """See Connection.read_channel_values; windows are read concurrently
+        on the event loop.
+        """
+        if as_timeseries:
+            parse, merge = self._series, TimeSeries.stitch
+        else:
+            parse, merge = self._dict, merge_windows
+
+        async def read(window):
+            value_type, units, values = await self._get_channel_values(
+                channel_slug, window[0], window[1], **kwargs)
+            return value_type, parse(value_type, units, values, kwargs)
+
+        if window_points:
+            windows = split_range(
+                earliest, latest, _window_length(window_points, kwargs))
+            return merge(await gather_bounded(read, windows, workers))
+
+        value_type, results = await read((earliest, latest))
+        return results
+
+    @staticmethod
+    def _dict(value_type, units, values, params):
+        return values_to_dict(
+            values, units, params.get('resolution', DEFAULT_RESOLUTION))
+
+    @staticmethod
+    def _series(value_type, units, values, params):
+        return TimeSeries.from_values(
+            values, units, value_type,
+            params.get('resolution', DEFAULT_RESOLUTION))
+
+    async def _get_channel_values(self, channel_slug, earliest, latest,
+                                  **kwargs):
+        """See Connection._get_channel_values."""
+        params = {
+            'slug': channel_slug,
+            'values__earliest': earliest.isoformat(),
+            'values__latest': latest.isoformat(),
+        }
+        params.update(kwargs)  # e.g. resolution, units...
+
+        _r = await self.get(await self.service('channel'), params=params)
+        if _r.status_code == 200:
+            _json = _r.json()
+            ch = _json['objects'][0]
+            units = _json['meta'].get('units', [ch['unit']])
+            value_type = params.get('value_type', ch.get('value_type'))
+            return value_type, units, ch['values']
+        raise APIError(
+            "API Error: ({}) {}".format(_r.status_code, _r.content))
+
+    async def read_many_channel_values(self, channel_slugs, earliest, latest,
+                                       batch_size=None, workers=None,
+                                       **kwargs):
+        """See Connection.read_many_channel_values."""
+        resolution = int(kwargs.get('resolution', DEFAULT_RESOLUTION))
+        points = int(
+            (latest - earliest).total_seconds() // resolution) + 1
+        max_count = max(1, DEFAULT_BATCH_POINTS // points)
+        if batch_size:
+            max_count = min(max_count, batch_size)
+
+        results = {}
+        errors = {}
+        for batch_results, batch_errors in await gather_bounded(
+                lambda batch: self._read_channel_batch(
+                    batch, earliest, latest, **kwargs),
+                batch_slugs(channel_slugs, max_count),
+                workers):
+            results.update(batch_results)
+            errors.update(batch_errors)
+        return results, errors
+
+    async def _read_channel_batch(self, channel_slugs, earliest, latest,
+                                  **kwargs):
+        """See Connection._read_channel_batch."""
+        params = {
+            'slug__in': ','.join(channel_slugs),
+            'values__earliest': earliest.isoformat(),
+            'values__latest': latest.isoformat(),
+            'limit': len(channel_slugs),
+        }
+        params.update(kwargs)  # e.g. resolution, units...
+        resolution = kwargs.get('resolution', DEFAULT_RESOLUTION)
+
+        results = {}
+        errors = {}
+        try:
+            _r = await self.get(await self.service('channel'), params=params)
+            while True:
+                if _r.status_code != 200:
+                    raise APIError("API Error: ({}) {}".format(
+                        _r.status_code, _r.content))
+                content = _r.json()
+                units = content['meta'].get('units')
+                for ch in content['objects']:
+                    values = ch['values']
+                    if isinstance(values, dict) and 'error' in values:
+                        errors[ch['slug']] = APIError(
+                            "API Error: {0}".format(values['error']))
+                        continue
+                    results[ch['slug']] = values_to_dict(
+                        values, units or [ch['unit']], resolution)
+                if not content['meta'].get('next'):
+                    break
+                _r = await self.get(self.root + content['meta']['next'])
+        except (HttpError, APIError, aiohttp.ClientError,
+                asyncio.TimeoutError) as e:
+            if not isinstance(e, APIError):
+                e = APIError("API Error: {0}".format(e))
+            return {}, dict((slug, e) for slug in channel_slugs)
+
+        for slug in channel_slugs:
+            if slug not in results and slug not in errors:
+                errors[slug] = APIError(
+                    "API Error: (403) You don't have access to channel: "
+                    "{0}".format(slug))
+        return results, errors
+
+    async def create_channel(self, channel_data):
+        """See Connection.create_channel."""
+        _r = await self.post(
+            await self.service('channel'),
+            data=channel_data,
+        )
+
+        return (_r.status_code, _r.content)
+
+    async def create_channels(self, channel_data_list, workers=None):
+        """Create several channels, up to `workers` at a time.
+
+        :rtype list: (status code, message) for each channel, in order.
+
+        """
+        return await gather_bounded(
+            self.create_channel, channel_data_list, workers)
+
+    async def read_channel_latest_n_values(self, channel_slug, n=1):
+        """See Connection.read_channel_latest_n_values."""
+        _r = await self.get(
+            await self.service('channel'),
+            params={
+                'slug': channel_slug,
+                'values__latest_n': n,
+            }
+        )
+        response = _r.json()
+        ch = response['objects'][0]
+        values = ch['values']
+        if isinstance(values, dict) and 'error' in values:
+            raise ValueError(values['error'])
+        timestamps = parse_timestamps([t for t, v in values])
+        return [(ts, v) for ts, (t, v) in zip(timestamps, values)]
+
+    async def assign_permissions_for_user(self, user, permissions):
+        """See Connection.assign_permissions_for_user."""
+        _r = await self.patch(
+            urljoin(await self.service('datauser'), quote(user)),
+            data={
+                'permissions': permissions
+            },
+        )
+
+        return (_r.status_code, _r.content)
+
+    async def assign_permissions_for_user_on_channel(
+            self, user, channel_slug, permissions):
+        """See Connection.assign_permissions_for_user_on_channel."""
+        _r = await self.patch(
+            await self.service('channel') + channel_slug,
+            data={
+                'user': user,
+                'permissions': permissions
+            },
+        )
+
+        return (_r.status_code, _r.content)
+
+    async def list_datausers(self):
+        """See Connection.list_datausers."""
+        _r = await self.get(await self.service('datauser'))
+        return (_r.status_code, _r.content)
+
+    async def get_datauser(self, access_name):
+        """See Connection.get_datauser."""
+        _r = await self.get(
+            urljoin(await self.service('datauser'), quote(access_name))
+        )
+        return (_r.status_code, _r.content)
+
+    async def create_datauser(self, access_name):
+        """See Connection.create_datauser."""
+        _r = await self.post(
+            await self.service('datauser'),
+            data={"access_name": access_name},
+        )
+
+        return (_r.status_code, _r.content)
+
+    async def create_datausers(self, access_names, workers=None):
+        """Create several datausers, up to `workers` at a time.
+
+        :rtype list: (status code, message) for each datauser, in order.
+
+        """
+        return await gather_bounded(
+            self.create_datauser, access_names, workers)
+
+
+async def discover_available_resources(conn, subject_id,
+                                       subject_type_plural='places'):
+    """See xylem.subjects.discover_available_resources."""
+    channel_root = ".".join([subject_type_plural, str(subject_id)]) + '.'
+    channels = await conn.list_channels(slug__startswith=channel_root)
+    return subjects._resources(channel_root, channels)
+
+
+async def write_app_event(conn, app_slug, event_slug, event_data, subject_id,
+                          subject_type_plural='communities'):
+    """See xylem.subjects.write_app_event."""
+    channel_slug, values = subjects._app_event(
+        app_slug, event_slug, event_data, subject_id, subject_type_plural)
+    code, message = await conn.write_channel_values(channel_slug, values)
+    if code != 202:
+        raise subjects.APIError(
+            "API Error (Code: {0}): {1}".format(code, message))
+
+
+async def discover_installed_apps(conn, subject_id,
+                                  subject_type_plural='communities'):
+    """See xylem.subjects.discover_installed_apps."""
+    channel_root = ".".join([
+        subject_type_plural, str(subject_id), 'apps'
+    ]) + '.'
+    try:
+        channels = await conn.list_channels(slug__startswith=channel_root)
+        return subjects._apps(channel_root, channels)
+    except HttpError as e:
+        raise subjects.APIError("API Error: {0}".format(e))
+
+
+async def minimum_data_presence_for_range(conn, earliest, latest, slug=None,
+                                          subject_id=None,
+                                          subject_type_plural=None,
+                                          utilities=None):
+    """See xylem.subjects.minimum_data_presence_for_range."""
+    slugs = subjects._presence_slugs(
+        slug, subject_id, subject_type_plural, utilities)
+    try:
+        resp = await conn.get(
+            endpoint=await conn.service('channel'),
+            params=subjects._presence_params(earliest, latest, slugs)
+        )
+    except HttpError as e:
+        raise subjects.APIError("API Error: {}".format(e))
+
+    if resp.status_code != 200:
+        raise subjects.APIError(
+            "API Error: ({}) {}".format(resp.status_code, resp.content))
+
+    return subjects._minimum_presence(resp.json(), slugs)
+
+
+def _encode_params(params):
+    """Query parameters as requests would send them: lists are repeated,
+    None is dropped and everything else is a string.
+    """
+    if not params:
+        return None
+    encoded = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            encoded.append((key, str(item)))
+    return encoded
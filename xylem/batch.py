@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Background writer that merges many small channel writes into few."""
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from xylem.connection import APIError
+from xylem.parallel import map_bounded
+
+# A batch is sent once it holds this many points, or once its oldest point
+# has waited this long.
+DEFAULT_MAX_POINTS = 500
+DEFAULT_MAX_DELAY = 5 # seconds
+
+# Writes waiting to be batched; write() blocks while this many are queued.
+DEFAULT_QUEUE_SIZE = 10000
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5 # seconds, doubled for each retry
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Flush(object):
+    """Queued by flush(), set once everything queued before it is sent."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BatchWriter(object):
+    """Queue (slug, timestamp, value) writes from any number of threads and
+    send them in the background, one PATCH per channel and overwrite flag.
+
+    Failed batches are retried for server errors and connection problems;
+    batches that still fail are passed to on_error, or logged.
+
+    """
+
+    def __init__(self, conn, max_points=DEFAULT_MAX_POINTS,
+                 max_delay=DEFAULT_MAX_DELAY, queue_size=DEFAULT_QUEUE_SIZE,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 workers=None, on_error=None):
+        """
+        :param xylem.Connection conn: The connection configured to the API
+        :param int max_points: Default DEFAULT_MAX_POINTS, points queued
+            before all batches are sent.
+        :param float max_delay: Default DEFAULT_MAX_DELAY, seconds a point may
+            wait before all batches are sent.
+        :param int queue_size: Default DEFAULT_QUEUE_SIZE, writes queued
+            before write() blocks.
+        :param int retries: Default DEFAULT_RETRIES, times a failed batch is
+            sent again.
+        :param float backoff: Default DEFAULT_BACKOFF, seconds before the
+            first retry; doubled, with jitter, for each one after.
+        :param int workers: Default DEFAULT_WORKERS, batches sent at once.
+        :param callable on_error: Default None, called with (channel_slug,
+            values, overwrite, error) for each batch that can't be written.
+
+        """
+        self.conn = conn
+        self.max_points = max_points
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.workers = workers
+        self.on_error = on_error
+        self._queue = queue.Queue(queue_size)
+        self._closed = False
+        # Writes and flushes being queued, which close() waits for.
+        self._queueing = 0
+        self._idle = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, channel_slug, timestamp, value, overwrite=False,
+              timeout=None):
+        """Queue a value to be written to a channel.
+
+        :param str channel_slug: Slug of channel to which data will be written
+        :param timestamp: datetime or ISO 8601 string of the value.
+        :param value: the value, as for Connection.write_channel_values
+        :param bool overwrite: Default False, set True to blat old values.
+        :param float timeout: Default None, seconds to wait while the queue
+            is full; waits as long as it takes if None.
+        :raises: ValueError if closed, or queue.Full if timeout passes with
+            the queue still full.
+
+        """
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        self._enqueue(
+            (channel_slug, overwrite, timestamp, value), timeout=timeout)
+
+    def flush(self):
+        """Send everything written so far, returning once it has been sent
+        (or has failed).
+
+        :raises: ValueError if closed.
+
+        """
+        flush = _Flush()
+        self._enqueue(flush)
+        flush.done.wait()
+
+    def close(self):
+        """Flush, then stop the background thread.
+
+        Writes and flushes being queued by other threads are sent first.
+
+        """
+        with self._idle:
+            if self._closed:
+                return
+            self._closed = True
+            while self._queueing:
+                self._idle.wait()
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _enqueue(self, item, timeout=None):
+        """Queue item for the background thread, unless closed."""
+        with self._idle:
+            if self._closed:
+                raise ValueError("BatchWriter is closed")
+            self._queueing += 1
+        try:
+            self._queue.put(item, timeout=timeout)
+        finally:
+            with self._idle:
+                self._queueing -= 1
+                if not self._queueing:
+                    self._idle.notify_all()
+
+    def _run(self):
+        pending = OrderedDict()
+        points = 0
+        due = None
+        while True:
+            try:
+                if due is None:
+                    item = self._queue.get()
+                else:
+                    item = self._queue.get(
+                        timeout=max(0, due - time.time()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                channel_slug, overwrite, timestamp, value = item
+                pending.setdefault((channel_slug, overwrite), []).append(
+                    (timestamp, value))
+                points += 1
+                if due is None:
+                    due = time.time() + self.max_delay
+                if points < self.max_points:
+                    continue
+
+            try:
+                self._send(pending)
+            except Exception:
+                # Keep the thread alive, or flush() and write() would block.
+                log.exception('Failed to send batches')
+            pending = OrderedDict()
+            points = 0
+            due = None
+            if item is _STOP:
+                return
+            if isinstance(item, _Flush):
+                item.done.set()
+
+    def _send(self, pending):
+        if pending:
+            map_bounded(self._send_batch, pending.items(), self.workers)
+
+    def _send_batch(self, batch):
+        (channel_slug, overwrite), values = batch
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0.5, 1) * self.backoff *
+                           2 ** (attempt - 1))
+            try:
+                code, message = self.conn.write_channel_values(
+                    channel_slug, values, overwrite=overwrite)
+            except IOError as e:
+                error = APIError("API Error: {0}".format(e))
+                continue
+            except Exception as e:
+                error = e
+                break
+            if code < 300:
+                return
+            error = APIError("API Error (Code: {0}): {1}".format(
+                code, message))
+            if code < 500 and code != 429:
+                break
+        if self.on_error is not None:
+            try:
+                self.on_error(channel_slug, values, overwrite, error)
+            except Exception:
+                log.exception('on_error failed for {0}'.format(channel_slug))
+        else:
+            log.error('Failed to write {0} values to {1}: {2}'.format(
+                len(values), channel_slug, error))
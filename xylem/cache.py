@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Persistent local cache of channel history, filled incrementally."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+from xylem.parallel import map_bounded
+from xylem.timeseries import from_epoch, to_epoch
+
+# Values this recent are always read again, since late data may still arrive.
+DEFAULT_RECENT = timedelta(days=2)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Approximate storage cost of a point, on top of its encoded values.
+POINT_OVERHEAD = 24 # bytes
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL,
+    units TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    value_type TEXT NOT NULL,
+    kind TEXT,
+    unit_names TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL,
+    UNIQUE (slug, units, resolution, value_type)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    series INTEGER NOT NULL,
+    earliest INTEGER NOT NULL,
+    latest INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_series ON coverage (series);
+CREATE TABLE IF NOT EXISTS points (
+    series INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (series, ts)
+);
+"""
+
+
+class HistoryCache(object):
+    """Channel values kept in a local SQLite file, so ranges already read
+    are served without asking the server again.
+
+    Series are keyed by slug, units, resolution and value type. Values of
+    'accum' and 'usage' series are both kept as usage per period, so either
+    can be served from the same points (accumulated values are summed again
+    from usage, so may differ from the server's by rounding); other value
+    types are kept as read.
+
+    """
+
+    def __init__(self, path, recent=DEFAULT_RECENT,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param str path: file in which to keep the cache, or ':memory:'.
+        :param timedelta recent: Default DEFAULT_RECENT, values later than
+            this long ago are read from the server every time.
+        :param int max_bytes: Default DEFAULT_MAX_BYTES, approximate size
+            above which the least recently read series are evicted.
+
+        """
+        self.path = path
+        self.recent = recent
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def read(self, conn, channel_slug, earliest, latest, window_points=None,
+             workers=None, **kwargs):
+        """Read values as Connection.read_channel_values would.
+
+        Only the parts of the range not already held, and the recent part
+        of it, are read from the server.
+
+        :param xylem.Connection conn: The connection configured to the API
+        :param str channel_slug: Slug of channel to read
+        :param datetime earliest: from when to get readings
+        :param datetime latest: up to when to get readings
+        :param int window_points: Default None, otherwise split each missing
+            range into windows of at most this many points.
+        :param int workers: maximum number of windows fetched at once.
+        :param kwargs: extra params, e.g. units, resolution, value_type
+        :rtype dict: {timestamp: {unit: value}}
+
+        """
+        from xylem.connection import (
+            DEFAULT_RESOLUTION, _window_length, split_range)
+
+        value_type = kwargs.get('value_type')
+        resolution = int(kwargs.get('resolution', DEFAULT_RESOLUTION))
+        series = self._series(channel_slug, kwargs.get('units'), resolution,
+                              value_type)
+        start, end = to_epoch(earliest), to_epoch(latest)
+
+        gaps = self._gaps(series['id'], start, end)
+        refresh_from = to_epoch(
+            from_epoch(time.time()) - self.recent) // resolution * resolution
+        if end > refresh_from:
+            gaps = _union(gaps + [(max(start, refresh_from), end)])
+
+        fetch = dict(kwargs)
+        if value_type in ('accum', 'usage'):
+            fetch['value_type'] = 'usage'
+        windows = []
+        for gap_start, gap_end in gaps:
+            gap = (from_epoch(gap_start), from_epoch(gap_end))
+            if window_points:
+                windows.extend(split_range(
+                    gap[0], gap[1], _window_length(window_points, kwargs)))
+            else:
+                windows.append(gap)
+        parts = map_bounded(
+            lambda window: conn._get_channel_values(
+                channel_slug, window[0], window[1], **fetch),
+            windows,
+            workers,
+        )
+        for window, part in zip(windows, parts):
+            self._store(series, to_epoch(window[0]), to_epoch(window[1]),
+                        *part)
+        self._evict()
+        return self._load(series, start, end, value_type)
+
+    def invalidate(self, channel_slug=None, earliest=None, latest=None):
+        """Forget cached values, so they are read from the server again.
+
+        :param str channel_slug: Default None, forget values of all channels.
+        :param datetime earliest: Default None, from the earliest value held.
+        :param datetime latest: Default None, up to the latest value held.
+
+        """
+        with self._lock:
+            if channel_slug is None:
+                ids = [row[0] for row in self._db.execute(
+                    "SELECT id FROM series")]
+            else:
+                ids = [row[0] for row in self._db.execute(
+                    "SELECT id FROM series WHERE slug = ?", (channel_slug,))]
+            if earliest is None and latest is None:
+                self._delete_series(ids)
+            else:
+                start = to_epoch(earliest) if earliest else None
+                end = to_epoch(latest) if latest else None
+                for series_id in ids:
+                    self._uncover(series_id, start, end)
+            self._db.commit()
+
+    def size(self):
+        """Approximate bytes held, as used for eviction."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM series").fetchone()[0]
+
+    def _series(self, channel_slug, units, resolution, value_type):
+        """Get (or make) the series row for a key, marking it used."""
+        if isinstance(units, (list, tuple)):
+            units = ','.join(units)
+        key = (
+            channel_slug,
+            units or '',
+            resolution,
+            'usage' if value_type in ('accum', 'usage') else value_type or '',
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO series "
+                "(slug, units, resolution, value_type, kind, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                key + ('usage' if key[3] == 'usage' else None, time.time()))
+            self._db.execute(
+                "UPDATE series SET last_used = ? WHERE slug = ? AND "
+                "units = ? AND resolution = ? AND value_type = ?",
+                (time.time(),) + key)
+            row = self._db.execute(
+                "SELECT id, kind, unit_names FROM series WHERE slug = ? AND "
+                "units = ? AND resolution = ? AND value_type = ?",
+                key).fetchone()
+            self._db.commit()
+        return {
+            'id': row[0],
+            'kind': row[1],
+            'unit_names': json.loads(row[2]) if row[2] else None,
+        }
+
+    def _gaps(self, series_id, start, end):
+        """Parts of start to end not covered by values already held."""
+        with self._lock:
+            covered = self._db.execute(
+                "SELECT earliest, latest FROM coverage WHERE series = ? "
+                "AND latest >= ? AND earliest <= ? ORDER BY earliest",
+                (series_id, start, end)).fetchall()
+        gaps = []
+        for cover_start, cover_end in covered:
+            if cover_start > start:
+                gaps.append((start, cover_start))
+            start = max(start, cover_end)
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def _store(self, series, start, end, value_type, unit_names, values):
+        """Replace the values held from start to end with those read."""
+        from xylem.timestamps import parse_epochs
+
+        if series['kind'] is None:
+            series['kind'] = 'usage' if value_type == 'accum' else 'raw'
+        series['unit_names'] = unit_names
+        rows = [
+            (ts, x[1] if len(unit_names) > 1 else [x[1]])
+            for ts, x in zip(parse_epochs([x[0] for x in values]), values)
+        ]
+        if series['kind'] == 'usage' and value_type == 'accum':
+            rows = [
+                (ts, [_sub(a, b) for a, b in zip(point, prev)])
+                for (ts, point), (_, prev) in zip(rows[1:], rows)
+            ]
+        rows = [(series['id'], ts, json.dumps(point)) for ts, point in rows]
+        size = sum(len(row[2]) + POINT_OVERHEAD for row in rows)
+
+        # Usage at start is for the period before it, so isn't replaced.
+        first = start + 1 if series['kind'] == 'usage' else start
+        with self._lock:
+            removed = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0), COUNT(*) "
+                "FROM points WHERE series = ? AND ts >= ? AND ts <= ?",
+                (series['id'], first, end)).fetchone()
+            self._db.execute(
+                "DELETE FROM points WHERE series = ? AND ts >= ? AND ts <= ?",
+                (series['id'], first, end))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO points (series, ts, value) "
+                "VALUES (?, ?, ?)", rows)
+            self._db.execute(
+                "UPDATE series SET kind = ?, unit_names = ?, "
+                "bytes = bytes + ? WHERE id = ?",
+                (series['kind'], json.dumps(unit_names),
+                 size - removed[0] - removed[1] * POINT_OVERHEAD,
+                 series['id']))
+            self._cover(series['id'], start, end)
+            self._db.commit()
+
+    def _load(self, series, start, end, value_type):
+        """Values held from start to end, as read_channel_values gives them.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT ts, value FROM points WHERE series = ? "
+                "AND ts >= ? AND ts <= ? ORDER BY ts",
+                (series['id'], start, end)).fetchall()
+        units = series['unit_names'] or []
+        points = [(ts, json.loads(value)) for ts, value in rows]
+        if series['kind'] == 'usage':
+            points = [(ts, point) for ts, point in points if ts > start]
+            if value_type != 'usage':
+                points = _accumulate(start, points, len(units))
+        return dict(
+            (from_epoch(ts), dict(zip(units, point))) for ts, point in points
+        )
+
+    def _cover(self, series_id, start, end):
+        """Mark start to end as held, merging with overlapping coverage."""
+        overlapping = self._db.execute(
+            "SELECT earliest, latest FROM coverage WHERE series = ? "
+            "AND latest >= ? AND earliest <= ?",
+            (series_id, start, end)).fetchall()
+        for cover_start, cover_end in overlapping:
+            start, end = min(start, cover_start), max(end, cover_end)
+        self._db.execute(
+            "DELETE FROM coverage WHERE series = ? AND latest >= ? "
+            "AND earliest <= ?", (series_id, start, end))
+        self._db.execute(
+            "INSERT INTO coverage (series, earliest, latest) VALUES (?, ?, ?)",
+            (series_id, start, end))
+
+    def _uncover(self, series_id, start, end):
+        """Mark start to end (None for unbounded) as no longer held."""
+        covered = self._db.execute(
+            "SELECT earliest, latest FROM coverage WHERE series = ?",
+            (series_id,)).fetchall()
+        self._db.execute(
+            "DELETE FROM coverage WHERE series = ?", (series_id,))
+        for cover_start, cover_end in covered:
+            remaining = []
+            if start is not None and cover_start < start:
+                remaining.append((cover_start, min(cover_end, start)))
+            if end is not None and cover_end > end:
+                remaining.append((max(cover_start, end), cover_end))
+            if start is None and end is None:
+                remaining = []
+            for interval in remaining:
+                self._db.execute(
+                    "INSERT INTO coverage (series, earliest, latest) "
+                    "VALUES (?, ?, ?)", (series_id,) + interval)
+
+    def _delete_series(self, ids):
+        for series_id in ids:
+            self._db.execute("DELETE FROM points WHERE series = ?",
+                             (series_id,))
+            self._db.execute("DELETE FROM coverage WHERE series = ?",
+                             (series_id,))
+            self._db.execute("DELETE FROM series WHERE id = ?", (series_id,))
+
+    def _evict(self):
+        """Drop the least recently read series until under max_bytes."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, bytes FROM series ORDER BY last_used").fetchall()
+            total = sum(size for _, size in rows)
+            evicted = []
+            for series_id, size in rows[:-1]:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(series_id)
+                total -= size
+            if evicted:
+                log.debug('Evicting {0} series from history cache'.format(
+                    len(evicted)))
+                self._delete_series(evicted)
+                self._db.commit()
+
+
+def _union(intervals):
+    """Merge overlapping (start, end) intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _sub(a, b):
+    if a is None or b is None:
+        return None
+    return a - b
+
+
+def _accumulate(start, points, width):
+    """Accumulated values from usage points, with an origin of 0 at start.
+    """
+    totals = [0] * width
+    accumulated = [(start, list(totals))]
+    for ts, point in points:
+        values = []
+        for ix, value in enumerate(point):
+            if value is None:
+                values.append(None)
+            else:
+                totals[ix] += value
+                values.append(totals[ix])
+        accumulated.append((ts, values))
+    return accumulated
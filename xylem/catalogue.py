@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""In-memory index of channels by their dotted slugs."""
+import threading
+import time
+from bisect import bisect_left
+
+
+class ChannelCatalogue(object):
+    """Channels listed once and kept sorted by slug, so everything under a
+    slug prefix (a subject, its utilities or its apps) is found by bisection
+    instead of a listing request.
+
+    Refresh the whole catalogue, or only a prefix of it, when channels may
+    have been added or removed.
+
+    """
+
+    def __init__(self, conn, page_size=None, workers=None, lazy=False):
+        """
+        :param xylem.Connection conn: The connection configured to the API
+        :param int page_size: Default None, channels listed per page.
+        :param int workers: Default None, pages listed at once, as for
+            Connection.list_channels.
+        :param bool lazy: Default False, set True to leave the catalogue
+            empty until refresh() is called.
+
+        """
+        self.conn = conn
+        self.page_size = page_size
+        self.workers = workers
+        self.refreshed = None
+        # (sorted slugs, channels by slug), replaced together on refresh.
+        self._index = ([], {})
+        self._lock = threading.Lock()
+        if not lazy:
+            self.refresh()
+
+    def __len__(self):
+        return len(self._index[0])
+
+    def __contains__(self, slug):
+        return slug in self._index[1]
+
+    def get(self, slug, default=None):
+        """Return the channel with this slug, or default."""
+        return self._index[1].get(slug, default)
+
+    def refresh(self, prefix=''):
+        """List the channels whose slugs start with prefix again, replacing
+        those in the catalogue.
+
+        :param str prefix: Default '', refresh every channel.
+
+        """
+        params = {'slug__startswith': prefix} if prefix else {}
+        listed = self.conn.list_channels(
+            page_size=self.page_size, workers=self.workers, use_cache=False,
+            **params)
+        with self._lock:
+            slugs, channels = self._index
+            lo, hi = self._range(prefix, slugs)
+            channels = dict(channels)
+            for slug in slugs[lo:hi]:
+                del channels[slug]
+            channels.update(listed)
+            slugs = slugs[:lo] + sorted(listed) + slugs[hi:]
+            self._index = (slugs, channels)
+            self.refreshed = time.time()
+
+    def startswith(self, prefix):
+        """Return the channels whose slugs start with prefix, keyed by slug.
+
+        :param str prefix: slug prefix, such as 'places.1.'
+        :rtype dict:
+
+        """
+        slugs, channels = self._index
+        lo, hi = self._range(prefix, slugs)
+        return dict((slug, channels[slug]) for slug in slugs[lo:hi])
+
+    def subject_ids(self, subject_type_plural='places'):
+        """Return the ids of the subjects of a type that have channels.
+
+        :param str subject_type_plural: Default: 'places'.
+        :rtype list: ids as they appear in the slugs, in slug order.
+
+        """
+        prefix = subject_type_plural + '.'
+        slugs = self._index[0]
+        lo, hi = self._range(prefix, slugs)
+        ids = []
+        seen = set()
+        for slug in slugs[lo:hi]:
+            subject_id = slug[len(prefix):].split('.', 1)[0]
+            if subject_id not in seen:
+                seen.add(subject_id)
+                ids.append(subject_id)
+        return ids
+
+    def _range(self, prefix, slugs):
+        """Slice of the sorted slugs starting with prefix."""
+        if not prefix:
+            return 0, len(slugs)
+        after = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return bisect_left(slugs, prefix), bisect_left(slugs, after)
@@ -2,21 +2,72 @@
 # -*- coding: utf-8 -*-
 import logging
 import json
-import urlparse
-import urllib
-
-import iso8601
-import requests
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from itertools import islice
+try:
+    from urllib.parse import quote, urljoin
+except ImportError:  # Python 2
+    from urllib import quote
+    from urlparse import urljoin
 
 from xylem import __version__
+from xylem.decoding import JSONDecoder, split_values
+from xylem.formats import JSON, accept_header, codec_for
+from xylem.instrumentation import RequestEvent
+from xylem.parallel import (
+    RateLimiter, first_completed, map_bounded, remaining,
+)
+from xylem.timeseries import TimeSeries
+from xylem.timestamps import parse_timestamps
+
+# requests and iso8601 are imported where they are first needed, so that
+# importing this module (and building a lazy Connection) stays cheap.
 
 ROOT = 'https://rhizome.carbonculture.net'
 API_PREFIX = 'api/v1'
 
 DEFAULT_TIMEOUT = 60 # seconds
 
+# GETs failing with connection errors, 5xx or 429 are retried this many times
+# by default, waiting DEFAULT_BACKOFF (doubled, with jitter, each time) first.
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF = 0.5 # seconds
+
+# Recent GET latencies kept to choose when to hedge, and the number needed
+# before any GET is hedged.
+LATENCY_SAMPLES = 200
+MIN_HEDGE_SAMPLES = 20
+
+# Number of per-host connection pools to cache, and the number of keep-alive
+# connections held open in each of them.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+DEFAULT_DISCOVERY_TTL = 60 * 60 * 24 # seconds
+
+DEFAULT_RESOLUTION = 60 * 30 # seconds, the server's default
+
+# Points per request when walking a range with iter_channel_values.
+DEFAULT_WINDOW_POINTS = 2000
+
+# Limits on a single slug__in request: the length of the comma-separated
+# slugs (so URLs stay well under common 8k server limits), and the number of
+# points in the response.
+MAX_SLUG_IN_LENGTH = 4000
+DEFAULT_BATCH_POINTS = 100000
+
+# Points whose timestamps are parsed at a time, as a streamed read's values
+# arrive.
+PARSE_CHUNK_POINTS = 1000
+
 log = logging.getLogger(__name__)
 
+_JSON_DECODER = JSONDecoder()
+
 
 class HttpError(Exception):
     pass
@@ -26,28 +77,324 @@ class APIError(Exception):
     pass
 
 
+class DeadlineExceeded(HttpError):
+    pass
+
+
+def split_range(earliest, latest, length):
+    """Split earliest to latest into consecutive windows.
+
+    Each window starts where the previous one ended, so boundary timestamps
+    appear in two windows.
+
+    :param datetime earliest: start of the range.
+    :param datetime latest: end of the range.
+    :param timedelta length: maximum length of each window.
+    :rtype list: [(window earliest, window latest), ...]
+
+    """
+    windows = []
+    start = earliest
+    while True:
+        end = min(start + length, latest)
+        windows.append((start, end))
+        if end >= latest:
+            return windows
+        start = end
+
+
+def _window_length(window_points, params):
+    """Length of a window holding window_points points at params' resolution.
+    """
+    from datetime import timedelta
+
+    resolution = int(params.get('resolution', DEFAULT_RESOLUTION))
+    return timedelta(seconds=resolution * window_points)
+
+
+def stitch_windows(parts):
+    """Yield values read window by window as if read in a single request.
+
+    'accum' values are read relative to the start of their window, so each
+    window is shifted by the accumulated value at its start, or, for a unit
+    missing there, by its last value before it. 'usage' values
+    are given at the end of each period, so windows never overlap; for any
+    other value type the shared boundary point is read twice, and is only
+    yielded once.
+
+    :param iterable parts: (value type, (timestamp, values by unit) in
+        timestamp order) for each window, in order; only one window is held
+        at a time.
+    :rtype generator: (timestamp, values by unit), in timestamp order.
+
+    """
+    last = None
+    totals = {}
+    for value_type, points in parts:
+        offset = None
+        if value_type == 'accum' and last is not None:
+            offset = dict(totals)
+        for ts, point in points:
+            if last is not None and ts <= last:
+                continue
+            if offset is not None:
+                point = _shift(point, offset)
+            for unit, value in point.items():
+                if value is not None:
+                    totals[unit] = value
+            last = ts
+            yield ts, point
+
+
+def merge_windows(parts):
+    """Merge values read window by window, see stitch_windows.
+
+    :param list parts: [(value type, values by timestamp), ...] for each
+        window, in order.
+    :rtype dict: values by timestamp.
+
+    """
+    return dict(stitch_windows(
+        (value_type, sorted(values.items())) for value_type, values in parts))
+
+
+def values_to_dict(values, units, resolution=None):
+    """Index a channel's values, as returned by the API, by timestamp.
+
+    :param iterable values: [(iso timestamp, value or [value per unit]),
+        ...], in timestamp order.
+    :param list units: units of the values, in order.
+    :param int resolution: seconds between points, if requested at one.
+    :rtype dict: {timestamp: {unit: value}}
+
+    """
+    return dict(_iter_points(values, units, resolution))
+
+
+def _iter_points(values, units, resolution=None):
+    """Yield a channel's values, as returned by the API, as (timestamp,
+    {unit: value}), parsing PARSE_CHUNK_POINTS at a time as they are iterated
+    over."""
+    values = iter(values)
+    while True:
+        chunk = list(islice(values, PARSE_CHUNK_POINTS))
+        if not chunk:
+            return
+        timestamps = parse_timestamps([x[0] for x in chunk], resolution)
+        for ts, x in zip(timestamps, chunk):
+            yield ts, {
+                unit: x[1][ix] if len(units) > 1 else x[1]
+                for ix, unit in enumerate(units)
+            }
+
+
+def batch_slugs(slugs, max_count=None, max_chars=MAX_SLUG_IN_LENGTH):
+    """Group slugs into batches to be read with one slug__in request each.
+
+    :param list slugs: channel slugs, in the order to read them.
+    :param int max_count: Default None, maximum slugs per batch.
+    :param int max_chars: Default MAX_SLUG_IN_LENGTH, maximum length of a
+        batch's slug__in parameter, to keep URLs within server limits.
+    :rtype list: lists of slugs.
+
+    """
+    batches = []
+    batch = []
+    length = 0
+    for slug in slugs:
+        if batch and (
+                length + 1 + len(slug) > max_chars or
+                (max_count and len(batch) >= max_count)):
+            batches.append(batch)
+            batch = []
+            length = 0
+        length += len(slug) + (1 if batch else 0)
+        batch.append(slug)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _shift(point, offset):
+    """Add offset's unit values to point's unit values, ignoring gaps."""
+    shifted = {}
+    for unit, value in point.items():
+        base = offset.get(unit)
+        if value is None or base is None:
+            shifted[unit] = value
+        else:
+            shifted[unit] = value + base
+    return shifted
+
+
+def _size(content):
+    """Bytes in a request or response body, which may be None."""
+    return len(content) if content else 0
+
+
+# Outcome of one item of a bulk operation: the status code and content of its
+# response, or None and the exception raised making it, and the seconds taken.
+BulkResult = namedtuple(
+    'BulkResult', ['item', 'status_code', 'content', 'elapsed', 'error'])
+
+# Outcome of sync_permissions: {slug: (permissions before, after)} of the
+# channels changed, slugs of those already as wanted, and {slug: error} of
+# those which couldn't be read or changed.
+PermissionSync = namedtuple(
+    'PermissionSync', ['changed', 'unchanged', 'failed'])
+
+
 class Connection(object):
     """Basic class configured to make requests to CarbonCulture's Data API."""
 
-    def __init__(self, access_name, api_key, root=None, format=None):
+    def __init__(self, access_name, api_key, root=None, format=None,
+                 pool_connections=None, pool_maxsize=None, pool_block=False,
+                 lazy=False, discovery_cache=None,
+                 discovery_ttl=DEFAULT_DISCOVERY_TTL, history_cache=None,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 hedge_percentile=None, instrumentation=None, decoder=None,
+                 response_cache=None):
+        """Configure the connection and discover the available services.
+
+        :param str access_name: API user name.
+        :param str api_key: API key for access_name.
+        :param str root: Default ROOT, the base URL of the API server.
+        :param format: Default 'application/json', the content type, or list
+            of content types in order of preference, to ask for; JSON is
+            asked for last if not given. Responses are decoded, and writes
+            encoded, by the codecs of xylem.formats.
+        :param int pool_connections: Default DEFAULT_POOL_CONNECTIONS, number
+            of hosts for which a pool of connections is kept.
+        :param int pool_maxsize: Default DEFAULT_POOL_MAXSIZE, maximum number
+            of keep-alive connections kept open to any one host.
+        :param bool pool_block: Default False, set True to make threads wait
+            for a free connection rather than open one beyond pool_maxsize.
+        :param bool lazy: Default False, set True to defer service discovery
+            (and the connection test) until self.services is first used.
+        :param str discovery_cache: Path of a file in which to keep the
+            discovered services between processes, or None to not keep them.
+        :param int discovery_ttl: Default DEFAULT_DISCOVERY_TTL, seconds for
+            which a cached service map is trusted.
+        :param xylem.cache.HistoryCache history_cache: Default None, a cache
+            through which to read channel values.
+        :param int retries: Default DEFAULT_RETRIES, times a GET is sent again
+            after a connection error, 5xx or 429.
+        :param float backoff: Default DEFAULT_BACKOFF, seconds before the
+            first retry; doubled, with jitter, for each one after.
+        :param float hedge_percentile: Default None, set (to 95, say) to send
+            a second copy of any GET still unanswered after this percentile
+            of recent GET latencies, and use whichever answers first.
+        :param xylem.instrumentation.Instrumentation instrumentation: Default
+            None, told about every request and the time spent on responses.
+        :param xylem.decoding.Decoder decoder: Default JSONDecoder(), decodes
+            the responses of value reads.
+        :param xylem.httpcache.ResponseCache response_cache: Default None, a
+            cache, which may be shared, through which to read the service map,
+            channel listings and datausers.
+
+        Wrap calls in xylem.parallel.deadline(seconds) to bound the time they
+        take in all, however many requests they make.
+
+        """
         self.access_name = access_name
         self.api_key = api_key
         self.root = root or ROOT
         self.endpoint = '/'.join([self.root, API_PREFIX])
-        self.format = format or 'application/json'
+        if isinstance(format, (list, tuple)):
+            self.formats = list(format)
+        else:
+            self.formats = [format or JSON]
+        self.format = self.formats[0]
+        # Content types the server has answered in, so can be written in.
+        self._answered = set([JSON])
 
         self.headers = {
             'Authorization': 'ApiKey {0}:{1}'.format(
                 self.access_name, self.api_key),
             'User-Agent': 'Xylem Version {0}'.format(__version__),
-            'Accept': self.format,
+            'Accept': accept_header(self.formats),
         }
-        self.services = {}
-        self._discover(self._test_connection())
+        self._pool_config = (
+            pool_connections or DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize or DEFAULT_POOL_MAXSIZE,
+            pool_block,
+        )
+        self._session = None
+        self._services = None
+        self._lock = threading.RLock()
+        self.discovery_cache = discovery_cache
+        self.discovery_ttl = discovery_ttl
+        self.history_cache = history_cache
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.instrumentation = instrumentation
+        self.decoder = decoder or JSONDecoder()
+        self.response_cache = response_cache
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        if not lazy:
+            self._discover(self._test_connection())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def session(self):
+        """The keep-alive session shared by every request made.
+
+        The connection pools are thread-safe, so a single Connection may be
+        used from several threads at once; at most pool_maxsize sockets are
+        kept open to each host.
+
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_session(*self._pool_config)
+        return self._session
+
+    @staticmethod
+    def _make_session(pool_connections, pool_maxsize, pool_block):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        """Close any pooled connections held open to the server."""
+        if self._session is not None:
+            self._session.close()
+
+    @property
+    def services(self):
+        """Map of service name to list endpoint, discovered on first use."""
+        if self._services is None:
+            with self._lock:
+                if self._services is None:
+                    self._services = self._read_discovery_cache()
+                if self._services is None:
+                    self._discover(self._test_connection())
+        return self._services
 
     def _request(self, endpoint=None, method=None, params=None, data=None,
-                 extra_headers=None, timeout=DEFAULT_TIMEOUT):
-        """Generic request, default to GET."""
+                 extra_headers=None, timeout=DEFAULT_TIMEOUT, stream=False):
+        """Generic request, default to GET.
+
+        GETs are retried and hedged as configured; every request is cut short
+        by the current xylem.parallel.deadline.
+
+        """
         method = method or 'get'
         headers = extra_headers or {}
         headers.update(self.headers)
@@ -59,45 +406,216 @@ class Connection(object):
                 'headers': headers,
             }
         )
-        fn = getattr(requests, method)
-        r = fn(
-            endpoint or self.endpoint,
-            params=params,
-            data=data,
-            headers=headers,
-            timeout=timeout,
-        )
+        url = endpoint or self.endpoint
+        if self.instrumentation is None:
+            return self._send(
+                method, url, params, data, headers, timeout, stream)[0]
+
+        start = time.time()
+        try:
+            r, retries, hedged = self._send(
+                method, url, params, data, headers, timeout, stream)
+        except Exception as e:
+            self.instrumentation.request(RequestEvent(
+                method, url, None, time.time() - start, None,
+                getattr(e, 'retries', 0), False, _size(data), 0, e))
+            raise
+        elapsed = getattr(r, 'elapsed', None)
+        if stream:
+            # The body is yet to be read; go by what the server says.
+            received = int(r.headers.get('Content-Length') or 0)
+        else:
+            received = _size(getattr(r, 'content', None))
+        self.instrumentation.request(RequestEvent(
+            method, url, r.status_code, time.time() - start,
+            elapsed.total_seconds() if elapsed is not None else None,
+            retries, hedged, _size(data), received, None))
         return r
 
-    def get(self, endpoint=None, params=None):
-        """Make a get."""
-        return self._request(endpoint, params=params)
+    def _send(self, method, url, params, data, headers, timeout, stream):
+        """Make a request, retrying and hedging GETs as configured.
+
+        :rtype (requests.Response, int, bool): (the response, the number of
+            retries made, whether the last attempt was hedged)
+
+        """
+        idempotent = method == 'get'
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if attempt:
+                pause = random.uniform(0.5, 1) * self.backoff * \
+                    2 ** (attempt - 1)
+                left = remaining()
+                if left is not None:
+                    pause = min(pause, max(left, 0))
+                time.sleep(pause)
+            left = remaining()
+            if left is not None and left <= 0:
+                e = DeadlineExceeded(
+                    "Deadline passed before {0} {1}".format(method, url))
+                e.retries = attempt
+                raise e
+            call_timeout = timeout if left is None else min(timeout, left)
+
+            def send():
+                return self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    data=data,
+                    headers=headers,
+                    timeout=call_timeout,
+                    stream=stream,
+                )
+
+            start = time.time()
+            hedge_delay = self._hedge_delay() if idempotent else None
+            try:
+                if hedge_delay is not None:
+                    r = first_completed(send, hedge_delay)
+                else:
+                    r = send()
+            except IOError as e:
+                if attempt + 1 == attempts:
+                    e.retries = attempt
+                    raise
+                log.debug('{0}: {1} failed, retrying: {2}'.format(
+                    method, url, e))
+                continue
+            latency = time.time() - start
+            if idempotent:
+                self._latencies.append(latency)
+            if attempt + 1 < attempts and (
+                    r.status_code >= 500 or r.status_code == 429):
+                # Release the connection of a streamed response.
+                r.close()
+                continue
+            return r, attempt, (
+                hedge_delay is not None and latency > hedge_delay)
+
+    def _phase(self, name, start):
+        """Report the time since start as spent on phase `name`."""
+        if self.instrumentation is not None:
+            self.instrumentation.phase(name, time.time() - start)
+
+    def _hedge_delay(self):
+        """Seconds after which to send a GET again, or None to not hedge."""
+        if self.hedge_percentile is None:
+            return None
+        latencies = sorted(self._latencies)
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        ix = int(len(latencies) * self.hedge_percentile / 100.0)
+        return latencies[min(ix, len(latencies) - 1)]
+
+    def get(self, endpoint=None, params=None, stream=False):
+        """Make a get.
+
+        :param bool stream: Default False, set True to leave the body to be
+            read from the response as it arrives.
+
+        """
+        return self._request(endpoint, params=params, stream=stream)
+
+    def _get_metadata(self, endpoint_name, endpoint=None, params=None,
+                      use_cache=True):
+        """Make a get through the response cache, if there is one.
+
+        :param str endpoint_name: 'root', 'channel' or 'datauser', whose TTL
+            applies.
+        :param bool use_cache: Default True, set False to revalidate a cached
+            response with the server even if it is within its TTL.
+
+        """
+        if self.response_cache is None:
+            return self.get(endpoint, params=params)
+        url = endpoint or self.endpoint
+        key = (self.access_name, self.headers['Accept'], url, tuple(
+            sorted((k, str(v)) for k, v in (params or {}).items())))
+        return self.response_cache.get(
+            key, endpoint_name,
+            lambda headers: self._request(
+                url, params=params, extra_headers=headers),
+            revalidate=not use_cache)
+
+    def decode(self, response, decoder=None):
+        """Decode the body of a response in the format it came back in.
+
+        :param requests.Response response: the response.
+        :param xylem.decoding.Decoder decoder: Default JSONDecoder(), decodes
+            JSON, or unknown content types.
+
+        """
+        codec = codec_for(response.headers.get('Content-Type'))
+        if codec is None or codec.content_type == JSON:
+            return (decoder or _JSON_DECODER).decode(response)
+        self._answered.add(codec.content_type)
+        return codec.decode(response.content)
+
+    def _decode_values(self, response):
+        """Decode the body of a value read, requested streamed if
+        self.decoder wants it."""
+        start = time.time()
+        content = self.decode(response, self.decoder)
+        self._phase('decode', start)
+        return content
+
+    def _decode_channel_values(self, response):
+        """Decode the body of a read of one channel's values, see
+        xylem.decoding.Decoder.decode_values."""
+        codec = codec_for(response.headers.get('Content-Type'))
+        if codec is not None and codec.content_type != JSON:
+            return split_values(self._decode_values(response))
+        start = time.time()
+        decoded = self.decoder.decode_values(response)
+        self._phase('decode', start)
+        return decoded
 
     def patch(self, endpoint=None, params=None, data=None):
         """Partial update to resource (e.g. put history or change meta)."""
-        if isinstance(data, dict):
-            data = json.dumps(data)
-        return self._request(
-            endpoint, params=params, data=data, method='patch',
-            extra_headers={
-                'Content-Type': 'application/json',
-            }
-        )
+        return self._write('patch', endpoint, params, data)
 
     def post(self, endpoint=None, params=None, data=None):
         """Create resource."""
+        return self._write('post', endpoint, params, data)
+
+    def _write(self, method, endpoint, params, data):
+        """Send data, encoding dicts in the most preferred format the server
+        has answered in, and again as JSON if it can't take that.
+        """
+        content_type = JSON
         if isinstance(data, dict):
-            data = json.dumps(data)
-        return self._request(
-            endpoint, params=params, data=data, method='post',
+            document = data
+            content_type = self._write_format()
+            data = codec_for(content_type).encode(document)
+        r = self._request(
+            endpoint, params=params, data=data, method=method,
             extra_headers={
-                'Content-Type': 'application/json',
+                'Content-Type': content_type,
             }
         )
+        if self.response_cache is not None:
+            # Drop the collection written to, or the one holding the item.
+            url = endpoint or self.endpoint
+            if not url.endswith('/'):
+                url = url[:url.rfind('/') + 1]
+            self.response_cache.invalidate(url)
+        if r.status_code == 415 and content_type != JSON:
+            self._answered.discard(content_type)
+            return self._write(method, endpoint, params, document)
+        return r
+
+    def _write_format(self):
+        for content_type in self.formats:
+            codec = codec_for(content_type)
+            if codec is not None and codec.can_encode and \
+                    content_type in self._answered:
+                return content_type
+        return JSON
 
     def _test_connection(self):
         """Ping the endpoint and check we get a 200"""
-        r = self.get()
+        r = self._get_metadata('root')
         if r.status_code != 200:
             raise HttpError(
                 "Got response code {0} from {1}".format(
@@ -110,24 +628,108 @@ class Connection(object):
         :param request.Response response: A previously fetched response
 
         """
-        response = response or self.get()
-        available = response.json()
+        response = response or self._get_metadata('root')
+        available = self.decode(response)
+        services = {}
         for key, meta in available.items():
-            self.services[key] = self.root + meta['list_endpoint']
+            services[key] = self.root + meta['list_endpoint']
+        self._services = services
+        self._write_discovery_cache(services)
+
+    def _discovery_cache_key(self):
+        return ' '.join([self.root, self.access_name])
+
+    def _read_discovery_cache(self):
+        """Return the cached services for this root and user, if fresh.
+
+        :rtype dict: the services, or None if there's no usable cache entry.
+
+        """
+        if not self.discovery_cache:
+            return None
+        try:
+            with open(self.discovery_cache) as f:
+                entry = json.load(f)[self._discovery_cache_key()]
+        except (IOError, ValueError, KeyError):
+            return None
+        if time.time() - entry['discovered'] > self.discovery_ttl:
+            return None
+        return entry['services']
+
+    def _write_discovery_cache(self, services):
+        """Store services in the discovery cache file, if there is one.
 
-    def list_channels(self, **kwargs):
-        """Get a list of channels, maybe filtered with kwargs"""
-        r = self.get(
+        The file is replaced atomically so concurrent processes never read a
+        partial write; failing to write is logged rather than raised.
+
+        """
+        if not self.discovery_cache:
+            return
+        try:
+            with open(self.discovery_cache) as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            entries = {}
+        entries[self._discovery_cache_key()] = {
+            'discovered': time.time(),
+            'services': services,
+        }
+        tmp = '{0}.{1}.tmp'.format(self.discovery_cache, os.getpid())
+        try:
+            directory = os.path.dirname(self.discovery_cache)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(tmp, 'w') as f:
+                json.dump(entries, f)
+            os.rename(tmp, self.discovery_cache)
+        except (IOError, OSError) as e:
+            log.warning('Could not write discovery cache: {0}'.format(e))
+
+    def list_channels(self, page_size=None, workers=None, use_cache=True,
+                      **kwargs):
+        """Get a list of channels, maybe filtered with kwargs
+
+        :param int page_size: Default None, channels asked for per page;
+            the server's own limit if None.
+        :param int workers: Default None, set to fetch the pages after the
+            first this many at a time, by offset from the first page's
+            total_count and limit, rather than following meta.next.
+        :param bool use_cache: Default True, set False to check every page
+            with the server rather than use pages the response cache still
+            holds as fresh.
+        :rtype dict: channels by slug.
+
+        """
+        if page_size is not None:
+            kwargs['limit'] = page_size
+        r = self._get_metadata(
+            'channel',
             self.services['channel'],
-            params=kwargs
+            params=kwargs,
+            use_cache=use_cache
         )
         if r.status_code == 200:
-            content = r.json()
+            content = self.decode(r)
 
             channels = dict([(ch['slug'], ch) for ch in content['objects']])
+            meta = content['meta']
+            if workers and meta['next'] is not None and meta.get('limit') \
+                    and meta.get('total_count') is not None:
+                offsets = range(
+                    meta.get('offset', 0) + meta['limit'],
+                    meta['total_count'], meta['limit'])
+                for objects in map_bounded(
+                        lambda offset: self._get_channel_page(
+                            kwargs, meta['limit'], offset, use_cache),
+                        offsets, workers):
+                    channels.update(dict(
+                        [(ch['slug'], ch) for ch in objects]))
+                return channels
             while content['meta']['next'] is not None:
-                r = self.get(self.root + content['meta']['next'])
-                content = r.json()
+                r = self._get_metadata(
+                    'channel', self.root + content['meta']['next'],
+                    use_cache=use_cache)
+                content = self.decode(r)
                 channels.update(dict(
                     [(ch['slug'], ch) for ch in content['objects']]))
             return channels
@@ -136,6 +738,18 @@ class Connection(object):
                 "Got response code {0} from {1}".format(
                     r.status_code, self.endpoint))
 
+    def _get_channel_page(self, params, limit, offset, use_cache=True):
+        """Get the channels on one page of a listing."""
+        params = dict(params, limit=limit, offset=offset)
+        r = self._get_metadata(
+            'channel', self.services['channel'], params=params,
+            use_cache=use_cache)
+        if r.status_code != 200:
+            raise HttpError(
+                "Got response code {0} from {1}".format(
+                    r.status_code, self.services['channel']))
+        return self.decode(r)['objects']
+
     def write_channel_values(self, channel_slug, values, overwrite=False):
         """Write the given values to the channel identified by channel_slug.
 
@@ -151,10 +765,14 @@ class Connection(object):
                 'overwrite': overwrite,
             },
         )
+        if self.history_cache is not None:
+            self.history_cache.invalidate(channel_slug)
 
         return (_r.status_code, _r.content)
 
-    def read_channel_values(self, channel_slug, earliest, latest, **kwargs):
+    def read_channel_values(self, channel_slug, earliest, latest,
+                            window_points=None, workers=None,
+                            as_timeseries=False, use_cache=True, **kwargs):
         """Read values from a given channel, between earliest and latest.
 
         :param str channel_slug: Slug of channel to read
@@ -164,13 +782,156 @@ class Connection(object):
             at earliest + resolution)
         :param datetime latest: up to when to get readings (you should get a
             point at this time)
+        :param int window_points: Default None (one request), otherwise split
+            the range into windows of at most this many points at the
+            requested resolution, and fetch them concurrently.
+        :param int workers: Default DEFAULT_WORKERS, maximum number of windows
+            fetched at once.
+        :param bool as_timeseries: Default False, set True to get a
+            xylem.timeseries.TimeSeries instead of a dict (requires numpy).
+        :param bool use_cache: Default True, set False to read from the server
+            even if the connection has a history_cache.
         :param kwargs: extra kwargs to add to the params dict
-        :rtype: tuple list
-        :return: [(timestamp, [values]), ...]
+        :rtype: dict or TimeSeries
+        :return: {timestamp: {unit: value}, ...}
         :raises: APIError in the case that something is wrong with the request
 
         """
         # TODO: this method should support retrieving stats.
+        if use_cache and self.history_cache is not None:
+            results = self.history_cache.read(
+                self, channel_slug, earliest, latest, window_points, workers,
+                **kwargs)
+            if as_timeseries:
+                return TimeSeries.from_dict(results, kwargs.get('value_type'))
+            return results
+
+        if as_timeseries:
+            read, merge = self._read_channel_series, TimeSeries.stitch
+        else:
+            read, merge = self._read_channel_window, merge_windows
+
+        if window_points:
+            windows = split_range(
+                earliest, latest, _window_length(window_points, kwargs))
+            parts = map_bounded(
+                lambda window: read(
+                    channel_slug, window[0], window[1], **kwargs),
+                windows,
+                workers,
+            )
+            return merge(parts)
+
+        value_type, results = read(channel_slug, earliest, latest, **kwargs)
+        return results
+
+    def iter_channel_values(self, channel_slug, earliest, latest,
+                            window_points=None, batch_size=None, **kwargs):
+        """Iterate over values from a channel, between earliest and latest.
+
+        The range is read one window at a time, so however long it is only a
+        window's worth of values is held in memory at once.
+
+        :param str channel_slug: Slug of channel to read
+        :param datetime earliest: from when to get readings, as for
+            read_channel_values
+        :param datetime latest: up to when to get readings
+        :param int window_points: Default DEFAULT_WINDOW_POINTS, maximum
+            number of points read per request.
+        :param int batch_size: Default None, yield single points; otherwise
+            yield lists of up to this many points.
+        :param kwargs: extra kwargs to add to the params dict
+        :rtype generator: (timestamp, {unit: value}), in timestamp order
+        :raises: APIError in the case that something is wrong with a request
+
+        """
+        windows = split_range(
+            earliest, latest,
+            _window_length(window_points or DEFAULT_WINDOW_POINTS, kwargs))
+        points = stitch_windows(
+            self._stream_channel_window(channel_slug, start, end, **kwargs)
+            for start, end in windows
+        )
+        if not batch_size:
+            for point in points:
+                yield point
+            return
+
+        batch = []
+        for point in points:
+            batch.append(point)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _read_channel_window(self, channel_slug, earliest, latest, **kwargs):
+        """Make a single read_channel_values request.
+
+        :rtype (str, dict): (value type of the values, values by timestamp)
+
+        """
+        value_type, units, values = self._stream_channel_values(
+            channel_slug, earliest, latest, **kwargs)
+        start = time.time()
+        values = values_to_dict(
+            values, units, kwargs.get('resolution', DEFAULT_RESOLUTION))
+        self._phase('parse', start)
+        return value_type, values
+
+    def _stream_channel_window(self, channel_slug, earliest, latest,
+                               **kwargs):
+        """Make a single read_channel_values request, parsing its values as
+        they are iterated over.
+
+        :rtype (str, generator): (value type of the values, (timestamp, values
+            by unit) in timestamp order)
+
+        """
+        value_type, units, values = self._stream_channel_values(
+            channel_slug, earliest, latest, **kwargs)
+        return value_type, _iter_points(
+            values, units, kwargs.get('resolution', DEFAULT_RESOLUTION))
+
+    def _read_channel_series(self, channel_slug, earliest, latest, **kwargs):
+        """Make a single read_channel_values request, as a TimeSeries.
+
+        :rtype (str, TimeSeries): (value type of the values, values)
+
+        """
+        value_type, units, values = self._get_channel_values(
+            channel_slug, earliest, latest, **kwargs)
+        start = time.time()
+        series = TimeSeries.from_values(
+            values, units, value_type,
+            kwargs.get('resolution', DEFAULT_RESOLUTION))
+        self._phase('parse', start)
+        return value_type, series
+
+    def _get_channel_values(self, channel_slug, earliest, latest, **kwargs):
+        """Fetch a channel's values between earliest and latest.
+
+        :rtype (str, list, list): (value type, units, values as returned by
+            the API)
+
+        """
+        value_type, units, values = self._stream_channel_values(
+            channel_slug, earliest, latest, **kwargs)
+        return value_type, units, list(values)
+
+    def _stream_channel_values(self, channel_slug, earliest, latest,
+                               **kwargs):
+        """Fetch a channel's values between earliest and latest, decoded as
+        they are iterated over if self.decoder streams.
+
+        The values must be iterated over, or the response may hold its
+        connection until it is garbage collected.
+
+        :rtype (str, list, iterable): (value type, units, values as returned
+            by the API)
+
+        """
         params = {
             'slug': channel_slug,
             'values__earliest': earliest.isoformat(),
@@ -181,21 +942,205 @@ class Connection(object):
         _r = self.get(
             self.services['channel'],
             params=params,
+            stream=self.decoder.stream,
         )
         if _r.status_code == 200:
-            _json = _r.json()
-            ch = _json['objects'][0]
-            units = _json['meta'].get('units', [ch['unit']])
-            results = {
-                iso8601.parse_date(x[0]): {
-                    unit: x[1][ix] if len(units) > 1 else x[1] for ix, unit in enumerate(units)
-                }
-                for x in ch['values']
-            }
-            return results
+            meta, ch, values = self._decode_channel_values(_r)
+            if ('units' not in meta and 'unit' not in ch) or (
+                    'value_type' not in params and 'value_type' not in ch):
+                # Given after the values: read them all first.
+                values = list(values)
+            units = meta['units'] if 'units' in meta else [ch['unit']]
+            value_type = params.get('value_type', ch.get('value_type'))
+            return value_type, units, values
         raise APIError(
             "API Error: ({}) {}".format(_r.status_code, _r.content))
 
+    def read_many_channel_values(self, channel_slugs, earliest, latest,
+                                 batch_size=None, workers=None, **kwargs):
+        """Read values from many channels, between earliest and latest.
+
+        Channels are read together, in batches of slugs passed as slug__in,
+        with up to `workers` batches read at once.
+
+        :param list channel_slugs: Slugs of channels to read
+        :param datetime earliest: from when to get readings, as for
+            read_channel_values
+        :param datetime latest: up to when to get readings
+        :param int batch_size: Default None, maximum channels per request;
+            batches are always limited to MAX_SLUG_IN_LENGTH characters of
+            slugs, and to about DEFAULT_BATCH_POINTS points.
+        :param int workers: Default DEFAULT_WORKERS, maximum number of batches
+            read at once.
+        :param kwargs: extra kwargs to add to the params dict
+        :rtype (dict, dict): ({slug: {timestamp: {unit: value}}},
+            {slug: APIError}) with each slug in one or the other.
+
+        """
+        resolution = int(kwargs.get('resolution', DEFAULT_RESOLUTION))
+        points = int(
+            (latest - earliest).total_seconds() // resolution) + 1
+        max_count = max(1, DEFAULT_BATCH_POINTS // points)
+        if batch_size:
+            max_count = min(max_count, batch_size)
+        batches = batch_slugs(channel_slugs, max_count)
+
+        params = {
+            'values__earliest': earliest.isoformat(),
+            'values__latest': latest.isoformat(),
+        }
+        params.update(kwargs)  # e.g. resolution, units...
+
+        def parse(values, units):
+            return values_to_dict(values, units, resolution)
+
+        return self._read_channel_batches(
+            batches, params, 'values', parse, workers)
+
+    def read_many_channel_presence(self, channel_slugs, earliest, latest,
+                                   batch_size=None, workers=None, **kwargs):
+        """Read the data presence of many channels, period by period.
+
+        Channels are read together, in batches of slugs passed as slug__in,
+        with up to `workers` batches read at once.
+
+        :param list channel_slugs: Slugs of channels to check
+        :param datetime earliest: from when to get presence
+        :param datetime latest: up to (inclusive) when to get presence
+        :param int batch_size: Default None, maximum channels per request;
+            batches are always limited to MAX_SLUG_IN_LENGTH characters of
+            slugs.
+        :param int workers: Default DEFAULT_WORKERS, maximum number of batches
+            read at once.
+        :param kwargs: extra kwargs to add to the params dict
+        :rtype (dict, dict): ({slug: [(timestamp, presence 0 to 1), ...]},
+            {slug: APIError}) with each slug in one or the other.
+
+        """
+        params = {
+            'qa_only': True,
+            'quality_assurance': 'presence',
+            'values__earliest': earliest.isoformat(),
+            'values__latest': latest.isoformat(),
+        }
+        params.update(kwargs)
+
+        def parse(periods, units):
+            timestamps = parse_timestamps([ts for ts, _ in periods])
+            return [(ts, vals[0]) for ts, (_, vals) in zip(timestamps, periods)]
+
+        return self._read_channel_batches(
+            batch_slugs(channel_slugs, batch_size), params,
+            'quality_assurance', parse, workers)
+
+    def follow(self, channel_slugs, **kwargs):
+        """Follow channels, yielding each new point once, as it is added.
+
+        Only points after each channel's last point yielded are asked for,
+        channels due a poll are read together, and each is polled about as
+        often as it gains points; see xylem.follow.Follower for the options.
+
+        :param list channel_slugs: Slugs of channels to follow
+        :rtype xylem.follow.Follower: iterable of (channel slug, timestamp,
+            value), until its close() is called.
+
+        """
+        from xylem.follow import Follower
+        return Follower(self, channel_slugs, **kwargs)
+
+    def _read_channel_batches(self, batches, params, field, parse, workers,
+                              echo=None):
+        """Read field of the channels in each batch, see _read_channel_batch.
+
+        :rtype (dict, dict): ({slug: parsed field}, {slug: APIError})
+
+        """
+        results = {}
+        errors = {}
+        for batch_results, batch_errors in map_bounded(
+                lambda batch: self._read_channel_batch(
+                    batch, params, field, parse, echo),
+                batches,
+                workers):
+            results.update(batch_results)
+            errors.update(batch_errors)
+        return results, errors
+
+    def _read_channel_batch(self, channel_slugs, params, field, parse,
+                            echo=None):
+        """Make a slug__in request, parsing field of each channel with
+        parse(field value, units).
+
+        A failure of the whole request is given as the error of each slug.
+
+        :param dict echo: Default None, params the server must give back in
+            the meta of each page, for field to be trusted to answer them;
+            the channels of a page without them fail.
+
+        :rtype (dict, dict): ({slug: parsed field}, {slug: APIError})
+
+        """
+        params = dict(
+            params, slug__in=','.join(channel_slugs), limit=len(channel_slugs))
+
+        results = {}
+        errors = {}
+        try:
+            for content in self._get_pages(self.services['channel'], params):
+                meta = content['meta']
+                units = meta.get('units')
+                ignored = sorted(
+                    k for k, v in (echo or {}).items() if meta.get(k) != v)
+                for ch in content['objects']:
+                    if ignored:
+                        errors[ch['slug']] = APIError(
+                            "API Error: {0} not given back for {1}".format(
+                                ', '.join(ignored), ch['slug']))
+                        continue
+                    if field not in ch:
+                        errors[ch['slug']] = APIError(
+                            "API Error: no {0} given for {1}".format(
+                                field, ch['slug']))
+                        continue
+                    values = ch[field]
+                    if isinstance(values, dict) and 'error' in values:
+                        errors[ch['slug']] = APIError(
+                            "API Error: {0}".format(values['error']))
+                        continue
+                    start = time.time()
+                    results[ch['slug']] = parse(
+                        values, units or [ch.get('unit')])
+                    self._phase('parse', start)
+        except (HttpError, APIError, IOError) as e:
+            if not isinstance(e, APIError):
+                e = APIError("API Error: {0}".format(e))
+            return {}, dict((slug, e) for slug in channel_slugs)
+
+        for slug in channel_slugs:
+            if slug not in results and slug not in errors:
+                errors[slug] = APIError(
+                    "API Error: (403) You don't have access to channel: "
+                    "{0}".format(slug))
+        return results, errors
+
+    def _get_pages(self, endpoint, params):
+        """Yield the decoded content of each page of a list request.
+
+        :raises: APIError if any page isn't 200 OK
+
+        """
+        stream = self.decoder.stream
+        _r = self.get(endpoint, params=params, stream=stream)
+        while True:
+            if _r.status_code != 200:
+                raise APIError(
+                    "API Error: ({}) {}".format(_r.status_code, _r.content))
+            content = self._decode_values(_r)
+            yield content
+            if not content['meta'].get('next'):
+                return
+            _r = self.get(self.root + content['meta']['next'], stream=stream)
+
     def create_channel(self, channel_data):
         """Posts to the API to make a new channel. Doesn't do existence check.
 
@@ -210,6 +1155,41 @@ class Connection(object):
 
         return (_r.status_code, _r.content)
 
+    def bulk_create_channels(self, channel_data_list, workers=None,
+                             rate=None):
+        """Create several channels concurrently. Doesn't do existence check.
+
+        :param list channel_data_list: list of dicts
+        with keys and values for the channels
+        :param int workers: Default DEFAULT_WORKERS, maximum channels created
+            at once.
+        :param float rate: Default None, maximum channels created a second.
+        :rtype list: BulkResult for each channel, in order.
+
+        """
+        return self._bulk(self.create_channel, channel_data_list, workers,
+                          rate)
+
+    def _bulk(self, fn, items, workers, rate):
+        """Call fn, returning (status code, content), for each of items.
+
+        A failure of one item is recorded in its result rather than raised.
+
+        """
+        limiter = RateLimiter(rate) if rate else None
+
+        def call(item):
+            if limiter is not None:
+                limiter.wait()
+            start = time.time()
+            try:
+                code, content = fn(item)
+            except Exception as e:
+                return BulkResult(item, None, None, time.time() - start, e)
+            return BulkResult(item, code, content, time.time() - start, None)
+
+        return map_bounded(call, items, workers)
+
     def create_channels(self, channel_data_list):
         """Convenience method to create several channels on one channels
 
@@ -237,15 +1217,13 @@ class Connection(object):
                 'values__latest_n': n,
             }
         )
-        response = _r.json()
+        response = self.decode(_r)
         ch = response['objects'][0]
         values = ch['values']
         if isinstance(values, dict) and 'error' in values:
             raise ValueError(values['error'])
-        return [
-            (iso8601.parse_date(t), v)
-            for t, v in values
-        ]
+        timestamps = parse_timestamps([t for t, v in values])
+        return [(ts, v) for ts, (t, v) in zip(timestamps, values)]
 
     def assign_permissions_for_user(self, user, permissions):
         """Assign the set of regular permissions for a user (groups).
@@ -255,7 +1233,7 @@ class Connection(object):
         :rtype (int, str): (status code, message)
         """
         _r = self.patch(
-            urlparse.urljoin(self.services['datauser'], urllib.quote(user)),
+            urljoin(self.services['datauser'], quote(user)),
             data={
                 'permissions': permissions
             },
@@ -283,13 +1261,78 @@ class Connection(object):
 
         return (_r.status_code, _r.content)
 
+    def sync_permissions(self, user, permissions, current=None,
+                         batch_size=None, workers=None, rate=None):
+        """Make a user's permissions on channels those given, changing only
+        the channels whose permissions differ.
+
+        The user's current permissions are read in batches of slugs passed
+        as slug__in, with the user asked about as the user param, and
+        channels needing changes are then changed concurrently with
+        assign_permissions_for_user_on_channel. Channels not given are left
+        alone; give an empty list to take all permissions on one away.
+
+        Reading depends on the channel list endpoint (GET api/v1/channel/)
+        taking a user param, listing that user's permissions on each channel,
+        and giving the user back in its meta. The permissions listed by a
+        server which doesn't may be someone else's, so those channels fail
+        rather than be compared; pass current to skip reading.
+
+        :param str user: User access_name.
+        :param dict permissions: {channel slug: list of codenames of the
+            permissions the user should have}
+        :param dict current: Default None, the user's permissions by slug,
+            if already known, so not read; slugs missing have none.
+        :param int batch_size: Default None, maximum channels per read.
+        :param int workers: Default DEFAULT_WORKERS, maximum reads, and
+            changes, made at once.
+        :param float rate: Default None, maximum changes made a second.
+        :rtype PermissionSync:
+
+        """
+        slugs = sorted(permissions)
+        failed = {}
+        if current is None:
+            current, failed = self._read_channel_batches(
+                batch_slugs(slugs, batch_size), {'user': user},
+                'permissions', lambda perms, units: sorted(perms or []),
+                workers, echo={'user': user})
+
+        unchanged = []
+        changes = []
+        for slug in slugs:
+            if slug in failed:
+                continue
+            if set(current.get(slug) or []) == set(permissions[slug]):
+                unchanged.append(slug)
+            else:
+                changes.append(slug)
+
+        changed = {}
+        for result in self._bulk(
+                lambda slug: self.assign_permissions_for_user_on_channel(
+                    user, slug, sorted(permissions[slug])),
+                changes, workers, rate):
+            slug = result.item
+            if result.error is not None:
+                failed[slug] = result.error
+            elif not 200 <= result.status_code < 300:
+                failed[slug] = APIError("API Error: ({0}) {1}".format(
+                    result.status_code, result.content))
+            else:
+                changed[slug] = (
+                    sorted(current.get(slug) or []),
+                    sorted(permissions[slug]))
+        return PermissionSync(changed, unchanged, failed)
+
     def list_datausers(self):
         """Retrieves a list of the datausers.
 
         :rtype (int, str):
         :return: (status code, message)
         """
-        _r = self.get(
+        _r = self._get_metadata(
+            'datauser',
             self.services['datauser']
         )
         return (_r.status_code, _r.content)
@@ -300,9 +1343,10 @@ class Connection(object):
         :rtype dict:
         :return: Dict with the information for that datauser.
         """
-        _r = self.get(
-            urlparse.urljoin(
-                self.services['datauser'], urllib.quote(access_name))
+        _r = self._get_metadata(
+            'datauser',
+            urljoin(
+                self.services['datauser'], quote(access_name))
         )
         return (_r.status_code, _r.content)
 
@@ -319,6 +1363,18 @@ class Connection(object):
 
         return (_r.status_code, _r.content)
 
+    def bulk_create_datausers(self, access_names, workers=None, rate=None):
+        """Create several datausers concurrently.
+
+        :param list access_names: list of access names of users.
+        :param int workers: Default DEFAULT_WORKERS, maximum datausers created
+            at once.
+        :param float rate: Default None, maximum datausers created a second.
+        :rtype list: BulkResult for each datauser, in order.
+
+        """
+        return self._bulk(self.create_datauser, access_names, workers, rate)
+
     def create_datausers(self, access_names):
         """Convenience method to create several datausers.
 
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Decoders turning API responses into Python objects.
+
+Connection(decoder=...) uses one to decode the responses of value reads,
+which can run to many megabytes. JSONDecoder decodes the whole body at once,
+with the json module or any faster loads() given to it::
+
+    import orjson
+    conn = Connection(name, key, decoder=JSONDecoder(orjson.loads))
+
+IncrementalDecoder (pip install xylem[stream]) decodes the body as it is
+received, so the raw body is never held in memory alongside the result. A
+single channel's values are decoded a point at a time as they arrive, and
+parsed into the result in chunks, so iter_channel_values yields a window's
+first points before the rest of it has been received.
+
+"""
+import json
+
+
+class Decoder(object):
+    """Base class of decoders.
+
+    If stream is True, requests are made without reading the body, and
+    decode() is left to read it.
+
+    """
+    stream = False
+
+    def decode(self, response):
+        """Return the decoded body of a 200 OK response.
+
+        :param requests.Response response: the response.
+        :rtype dict:
+
+        """
+        raise NotImplementedError
+
+    def decode_values(self, response):
+        """Decode the body of a 200 OK read of one channel's values.
+
+        :param requests.Response response: the response.
+        :rtype (dict, dict, iterable): (the meta, the channel without its
+            values, and its values as the API gives them, to be iterated
+            over once)
+
+        """
+        return split_values(self.decode(response))
+
+
+def split_values(content):
+    """Split a decoded read of one channel's values, see
+    Decoder.decode_values."""
+    channel = dict(content['objects'][0])
+    return content['meta'], channel, channel.pop('values')
+
+
+class JSONDecoder(Decoder):
+    """Decode the whole body at once."""
+
+    def __init__(self, loads=None):
+        """
+        :param callable loads: Default json.loads, function decoding a JSON
+            document given as bytes.
+
+        """
+        self.loads = loads or json.loads
+
+    def decode(self, response):
+        content = response.content
+        if self.loads is json.loads and not isinstance(content, str):
+            # Python 3 before 3.6 can't decode bytes.
+            content = content.decode(response.encoding or 'utf-8')
+        return self.loads(content)
+
+
+class IncrementalDecoder(Decoder):
+    """Decode the body with ijson as it arrives, a chunk at a time."""
+    stream = True
+
+    def __init__(self, buffer_size=64 * 1024):
+        """
+        :param int buffer_size: Default 64KB, bytes read at a time.
+
+        """
+        self.buffer_size = buffer_size
+        self._ijson = _ijson()
+
+    def decode(self, response):
+        response.raw.decode_content = True
+        try:
+            return next(self._ijson.items(
+                response.raw, '', use_float=True,
+                buf_size=self.buffer_size))
+        finally:
+            response.close()
+
+    def decode_values(self, response):
+        """Read the body up to the channel's values, and decode those as they
+        are iterated over. Any of the channel's fields after its values are
+        added to it once the values have all been iterated over.
+        """
+        response.raw.decode_content = True
+        events = self._ijson.parse(
+            response.raw, use_float=True, buf_size=self.buffer_size)
+        document = self._ijson.ObjectBuilder()
+        try:
+            for prefix, event, value in events:
+                if prefix == 'objects.item.values' and event == 'start_array':
+                    break
+                document.event(event, value)
+            else:
+                response.close()
+                return split_values(document.value)
+            content = document.value
+            channel = content['objects'][0]
+        except Exception:
+            response.close()
+            raise
+        return content['meta'], channel, self._values(
+            events, document, response)
+
+    def _values(self, events, document, response):
+        """Yield the items of the values array events are in, then build the
+        rest of the document."""
+        try:
+            depth = 0
+            for prefix, event, value in events:
+                if depth == 0:
+                    if event == 'end_array':
+                        break
+                    item = self._ijson.ObjectBuilder()
+                item.event(event, value)
+                if event in ('start_array', 'start_map'):
+                    depth += 1
+                elif event in ('end_array', 'end_map'):
+                    depth -= 1
+                if depth == 0:
+                    yield item.value
+            for prefix, event, value in events:
+                document.event(event, value)
+        finally:
+            response.close()
+
+
+def _ijson():
+    try:
+        import ijson
+    except ImportError:
+        raise ImportError(
+            "Incremental decoding needs ijson: pip install xylem[stream]")
+    return ijson
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Export the history of many channels to files, resumably.
+
+    xylem-export 'places.*.elec' 'communities.2.*' \\
+        --earliest 2010-01-01T00:00:00+00:00 \\
+        --latest 2020-01-01T00:00:00+00:00 \\
+        --units kWh,kgCO2e --format npz --out export/
+
+Slug patterns (fnmatch style) are resolved with list_channels, and each
+channel's range is split into partitions of --partition-days. Partitions are
+fetched on threads, then decoded and written on a process pool, to
+OUT/<slug>/<partition start>.<format>:
+
+- csv: a timestamp column, as the API gives it, then a column per unit.
+- npz: a 'timestamp' array of epoch seconds, and an array per unit.
+- parquet: a UTC 'timestamp' column, then a column per unit (needs pyarrow,
+  pip install xylem[parquet]).
+
+OUT/manifest.json records the options and channels of the export, and
+OUT/completed.jsonl each partition written. Run the same command again to
+resume an interrupted export: only the partitions not yet written (or which
+failed) are fetched.
+
+Values are exported as usage by default, since accumulations are relative
+to the start of each partition.
+
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from collections import deque
+from datetime import timedelta
+from fnmatch import fnmatch
+from multiprocessing.pool import ThreadPool
+
+from xylem.connection import APIError, Connection, split_range
+from xylem.formats import JSON, codec_for
+from xylem.parallel import DEFAULT_WORKERS
+from xylem.timeseries import _numpy
+from xylem.timestamps import parse_epochs, parse_timestamp
+
+FORMATS = ('csv', 'npz', 'parquet')
+
+DEFAULT_PARTITION_DAYS = 365
+
+MANIFEST = 'manifest.json'
+COMPLETED = 'completed.jsonl'
+
+log = logging.getLogger(__name__)
+
+
+def resolve_slugs(conn, patterns, workers=None):
+    """Slugs of the channels matching any of the patterns.
+
+    Each pattern is listed by its literal prefix, then matched with fnmatch;
+    a pattern without wildcards is taken as it is.
+
+    :param xylem.Connection conn: The connection configured to the API
+    :param list patterns: fnmatch patterns of slugs.
+    :param int workers: Default None, pages of each listing read at once.
+    :rtype list: sorted slugs.
+
+    """
+    slugs = set()
+    for pattern in patterns:
+        prefix = pattern
+        for ix, c in enumerate(pattern):
+            if c in '*?[':
+                prefix = pattern[:ix]
+                break
+        else:
+            slugs.add(pattern)
+            continue
+        params = {'slug__startswith': prefix} if prefix else {}
+        slugs.update(
+            slug for slug in conn.list_channels(
+                workers=workers, use_cache=False, **params)
+            if fnmatch(slug, pattern))
+    return sorted(slugs)
+
+
+class Manifest(object):
+    """The options, channels and written partitions of an export."""
+
+    def __init__(self, directory, options):
+        """Start an export in directory, or resume the one there.
+
+        :param str directory: directory of the export.
+        :param dict options: options of the export, which must be those it
+            was started with to resume it.
+        :raises: ValueError if the export there had other options.
+
+        """
+        self.path = os.path.join(directory, MANIFEST)
+        self.completed_path = os.path.join(directory, COMPLETED)
+        options = json.loads(json.dumps(options))
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved['options'] != options:
+                raise ValueError(
+                    "{0} is an export with other options: {1}".format(
+                        directory, saved['options']))
+            self.slugs = saved['slugs']
+        else:
+            self.slugs = None
+            self._save(options)
+        self.options = options
+        self.completed = {}
+        if os.path.exists(self.completed_path):
+            with open(self.completed_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # cut short by an interruption
+                    self.completed[entry['key']] = entry
+        self._lock = threading.Lock()
+
+    def _save(self, options):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'options': options, 'slugs': self.slugs}, f)
+        os.rename(tmp, self.path)
+
+    def set_slugs(self, slugs):
+        """Record the channels resolved, to be used on resuming."""
+        self.slugs = list(slugs)
+        self._save(self.options)
+
+    def record(self, key, path, points):
+        """Record a partition as written."""
+        entry = {'key': key, 'file': path, 'points': points}
+        with self._lock:
+            with open(self.completed_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.completed[key] = entry
+
+
+def partitions(slugs, earliest, latest, days=DEFAULT_PARTITION_DAYS):
+    """(slug, start, end) of each partition of each channel."""
+    windows = split_range(earliest, latest, timedelta(days=days))
+    return [(slug, start, end) for slug in slugs for start, end in windows]
+
+
+def partition_key(slug, start, end):
+    return '{0}|{1}|{2}'.format(slug, start.isoformat(), end.isoformat())
+
+
+def partition_path(slug, start, fmt):
+    """Path of a partition's file, relative to the export directory."""
+    return os.path.join(
+        slug, '{0}.{1}'.format(start.strftime('%Y%m%dT%H%M%S'), fmt))
+
+
+def write_partition(path, fmt, content_type, content):
+    """Decode a value read, and write it to path in fmt.
+
+    Run on the process pool, so takes and returns only plain values.
+
+    :rtype int: the number of points written.
+
+    """
+    document = (codec_for(content_type) or codec_for(JSON)).decode(content)
+    ch = document['objects'][0]
+    values = ch['values']
+    if isinstance(values, dict) and 'error' in values:
+        raise APIError("API Error: {0}".format(values['error']))
+    units = document['meta'].get('units') or [ch['unit']]
+    columns = [
+        [v[ix] if len(units) > 1 else v for _, v in values]
+        for ix in range(len(units))]
+
+    tmp = path + '.tmp'
+    if fmt == 'csv':
+        # The csv module works in bytes on Python 2, and text on 3.
+        if str is bytes:
+            f = open(tmp, 'wb')
+        else:
+            f = io.open(tmp, 'w', newline='')
+        with f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['timestamp'] + list(units))
+            for ix, (ts, _) in enumerate(values):
+                writer.writerow([ts] + [
+                    '' if col[ix] is None else repr(float(col[ix]))
+                    for col in columns])
+    else:
+        np = _numpy()
+        epochs = np.asarray(parse_epochs([ts for ts, _ in values]),
+                            dtype='int64')
+        arrays = [np.array(col, dtype='float64') for col in columns]
+        if fmt == 'npz':
+            with open(tmp, 'wb') as f:
+                np.savez(f, timestamp=epochs, **dict(zip(units, arrays)))
+        else:
+            pa, pq = _pyarrow()
+            table = pa.Table.from_arrays(
+                [pa.array(epochs, type=pa.timestamp('s', tz='UTC'))] +
+                [pa.array(a, from_pandas=True) for a in arrays],
+                names=['timestamp'] + list(units))
+            pq.write_table(table, tmp)
+    os.rename(tmp, path)
+    return len(values)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet export needs pyarrow: pip install xylem[parquet]")
+    return pyarrow, pyarrow.parquet
+
+
+class _Done(object):
+    """The result of a call made in this process, as an AsyncResult."""
+
+    def __init__(self, fn, *args):
+        try:
+            self.value, self.error = fn(*args), None
+        except Exception as e:
+            self.value, self.error = None, e
+
+    def ready(self):
+        return True
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def export(conn, patterns, earliest, latest, directory, fmt='csv',
+           units=None, resolution=None, value_type='usage',
+           partition_days=DEFAULT_PARTITION_DAYS, workers=None,
+           processes=None):
+    """Export the values of the channels matching patterns to directory,
+    resuming the export there if there is one.
+
+    :param xylem.Connection conn: The connection configured to the API
+    :param list patterns: fnmatch patterns of slugs.
+    :param datetime earliest: from when to export values
+    :param datetime latest: up to (inclusive) when to export values
+    :param str directory: directory to export to.
+    :param str fmt: Default 'csv', one of FORMATS.
+    :param list units: Default None, units to export; each channel's own
+        unit if None.
+    :param int resolution: Default None, seconds between points; the
+        server's default if None.
+    :param str value_type: Default 'usage'.
+    :param int partition_days: Default DEFAULT_PARTITION_DAYS, days of each
+        channel's values per request and file.
+    :param int workers: Default DEFAULT_WORKERS, partitions fetched at once.
+    :param int processes: Default the number of CPUs, processes decoding
+        and writing partitions; 0 to do so in this process.
+    :rtype dict: {'written': partitions written, 'skipped': partitions
+        already written, 'failed': {partition key: error message}}
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format {0}, not one of {1}".format(
+            fmt, ', '.join(FORMATS)))
+    if fmt == 'npz':
+        _numpy()
+    elif fmt == 'parquet':
+        _pyarrow()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest = Manifest(directory, {
+        'patterns': list(patterns),
+        'earliest': earliest.isoformat(),
+        'latest': latest.isoformat(),
+        'format': fmt,
+        'units': units,
+        'resolution': resolution,
+        'value_type': value_type,
+        'partition_days': partition_days,
+    })
+    if manifest.slugs is None:
+        manifest.set_slugs(resolve_slugs(conn, patterns, workers))
+
+    params = {'value_type': value_type}
+    if units:
+        params['units'] = ','.join(units)
+    if resolution:
+        params['resolution'] = resolution
+    parts = partitions(manifest.slugs, earliest, latest, partition_days)
+    todo = [p for p in parts if partition_key(*p) not in manifest.completed]
+    summary = {'written': 0, 'skipped': len(parts) - len(todo), 'failed': {}}
+    if not todo:
+        return summary
+    for slug in set(slug for slug, _, _ in todo):
+        if not os.path.isdir(os.path.join(directory, slug)):
+            os.makedirs(os.path.join(directory, slug))
+
+    def fetch(part):
+        slug, start, end = part
+        try:
+            r = conn.get(conn.services['channel'], params=dict(
+                params, slug=slug, values__earliest=start.isoformat(),
+                values__latest=end.isoformat()))
+            if r.status_code != 200:
+                raise APIError(
+                    "API Error: ({0}) {1}".format(r.status_code, r.content))
+            return part, r.headers.get('Content-Type'), r.content, None
+        except Exception as e:
+            return part, None, None, e
+
+    # Each partition holds a slot from being fetched until it is written,
+    # so fetching can't run far ahead of the writers.
+    workers = workers or DEFAULT_WORKERS
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    slots = threading.Semaphore(workers + 2 * max(processes, 1))
+
+    def throttled():
+        for part in todo:
+            slots.acquire()
+            yield part
+
+    def finish(part, result):
+        key = partition_key(*part)
+        try:
+            points = result.get()
+        except Exception as e:
+            fail(part, e)
+        else:
+            manifest.record(key, partition_path(part[0], part[1], fmt), points)
+            summary['written'] += 1
+        slots.release()
+
+    def fail(part, e):
+        key = partition_key(*part)
+        log.error('Failed to export {0}: {1}'.format(key, e))
+        summary['failed'][key] = str(e)
+
+    fetchers = ThreadPool(workers)
+    writers = multiprocessing.Pool(processes) if processes else None
+    pending = deque()
+    try:
+        for part, content_type, content, error in fetchers.imap_unordered(
+                fetch, throttled()):
+            if error is not None:
+                fail(part, error)
+                slots.release()
+                continue
+            args = (
+                os.path.join(directory, partition_path(part[0], part[1], fmt)),
+                fmt, content_type, content)
+            if writers is None:
+                pending.append((part, _Done(write_partition, *args)))
+            else:
+                pending.append(
+                    (part, writers.apply_async(write_partition, args)))
+            while pending and (
+                    len(pending) > 2 * max(processes, 1) or
+                    pending[0][1].ready()):
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+    finally:
+        fetchers.terminate()
+        if writers is not None:
+            writers.terminate()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the history of channels to files, resumably.")
+    parser.add_argument('patterns', nargs='+', metavar='PATTERN',
+                        help='slug pattern, e.g. places.*.elec')
+    parser.add_argument('--earliest', required=True, type=parse_timestamp,
+                        help='ISO 8601 timestamp to export from')
+    parser.add_argument('--latest', required=True, type=parse_timestamp,
+                        help='ISO 8601 timestamp to export up to')
+    parser.add_argument('--out', required=True, help='directory to write to')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--units', help='comma-separated units')
+    parser.add_argument('--resolution', type=int,
+                        help='seconds between points')
+    parser.add_argument('--value-type', default='usage')
+    parser.add_argument('--partition-days', type=int,
+                        default=DEFAULT_PARTITION_DAYS)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='partitions fetched at once')
+    parser.add_argument('--processes', type=int,
+                        help='processes writing partitions, default one per '
+                             'CPU; 0 to write in this process')
+    parser.add_argument('--root', help='base URL of the API server')
+    parser.add_argument('--access-name',
+                        default=os.environ.get('XYLEM_ACCESS_NAME'),
+                        help='default $XYLEM_ACCESS_NAME')
+    parser.add_argument('--api-key', default=os.environ.get('XYLEM_API_KEY'),
+                        help='default $XYLEM_API_KEY')
+    args = parser.parse_args(argv)
+    if not args.access_name or not args.api_key:
+        parser.error('an access name and API key are needed')
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    with Connection(args.access_name, args.api_key, root=args.root,
+                    lazy=True) as conn:
+        try:
+            summary = export(
+                conn, args.patterns, args.earliest, args.latest, args.out,
+                fmt=args.format,
+                units=args.units.split(',') if args.units else None,
+                resolution=args.resolution, value_type=args.value_type,
+                partition_days=args.partition_days, workers=args.workers,
+                processes=args.processes)
+        except ValueError as e:
+            parser.error(str(e))
+    log.info('{0} partitions written, {1} already written, {2} failed'.format(
+        summary['written'], summary['skipped'], len(summary['failed'])))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Follow live channels, yielding only the points added since last asked.
+
+    for slug, timestamp, value in conn.follow(slugs):
+        ...
+
+Each channel has a high-water mark, the timestamp of the last point yielded,
+and is only asked for points after it. Channels due to be polled are read
+together with slug__in, and each channel is polled about as often as it
+gains points: sooner after new points arrive, less often while none do.
+
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+from xylem.connection import batch_slugs
+from xylem.parallel import map_bounded
+from xylem.timestamps import parse_timestamps
+
+DEFAULT_INTERVAL = 5 # seconds between the first polls of each channel
+DEFAULT_MIN_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 300
+
+# Factor by which a channel's interval grows for each poll finding nothing.
+BACKOFF = 1.5
+
+# Weight of the newest point spacing in a channel's estimated spacing.
+SMOOTHING = 0.3
+
+log = logging.getLogger(__name__)
+
+
+class _Channel(object):
+    """Polling state of one followed channel."""
+
+    def __init__(self, slug, mark, interval):
+        self.slug = slug
+        self.mark = mark
+        self.interval = interval
+        self.spacing = None
+        self.due = 0
+
+
+class Follower(object):
+    """Iterate over (channel slug, timestamp, value) for new points, as
+    Connection.read_channel_latest_n_values gives them, until closed.
+    """
+
+    def __init__(self, conn, channel_slugs, since=None,
+                 interval=DEFAULT_INTERVAL, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, batch_size=None,
+                 workers=None, on_error=None, **kwargs):
+        """
+        :param xylem.Connection conn: The connection configured to the API
+        :param list channel_slugs: Slugs of channels to follow
+        :param datetime since: Default now, yield points after this.
+        :param float interval: Default DEFAULT_INTERVAL, seconds between the
+            first polls of each channel.
+        :param float min_interval: Default DEFAULT_MIN_INTERVAL, least seconds
+            between polls of a channel.
+        :param float max_interval: Default DEFAULT_MAX_INTERVAL, most seconds
+            between polls of a channel.
+        :param int batch_size: Default None, maximum channels per request.
+        :param int workers: Default DEFAULT_WORKERS, requests made at once.
+        :param callable on_error: Default None, called with (channel_slug,
+            error) when a channel can't be read; logged if None.
+        :param kwargs: extra kwargs to add to the params dict; value_type
+            defaults to 'usage', since accumulations are relative to the
+            start of each read.
+
+        """
+        if since is None:
+            since = datetime.utcnow().replace(microsecond=0, tzinfo=pytz.utc)
+        self.conn = conn
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self.on_error = on_error
+        self.params = dict({'value_type': 'usage'}, **kwargs)
+        self.channels = [
+            _Channel(slug, since, interval) for slug in channel_slugs]
+        self._closed = threading.Event()
+
+    def __iter__(self):
+        if not self.channels:
+            return
+        while not self._closed.is_set():
+            now = time.time()
+            due = [ch for ch in self.channels if ch.due <= now]
+            if not due:
+                self._closed.wait(
+                    min(ch.due for ch in self.channels) - now)
+                continue
+            for point in self.poll(due):
+                yield point
+
+    def close(self):
+        """Stop iterating, once any points already read are yielded."""
+        self._closed.set()
+
+    def poll(self, channels=None):
+        """Read the channels once, returning their new points.
+
+        :param list channels: Default all channels.
+        :rtype list: [(channel slug, timestamp, value), ...] in timestamp
+            order for each channel.
+
+        """
+        channels = sorted(
+            channels or self.channels, key=lambda ch: ch.mark)
+        by_slug = dict((ch.slug, ch) for ch in channels)
+        # Channels with marks within max_interval of each other are read
+        # together, from the oldest, so a channel that is behind (or never
+        # gains points) doesn't have its batch mates' history read again.
+        batches = []
+        run = []
+        for ch in channels:
+            if run and (ch.mark - run[0].mark).total_seconds() > \
+                    self.max_interval:
+                batches.extend(batch_slugs(
+                    [c.slug for c in run], self.batch_size))
+                run = []
+            run.append(ch)
+        if run:
+            batches.extend(batch_slugs([c.slug for c in run], self.batch_size))
+        latest = datetime.utcnow().replace(tzinfo=pytz.utc)
+        points = []
+        for results, errors in map_bounded(
+                lambda batch: self._read(
+                    batch, by_slug[batch[0]].mark, latest),
+                batches, self.workers):
+            for slug, error in errors.items():
+                self._update(by_slug[slug], [])
+                if self.on_error is not None:
+                    self.on_error(slug, error)
+                else:
+                    log.error('Failed to follow {0}: {1}'.format(slug, error))
+            for slug, values in results.items():
+                ch = by_slug[slug]
+                new = [(ts, v) for ts, v in values if ts > ch.mark]
+                self._update(ch, new)
+                points.extend((slug, ts, v) for ts, v in new)
+        return points
+
+    def _read(self, channel_slugs, earliest, latest):
+        params = dict(
+            self.params,
+            values__earliest=earliest.isoformat(),
+            values__latest=latest.isoformat(),
+        )
+        return self.conn._read_channel_batch(
+            channel_slugs, params, 'values', _parse)
+
+    def _update(self, ch, new):
+        """Move a channel's mark past its new points, and reschedule it."""
+        if new:
+            spacing = (
+                (new[-1][0] - ch.mark).total_seconds() / len(new))
+            if ch.spacing is None:
+                ch.spacing = spacing
+            else:
+                ch.spacing += SMOOTHING * (spacing - ch.spacing)
+            ch.mark = new[-1][0]
+            ch.interval = ch.spacing
+        else:
+            ch.interval *= BACKOFF
+        ch.interval = min(max(ch.interval, self.min_interval),
+                          self.max_interval)
+        ch.due = time.time() + ch.interval
+
+
+def _parse(values, units):
+    timestamps = parse_timestamps([ts for ts, _ in values])
+    return [(ts, v) for ts, (_, v) in zip(timestamps, values)]
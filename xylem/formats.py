@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Wire formats, registered by content type.
+
+Connection(format=[...]) asks the server for the formats given, in order of
+preference, and decodes each response by the content type it comes back
+with, so a server that only speaks JSON still works. Writes are encoded in
+the most preferred format the server has answered in, falling back to JSON.
+
+Register other formats with register_codec().
+
+"""
+import csv
+import io
+import json
+from collections import OrderedDict
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+CSV = 'text/csv'
+
+
+class Codec(object):
+    """Encoding and decoding of one content type.
+
+    Codecs which can't encode every document (CSV holds only value arrays)
+    set can_encode False, and are only used for responses.
+
+    """
+    content_type = None
+    can_encode = True
+
+    def encode(self, document):
+        """Return document as bytes."""
+        raise NotImplementedError
+
+    def decode(self, content):
+        """Return the document encoded in content, bytes."""
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    content_type = JSON
+
+    def encode(self, document):
+        return json.dumps(document).encode('utf-8')
+
+    def decode(self, content):
+        return json.loads(content.decode('utf-8'))
+
+
+class MsgpackCodec(Codec):
+    """MessagePack (pip install xylem[msgpack])."""
+    content_type = MSGPACK
+
+    def encode(self, document):
+        return _msgpack().packb(document, use_bin_type=False)
+
+    def decode(self, content):
+        return _msgpack().unpackb(content, raw=False)
+
+
+class CSVCodec(Codec):
+    """Value arrays as CSV, a header of slug, unit, value_type, timestamp
+    and the units, then a row per point. Each channel's unit and value type
+    are given on its first row only, and a channel without values has a
+    single row without a timestamp. Decodes to the same document as a JSON
+    value read.
+    """
+    content_type = CSV
+    can_encode = False
+
+    def decode(self, content):
+        if str is not bytes:
+            content = content.decode('utf-8')
+        rows = csv.reader(content.splitlines())
+        header = next(rows)
+        ts_ix = header.index('timestamp')
+        units = header[ts_ix + 1:]
+        fields = [
+            (ix, name) for ix, name in enumerate(header[:ts_ix])
+            if name in ('unit', 'value_type')]
+        objects = OrderedDict()
+        for row in rows:
+            if row[0] not in objects:
+                objects[row[0]] = {
+                    'slug': row[0], 'unit': units[0], 'values': []}
+                objects[row[0]].update(
+                    (name, row[ix]) for ix, name in fields if row[ix])
+            if not row[ts_ix]:
+                continue
+            values = [_number(v) for v in row[ts_ix + 1:]]
+            objects[row[0]]['values'].append(
+                [row[ts_ix], values if len(units) > 1 else values[0]])
+        return {
+            'meta': {'units': units, 'total_count': len(objects)},
+            'objects': list(objects.values()),
+        }
+
+    @staticmethod
+    def encode_values(units, objects):
+        """Encode the channels of a value read, as a server would.
+
+        :param list units: units of the values.
+        :param list objects: channel dicts with their 'values', and maybe
+            their 'unit' and 'value_type'.
+        :rtype bytes:
+
+        """
+        # The csv module works in bytes on Python 2, and text on 3.
+        out = io.BytesIO() if str is bytes else io.StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(
+            ['slug', 'unit', 'value_type', 'timestamp'] + list(units))
+        for ch in objects:
+            first = [ch.get('unit') or '', ch.get('value_type') or '']
+            if not ch['values']:
+                writer.writerow([ch['slug']] + first + [''] * (len(units) + 1))
+            for ts, value in ch['values']:
+                if len(units) == 1:
+                    value = [value]
+                writer.writerow([ch['slug']] + first + [ts] + [
+                    '' if v is None else repr(float(v)) for v in value])
+                first = ['', '']
+        content = out.getvalue()
+        return content if str is bytes else content.encode('utf-8')
+
+
+def _number(text):
+    return None if text == '' else float(text)
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError(
+            "The msgpack format needs msgpack: pip install xylem[msgpack]")
+    return msgpack
+
+
+CODECS = OrderedDict()
+
+
+def register_codec(codec):
+    """Make a codec available by its content type.
+
+    :param Codec codec: the codec.
+
+    """
+    CODECS[codec.content_type] = codec
+
+
+def codec_for(content_type):
+    """Return the codec for a content type, or None.
+
+    :param str content_type: a Content-Type header; parameters are ignored.
+
+    """
+    return CODECS.get((content_type or '').split(';')[0].strip().lower())
+
+
+def accept_header(formats):
+    """Accept header asking for formats in order of preference, with JSON
+    last if it isn't among them.
+
+    :param list formats: content types.
+    :rtype str:
+
+    """
+    formats = list(formats)
+    if JSON not in formats:
+        formats.append(JSON)
+    if len(formats) == 1:
+        return formats[0]
+    return ', '.join(
+        content_type if ix == 0 else '{0};q={1:.1f}'.format(
+            content_type, max(0.1, 1 - 0.1 * ix))
+        for ix, content_type in enumerate(formats))
+
+
+for _codec in [JSONCodec(), MsgpackCodec(), CSVCodec()]:
+    register_codec(_codec)
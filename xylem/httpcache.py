@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""In-process cache of metadata responses: channel listings, datausers and
+the service map.
+
+    cache = ResponseCache(ttls={'channel': 60})
+    conn = Connection(name, key, response_cache=cache)
+
+A cached response is used as it is for its endpoint's TTL. After that, if
+the server gave it an ETag or Last-Modified, it is revalidated with a
+conditional GET, and kept if the server answers 304 Not Modified; otherwise
+it is fetched again. A write (patch or post) through a Connection using the
+cache drops the responses of the collection written to.
+
+One cache may be shared by any number of Connections, and threads; each
+access name has its own responses.
+
+"""
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1000
+
+# Seconds for which a response of each endpoint is used without asking the
+# server; 'root' is the service map.
+DEFAULT_TTLS = {
+    'root': 60 * 60,
+    'channel': 60 * 5,
+    'datauser': 60,
+}
+
+
+class _Entry(object):
+
+    def __init__(self, response):
+        self.response = response
+        self.stored = time.time()
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+
+class ResponseCache(object):
+    """Least recently used cache of 200 OK GET responses."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttls=None):
+        """
+        :param int max_entries: Default DEFAULT_MAX_ENTRIES, responses kept.
+        :param dict ttls: Default DEFAULT_TTLS, seconds for which responses
+            of each endpoint ('root', 'channel' or 'datauser') are used
+            without revalidation; given ones replace the defaults.
+
+        """
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, endpoint, fetch, revalidate=False):
+        """Return the response for key, from the cache if it can be.
+
+        :param tuple key: identifies the request, see Connection.
+        :param str endpoint: name of the endpoint, to look up its TTL.
+        :param callable fetch: makes the request, given a dict of the
+            conditional headers to send with it.
+        :param bool revalidate: Default False, set to ask the server even if
+            the cached response is within its TTL.
+        :rtype requests.Response:
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.pop(key)
+                self._entries[key] = entry
+                if not revalidate and \
+                        time.time() - entry.stored < self.ttls.get(endpoint, 0):
+                    self.hits += 1
+                    return entry.response
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        r = fetch(headers)
+        with self._lock:
+            if r.status_code == 304 and entry is not None:
+                self.revalidated += 1
+                entry.stored = time.time()
+                return entry.response
+            self.misses += 1
+            if r.status_code == 200:
+                self._entries.pop(key, None)
+                self._entries[key] = _Entry(r)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return r
+
+    def invalidate(self, prefix):
+        """Drop the responses of URLs starting with prefix, whichever access
+        name they were given to, as a write may change what any can see.
+
+        :param str prefix: URL prefix.
+
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[2].startswith(prefix):
+                    del self._entries[key]
+
+    def clear(self):
+        """Drop every response."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Hooks reporting where the time in API calls goes, and metrics built on
+them.
+
+Pass an Instrumentation to Connection(instrumentation=...) to have it told
+about every request and about the time spent decoding and parsing the
+responses. With none set, the connection only checks for None.
+
+"""
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+# Upper bounds of latency histogram buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# One request made by a Connection, including any retries of it.
+#
+# elapsed is the seconds from the first attempt being sent to the last
+# response being read, wait the seconds of that last attempt spent waiting
+# for the response headers (None if unknown), and the rest of it was spent
+# receiving the body. status_code is None, and error is set, if no response
+# was received.
+RequestEvent = namedtuple('RequestEvent', [
+    'method', 'endpoint', 'status_code', 'elapsed', 'wait', 'retries',
+    'hedged', 'bytes_sent', 'bytes_received', 'error',
+])
+
+
+class Instrumentation(object):
+    """Base class of instrumentation, ignoring everything it is told.
+
+    Subclass it, overriding the methods of interest.
+
+    """
+
+    def request(self, event):
+        """Called once each request has been made, or has failed.
+
+        :param RequestEvent event: what happened.
+
+        """
+
+    def phase(self, name, seconds):
+        """Called with the time taken by work done on responses.
+
+        :param str name: 'decode' for JSON decoding, 'parse' for turning
+            values into dicts or TimeSeries.
+        :param float seconds: time taken.
+
+        """
+
+
+class Histogram(object):
+    """Counts of observations falling in fixed buckets, and their sum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(upper bound, observations at most that), ...], ending with
+        float('inf').
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics(Instrumentation):
+    """In-process counters and latency histograms, for an exporter to read
+    with snapshot() or serve as prometheus() text.
+
+    Counters are keyed by (name, labels), labels being a tuple of
+    (label, value) pairs; histograms likewise.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param tuple buckets: Default DEFAULT_BUCKETS, upper bounds of the
+            latency histogram buckets, in seconds.
+
+        """
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def request(self, event):
+        status = 'error' if event.status_code is None \
+            else str(event.status_code)
+        labels = (('method', event.method), ('status', status))
+        method = (('method', event.method),)
+        with self._lock:
+            self._count('requests', labels)
+            self._count('retries', method, event.retries)
+            self._count('hedged', method, int(bool(event.hedged)))
+            self._count('bytes_sent', method, event.bytes_sent)
+            self._count('bytes_received', method, event.bytes_received)
+            self._observe('request_seconds', method, event.elapsed)
+            if event.wait is not None:
+                self._observe('wait_seconds', method, event.wait)
+
+    def phase(self, name, seconds):
+        with self._lock:
+            self._observe('phase_seconds', (('phase', name),), seconds)
+
+    def snapshot(self):
+        """Return a copy of the current values.
+
+        :rtype dict: {'counters': {(name, labels): value},
+            'histograms': {(name, labels): {'buckets': [(bound, count)],
+            'sum': float, 'count': int}}}
+
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict(
+                    (key, {
+                        'buckets': h.cumulative(),
+                        'sum': h.sum,
+                        'count': h.count,
+                    })
+                    for key, h in self.histograms.items()),
+            }
+
+    def prometheus(self, prefix='xylem'):
+        """Return the current values in the Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = []
+        for (name, labels), value in sorted(snapshot['counters'].items()):
+            lines.append('{0}_{1}_total{2} {3}'.format(
+                prefix, name, _labels(labels), value))
+        for (name, labels), h in sorted(snapshot['histograms'].items()):
+            for bound, count in h['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_{1}_bucket{2} {3}'.format(
+                    prefix, name, _labels(labels + (('le', le),)), count))
+            lines.append('{0}_{1}_sum{2} {3!r}'.format(
+                prefix, name, _labels(labels), h['sum']))
+            lines.append('{0}_{1}_count{2} {3}'.format(
+                prefix, name, _labels(labels), h['count']))
+        return '\n'.join(lines) + '\n'
+
+    def _count(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        key = (name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets)
+        self.histograms[key].observe(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(label, value) for label, value in labels) + '}'
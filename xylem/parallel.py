@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Helpers for running blocking API calls concurrently."""
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+DEFAULT_WORKERS = 4
+
+# The deadline of the calls being made by each thread, if any.
+_context = threading.local()
+
+
+@contextmanager
+def deadline(seconds):
+    """Give every request made in this block, including those made on other
+    threads by map_bounded, `seconds` in all.
+
+    A deadline inside another can shorten it but not extend it.
+
+    :param float seconds: the budget, from now.
+
+    """
+    outer = getattr(_context, 'deadline', None)
+    due = time.time() + seconds
+    if outer is not None:
+        due = min(due, outer)
+    _context.deadline = due
+    try:
+        yield
+    finally:
+        _context.deadline = outer
+
+
+def remaining():
+    """Seconds left before the current deadline, or None if there isn't one.
+    """
+    due = getattr(_context, 'deadline', None)
+    if due is None:
+        return None
+    return due - time.time()
+
+
+def _with_deadline(fn):
+    """Wrap fn to run under the calling thread's deadline on any thread."""
+    due = getattr(_context, 'deadline', None)
+    if due is None:
+        return fn
+
+    def call(*args):
+        _context.deadline = due
+        try:
+            return fn(*args)
+        finally:
+            _context.deadline = None
+
+    return call
+
+
+def map_bounded(fn, items, workers=None):
+    """Apply fn to each of items on at most `workers` threads.
+
+    :param callable fn: function of one argument.
+    :param iterable items: arguments to call fn with.
+    :param int workers: Default DEFAULT_WORKERS, maximum concurrent calls.
+    :rtype list: fn(item) for each item, in the order of items.
+    :raises: the first exception raised by any call of fn.
+
+    """
+    items = list(items)
+    workers = min(workers or DEFAULT_WORKERS, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(_with_deadline(fn), items, chunksize=1)
+    finally:
+        pool.terminate()
+
+
+class RateLimiter(object):
+    """Space out calls from any number of threads to at most `rate` a second.
+    """
+
+    def __init__(self, rate):
+        """
+        :param float rate: maximum calls per second.
+
+        """
+        self.interval = 1.0 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def first_completed(fn, delay):
+    """Call fn, and call it again if it hasn't returned after delay seconds;
+    return the result of whichever call succeeds first.
+
+    The other call's result is closed, if it has a close method, when it
+    comes, so a streamed response doesn't hold its pooled connection.
+
+    :param callable fn: function of no arguments, safe to call twice.
+    :param float delay: seconds to wait for the first call.
+    :raises: the exception of the last call to fail, if both fail.
+
+    """
+    results = queue.Queue()
+    fn = _with_deadline(fn)
+    lock = threading.Lock()
+    done = []
+
+    def run():
+        try:
+            result = fn()
+        except Exception as e:
+            results.put((False, e))
+            return
+        with lock:
+            if not done:
+                results.put((True, result))
+                return
+        _close(result)
+
+    def start():
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    start()
+    try:
+        ok, result = results.get(timeout=delay)
+        calls = 1
+    except queue.Empty:
+        start()
+        ok, result = results.get()
+        calls = 2
+    if not ok and calls == 2:
+        ok, result = results.get()
+    if not ok:
+        raise result
+    with lock:
+        done.append(True)
+    # The other call may have succeeded before the winner was taken.
+    while True:
+        try:
+            late_ok, late = results.get_nowait()
+        except queue.Empty:
+            break
+        if late_ok:
+            _close(late)
+    return result
+
+
+def _close(result):
+    """Close the result of a call that lost the race, if it can be."""
+    close = getattr(result, 'close', None)
+    if close is not None:
+        close()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Resample a TimeSeries to a coarser resolution, without another request.
+
+Read the finest resolution needed once, then roll it up::
+
+    series = conn.read_channel_values(slug, earliest, latest,
+                                      as_timeseries=True)
+    daily = series.resample('day', tz='Europe/London')
+    weekly = series.resample('week', tz='Europe/London')
+
+Each coarse period runs from just after one boundary up to and including
+the next, and its point is stamped at its end, as the API stamps usage.
+Usage is summed over each period, accumulations are sampled at the end of
+each period, and anything else is averaged. Periods at the ends of the
+series may be partial.
+
+"""
+from datetime import date, datetime, timedelta
+
+import pytz
+
+from xylem.timeseries import TimeSeries, _numpy, to_epoch
+
+DAY = 60 * 60 * 24
+
+CALENDAR_RESOLUTIONS = ('day', 'week', 'month')
+
+
+def boundaries(first, last, resolution, tz=None):
+    """Epoch seconds of the period boundaries around first to last.
+
+    :param int first: the earliest timestamp to cover.
+    :param int last: the latest timestamp to cover.
+    :param resolution: seconds per period, or 'day', 'week' (from Monday)
+        or 'month'.
+    :param tz: Default None, timezone (or its name) whose calendar periods
+        are aligned to; periods are aligned to the epoch, in UTC, if None.
+    :rtype numpy.ndarray: ascending boundaries, the first before first and
+        the last at or after last.
+
+    """
+    np = _numpy()
+    if tz is None and resolution not in CALENDAR_RESOLUTIONS:
+        start = (first - 1) // resolution * resolution
+        stop = -(-last // resolution) * resolution
+        return np.arange(start, stop + resolution, resolution, dtype='int64')
+    if resolution not in CALENDAR_RESOLUTIONS and (
+            DAY % resolution if resolution < DAY else resolution % DAY):
+        raise ValueError(
+            "Calendar periods must divide a day or be whole days, not "
+            "{0} seconds".format(resolution))
+    if tz is None:
+        tz = pytz.utc
+    elif not hasattr(tz, 'localize'):
+        tz = pytz.timezone(tz)
+
+    day = datetime.fromtimestamp(int(first) - 1, tz).date()
+    if resolution == 'week':
+        day -= timedelta(days=day.weekday())
+    elif resolution == 'month':
+        day = day.replace(day=1)
+    elif resolution not in CALENDAR_RESOLUTIONS and resolution > DAY:
+        days = resolution // DAY
+        day = date.fromordinal(day.toordinal() // days * days)
+    bounds = []
+    while True:
+        midnight = _midnight(tz, day)
+        day = _next_day(day, resolution)
+        if resolution in CALENDAR_RESOLUTIONS or resolution >= DAY:
+            bounds.append(midnight)
+        else:
+            bounds.extend(range(midnight, _midnight(tz, day), resolution))
+        if bounds[-1] >= last:
+            return np.asarray(bounds, dtype='int64')
+
+
+def _midnight(tz, day):
+    return to_epoch(tz.localize(datetime(day.year, day.month, day.day)))
+
+
+def _next_day(day, resolution):
+    """The day on which the next period (or, below a day, day) starts."""
+    if resolution == 'month':
+        if day.month == 12:
+            return date(day.year + 1, 1, 1)
+        return date(day.year, day.month + 1, 1)
+    if resolution == 'week':
+        return day + timedelta(days=7)
+    if resolution == 'day' or resolution < DAY:
+        return day + timedelta(days=1)
+    return day + timedelta(days=resolution // DAY)
+
+
+def resample(series, resolution, tz=None):
+    """Roll a TimeSeries up into coarser periods.
+
+    :param TimeSeries series: the values, with a value_type.
+    :param resolution: seconds per period, or 'day', 'week' (from Monday)
+        or 'month'.
+    :param tz: Default None, timezone (or its name) whose calendar the
+        periods follow; periods are aligned to the epoch, in UTC, if None.
+    :rtype TimeSeries:
+
+    """
+    np = _numpy()
+    if series.value_type is None:
+        raise ValueError("Can't resample values of unknown value_type")
+    if not len(series):
+        return series
+    if series.value_type == 'accum':
+        origin = series[:1]
+        usage = resample(series.to_usage(), resolution, tz)
+        columns = []
+        for unit, values in usage.columns.items():
+            accum = np.cumsum(np.nan_to_num(values))
+            accum[np.isnan(values)] = np.nan
+            columns.append((unit, np.concatenate(
+                [origin.columns[unit], origin.columns[unit] + accum])))
+        return TimeSeries(
+            np.concatenate([origin.timestamps, usage.timestamps]),
+            columns, 'accum')
+
+    timestamps = series.timestamps
+    bounds = boundaries(timestamps[0], timestamps[-1], resolution, tz)
+    # Period ix ends at bounds[ix], holding bounds[ix - 1] < t <= bounds[ix].
+    periods = np.searchsorted(bounds, timestamps, side='left')
+    used = np.unique(periods)
+    columns = []
+    for unit, values in series.columns.items():
+        present = ~np.isnan(values)
+        totals = np.bincount(
+            periods, weights=np.where(present, values, 0),
+            minlength=len(bounds))[used]
+        counts = np.bincount(
+            periods, weights=present, minlength=len(bounds))[used]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if series.value_type == 'usage':
+                rolled = np.where(counts > 0, totals, np.nan)
+            else:
+                rolled = totals / counts
+        columns.append((unit, rolled))
+    return TimeSeries(bounds[used], columns, series.value_type)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Append-only local store of channel history, read by memory mapping.
+
+    store = SeriesStore('/data/xylem')
+    store.fill(conn, 'places.947.gas', earliest, latest, units=['kWh'])
+    timestamps, values = store.read('places.947.gas', 'kWh', earliest, latest)
+
+Each channel and unit has its own file, DIRECTORY/<slug>/<unit>.qd, of
+16 byte records: int64 seconds since the epoch then float64 value, little
+endian (struct '<qd'), in ascending time order. Reads map the file and
+return numpy views on it, found by binary search on time, so nothing is
+parsed or copied; scanning many channels runs at the speed of the disk.
+
+Records are only ever appended after the last one, so a file is always
+valid, bar a record cut short by a crash, which is ignored.
+
+"""
+import mmap
+import os
+
+from xylem.timeseries import TimeSeries, _numpy, from_epoch, to_epoch
+
+RECORD_SIZE = 16
+SUFFIX = '.qd'
+
+
+def _record(np):
+    return np.dtype([('timestamp', '<i8'), ('value', '<f8')])
+
+
+class SeriesStore(object):
+    """A directory of memory-mapped channel histories (needs numpy)."""
+
+    def __init__(self, directory):
+        """
+        :param str directory: directory of the store, made if missing.
+
+        """
+        self.np = _numpy()
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, channel_slug, unit):
+        return os.path.join(self.directory, channel_slug, unit + SUFFIX)
+
+    def slugs(self):
+        """Slugs of the channels stored, sorted."""
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name)))
+
+    def units(self, channel_slug):
+        """Units stored of a channel, sorted."""
+        directory = os.path.join(self.directory, channel_slug)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            name[:-len(SUFFIX)] for name in os.listdir(directory)
+            if name.endswith(SUFFIX))
+
+    def records(self, channel_slug, unit):
+        """All records of a channel's unit, mapped from its file.
+
+        :rtype numpy.ndarray: read-only records with 'timestamp' and 'value'
+            fields; empty if there are none.
+
+        """
+        np = self.np
+        path = self.path(channel_slug, unit)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        count = size // RECORD_SIZE
+        if not count:
+            return np.zeros(0, dtype=_record(np))
+        with open(path, 'rb') as f:
+            # The mapping outlives the file object, and is closed once no
+            # array uses it.
+            mapped = mmap.mmap(f.fileno(), count * RECORD_SIZE,
+                               access=mmap.ACCESS_READ)
+        return np.frombuffer(mapped, dtype=_record(np), count=count)
+
+    def read(self, channel_slug, unit, earliest=None, latest=None):
+        """A channel's values from earliest to latest (inclusive).
+
+        :param datetime earliest: Default None, from the first record.
+        :param datetime latest: Default None, to the last record.
+        :rtype (numpy.ndarray, numpy.ndarray): (int64 seconds since the
+            epoch, float64 values), views on the mapped file.
+
+        """
+        records = self.records(channel_slug, unit)
+        timestamps = records['timestamp']
+        start = 0 if earliest is None else self.np.searchsorted(
+            timestamps, to_epoch(earliest), side='left')
+        end = len(records) if latest is None else self.np.searchsorted(
+            timestamps, to_epoch(latest), side='right')
+        return timestamps[start:end], records['value'][start:end]
+
+    def read_series(self, channel_slug, units, earliest=None, latest=None,
+                    value_type=None):
+        """A channel's values in units as a TimeSeries.
+
+        :param list units: units to read, which must have been stored for
+            the same timestamps, as fill() does.
+        :param str value_type: Default None, that of the values stored.
+        :rtype TimeSeries:
+        :raises: ValueError if the units' timestamps differ.
+
+        """
+        timestamps = None
+        columns = []
+        for unit in units:
+            stamps, values = self.read(channel_slug, unit, earliest, latest)
+            if timestamps is None:
+                timestamps = stamps
+            elif not self.np.array_equal(stamps, timestamps):
+                raise ValueError(
+                    "{0} has different timestamps in {1} and {2}".format(
+                        channel_slug, units[0], unit))
+            columns.append((unit, values))
+        if timestamps is None:
+            timestamps = self.np.zeros(0, dtype='int64')
+        return TimeSeries(timestamps, columns, value_type)
+
+    def latest(self, channel_slug, unit):
+        """Timestamp of a channel's last record, or None."""
+        records = self.records(channel_slug, unit)
+        if not len(records):
+            return None
+        return from_epoch(int(records['timestamp'][-1]))
+
+    def append(self, channel_slug, unit, timestamps, values):
+        """Append values after a channel's last record.
+
+        Points at or before the last record are skipped, so ranges can be
+        appended again safely.
+
+        :param timestamps: ascending seconds since the epoch.
+        :param values: a value for each timestamp, NaN if missing.
+        :rtype int: the number of records appended.
+
+        """
+        np = self.np
+        timestamps = np.asarray(timestamps, dtype='int64')
+        values = np.asarray(values, dtype='float64')
+        if len(timestamps) > 1 and np.any(np.diff(timestamps) <= 0):
+            raise ValueError("Timestamps must be strictly ascending")
+        existing = self.records(channel_slug, unit)
+        if len(existing):
+            new = timestamps > existing['timestamp'][-1]
+            timestamps, values = timestamps[new], values[new]
+        if not len(timestamps):
+            return 0
+        records = np.empty(len(timestamps), dtype=_record(np))
+        records['timestamp'] = timestamps
+        records['value'] = values
+
+        path = self.path(channel_slug, unit)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'ab') as f:
+            # Drop any record cut short, so records stay aligned.
+            f.truncate(len(existing) * RECORD_SIZE)
+            f.write(records.tobytes())
+        return len(records)
+
+    def fill(self, conn, channel_slug, earliest, latest, units=None,
+             value_type='usage', **kwargs):
+        """Read a channel's values with read_channel_values and append them,
+        starting from the last record already stored, if later.
+
+        :param xylem.Connection conn: The connection configured to the API
+        :param str channel_slug: Slug of channel to read
+        :param datetime earliest: from when to read values
+        :param datetime latest: up to (inclusive) when to read values
+        :param list units: Default None, units to read; the channel's own
+            unit if None. Reading resumes from the units' earliest last
+            record (those stored, if None).
+        :param str value_type: Default 'usage', since accumulations are
+            relative to the start of each fill.
+        :param kwargs: passed to read_channel_values, e.g. resolution or
+            window_points.
+        :rtype int: the number of points appended.
+
+        """
+        stored = [self.latest(channel_slug, unit)
+                  for unit in units or self.units(channel_slug)]
+        if stored and all(stored):
+            earliest = max(earliest, min(stored))
+        if earliest >= latest:
+            return 0
+        if units:
+            kwargs['units'] = ','.join(units)
+        series = conn.read_channel_values(
+            channel_slug, earliest, latest, as_timeseries=True,
+            value_type=value_type, **kwargs)
+        appended = 0
+        for unit, values in series.columns.items():
+            appended = max(appended, self.append(
+                channel_slug, unit, series.timestamps, values))
+        return appended
@@ -14,18 +14,29 @@ class APIError(Exception):
 
 
 def discover_available_resources(conn, subject_id,
-                                 subject_type_plural='places'):
+                                 subject_type_plural='places',
+                                 catalogue=None):
     """Return a dictionary of channels keyed by the resource slug.
 
     :param xylem.Connection conn: The connection configured to the API
     :param int subject_id: ID of the subject to locate.
     :param str subject_type_plural: Default: 'places'.
+    :param xylem.catalogue.ChannelCatalogue catalogue: Default None, a
+        catalogue to find the channels in instead of listing them.
     :rtype dict: Resource-keyed channel info (such as {'elec': {...}})
 
     """
-    resources = {}
     channel_root = ".".join([subject_type_plural, str(subject_id)]) + '.'
-    channels = conn.list_channels(slug__startswith=channel_root)
+    if catalogue is not None:
+        channels = catalogue.startswith(channel_root)
+    else:
+        channels = conn.list_channels(slug__startswith=channel_root)
+    return _resources(channel_root, channels)
+
+
+def _resources(channel_root, channels):
+    """Key channels under channel_root by the rest of their slug."""
+    resources = {}
     for slug, ch in channels.items():
         resource_slug = slug[slug.index(channel_root) + len(channel_root):]
         resources[resource_slug] = ch
@@ -34,7 +45,7 @@ def discover_available_resources(conn, subject_id,
 
 
 def write_app_event(conn, app_slug, event_slug, event_data, subject_id,
-                    subject_type_plural='communities'):
+                    subject_type_plural='communities', writer=None):
     """Write event_data to the subject's event_slug channel.
 
     :param xylem.Connection conn: The connection configured to the API.
@@ -43,26 +54,43 @@ def write_app_event(conn, app_slug, event_slug, event_data, subject_id,
     :param dict event_data: key-value of data that describes this event.
     :param int subject_id: ID of the subject about which this event is made.
     :param str subject_type_plural: Default: 'communities'
+    :param xylem.batch.BatchWriter writer: Default None, a writer to queue
+        the event with instead of writing it now; errors are then reported
+        by the writer.
 
     """
+    channel_slug, values = _app_event(
+        app_slug, event_slug, event_data, subject_id, subject_type_plural)
+    if writer is not None:
+        for timestamp, value in values:
+            writer.write(channel_slug, timestamp, value)
+        return
+    code, message = conn.write_channel_values(channel_slug, values)
+    if code != 202:
+        raise APIError("API Error (Code: {0}): {1}".format(code, message))
+
+
+def _app_event(app_slug, event_slug, event_data, subject_id,
+               subject_type_plural):
+    """Channel slug and values to write an app event now."""
     channel_slug = ".".join([
         subject_type_plural, str(subject_id),
         'apps', app_slug, 'events', event_slug,
     ])
     now = datetime.utcnow().replace(tzinfo=pytz.utc)
-    code, message = conn.write_channel_values(
-        channel_slug, [(now.isoformat(), event_data)])
-    if code != 202:
-        raise APIError("API Error (Code: {0}): {1}".format(code, message))
+    return channel_slug, [(now.isoformat(), event_data)]
 
 
 def discover_installed_apps(conn, subject_id,
-                            subject_type_plural='communities'):
+                            subject_type_plural='communities',
+                            catalogue=None):
     """Return a list of app slugs installed, and visible, on this subject.
 
     :param xylem.Connection conn: The connection configured to the API
     :param int subject_id: ID of the subject to locate.
     :param str subject_type_plural: Default: 'communities'.
+    :param xylem.catalogue.ChannelCatalogue catalogue: Default None, a
+        catalogue to find the channels in instead of listing them.
     :rtype dict: keys are app slugs, values are channels dicts keyed by slug
         available in that app
 
@@ -73,19 +101,26 @@ def discover_installed_apps(conn, subject_id,
     channel_root = ".".join([
         subject_type_plural, str(subject_id), 'apps'
     ]) + '.'
+    if catalogue is not None:
+        return _apps(channel_root, catalogue.startswith(channel_root))
     try:
         channels = conn.list_channels(slug__startswith=channel_root)
-        apps = defaultdict(dict)
-        for slug, ch in channels.items():
-            app_part = slug[slug.index(channel_root) + len(channel_root):]
-            app_slug = app_part.split('.')[0]
-            apps[app_slug][slug] = ch
-
-        return apps
+        return _apps(channel_root, channels)
     except HttpError as e:
         raise APIError("API Error: {0}".format(e))
 
 
+def _apps(channel_root, channels):
+    """Group channels under channel_root by the app slug that follows it."""
+    apps = defaultdict(dict)
+    for slug, ch in channels.items():
+        app_part = slug[slug.index(channel_root) + len(channel_root):]
+        app_slug = app_part.split('.')[0]
+        apps[app_slug][slug] = ch
+
+    return apps
+
+
 def minimum_data_presence_for_range(conn, earliest, latest, slug=None,
                                     subject_id=None, subject_type_plural=None,
                                     utilities=None):
@@ -107,6 +142,54 @@ def minimum_data_presence_for_range(conn, earliest, latest, slug=None,
     :raises: APIError in the case that either the request fails or isn't 200 OK
 
     """
+    slugs = _presence_slugs(slug, subject_id, subject_type_plural, utilities)
+    try:
+        resp = conn.get(
+            endpoint=conn.services['channel'],
+            params=_presence_params(earliest, latest, slugs)
+        )
+    except HttpError as e:
+        raise APIError("API Error: {}".format(e))
+
+    if resp.status_code != 200:
+        raise APIError(
+            "API Error: ({}) {}".format(resp.status_code, resp.content))
+
+    return _minimum_presence(conn.decode(resp), slugs)
+
+
+def data_presence_for_subjects(conn, earliest, latest, subject_ids,
+                               subject_type_plural=None, utilities=None,
+                               batch_size=None, workers=None):
+    """Return the data presence of many subjects' channels, period by period.
+
+    The channels are checked in concurrent batches, so thousands of subjects
+    take a few requests. Channels that can't be checked are returned with
+    their errors rather than raised.
+
+    :param xylem.Connection conn: The connection configured to the API
+    :param datetime earliest: from when to get presence values
+    :param datetime latest: up to (inclusive) when to get presence values
+    :param list subject_ids: IDs of the subjects to check
+    :param str subject_type_plural: Default: 'places'
+    :param list utilities: list of utilities (elec, gas, etc.) or None to
+        check each subject's own channel
+    :param int batch_size: Default None, maximum channels per request.
+    :param int workers: Default DEFAULT_WORKERS, maximum requests at once.
+    :rtype (dict, dict): ({slug: [(timestamp, presence 0 to 1), ...]},
+        {slug: APIError}) with each slug in one or the other.
+
+    """
+    slugs = []
+    for subject_id in subject_ids:
+        slugs.extend(_presence_slugs(
+            None, subject_id, subject_type_plural, utilities))
+    return conn.read_many_channel_presence(
+        slugs, earliest, latest, batch_size=batch_size, workers=workers)
+
+
+def _presence_slugs(slug, subject_id, subject_type_plural, utilities):
+    """Slugs of the channels to check for minimum_data_presence_for_range."""
     subject_type_plural = subject_type_plural or 'places'
     slugs = []
 
@@ -121,26 +204,25 @@ def minimum_data_presence_for_range(conn, earliest, latest, slug=None,
             slugs = [".".join([subject_type_plural, subject_id])]
     else:
         slugs = [slug]
+    return slugs
 
-    params = {
+
+def _presence_params(earliest, latest, slugs):
+    return {
         'qa_only': True,
         'quality_assurance': 'presence',
         'values__earliest': earliest.isoformat(),
         'values__latest': latest.isoformat(),
         'slug__in': ",".join(slugs)
     }
-    try:
-        resp = conn.get(
-            endpoint=conn.services['channel'], params=params
-        )
-    except HttpError as e:
-        raise APIError("API Error: {}".format(e))
 
-    if resp.status_code != 200:
-        raise APIError(
-            "API Error: ({}) {}".format(resp.status_code, resp.content))
 
-    _json = resp.json()
+def _minimum_presence(_json, slugs):
+    """Minimum presence over the channels in a presence response.
+
+    :raises: APIError if any of slugs weren't in the response
+
+    """
     if _json['meta']['total_count'] != len(slugs):
         present = [x['slug'] for x in _json['objects']]
         missing = set(slugs) - set(present)
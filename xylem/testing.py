@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A local stand-in for the rhizome API, for tests and benchmarks.
+
+It serves synthetic half-hourly (or any resolution) series of any length for
+as many channels as it is given, listing them page by page as the real API
+does, and accepts writes and creations without keeping their values::
+
+    with FakeRhizome(latency=0.01) as server:
+        server.add_channels('places.{0}.elec', 1000)
+        conn = Connection('fake', 'fake', root=server.root)
+
+Only the standard library is used.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlencode, urlparse
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote, urlencode
+    from urlparse import parse_qs, urlparse
+
+from xylem.formats import CSV, CSVCodec, JSON, codec_for
+from xylem.timeseries import from_epoch, to_epoch
+from xylem.timestamps import parse_timestamp
+
+API = '/api/v1'
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 1000
+
+# Conversion from kWh of the units that can be asked for.
+UNIT_FACTORS = {
+    'kWh': 1.0,
+    'pence': 14.5,
+    'kgCO2e': 0.45,
+}
+
+
+def usage(slug, period, resolution=1800):
+    """The synthetic usage of a channel in the period ending at `period`
+    seconds since the epoch: a daily cycle, offset per channel.
+    """
+    k = period // resolution + len(slug)
+    return 1 + (k % 48) / 10.0
+
+
+class FakeRhizome(object):
+    """Serve the channel and datauser endpoints on localhost in a thread."""
+
+    def __init__(self, latency=0, page_limit=DEFAULT_PAGE_LIMIT,
+                 max_limit=MAX_PAGE_LIMIT, formats=(JSON,), port=0):
+        """
+        :param float latency: Default 0, seconds to wait before answering
+            each request.
+        :param int page_limit: Default DEFAULT_PAGE_LIMIT, objects per page
+            if no limit is asked for.
+        :param int max_limit: Default MAX_PAGE_LIMIT, most objects per page.
+        :param tuple formats: Default (JSON,), content types the server can
+            answer in, as Accept asks, and take writes in. CSV is only
+            given for value reads.
+        :param int port: Default 0, any free port.
+
+        """
+        self.latency = latency
+        self.page_limit = page_limit
+        self.max_limit = max_limit
+        self.formats = formats
+        self.channels = OrderedDict()
+        self.datausers = OrderedDict()
+        self.permissions = {}
+        self.written = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', port), _make_handler(self))
+        self.root = 'http://127.0.0.1:{0}'.format(self._server.server_port)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_channel(self, slug, unit='kWh', value_type='accum', presence=1.0):
+        """Serve a channel.
+
+        :param str slug: its slug.
+        :param str unit: Default 'kWh', its default unit.
+        :param str value_type: Default 'accum', its default value type.
+        :param float presence: Default 1.0, its data presence, 0 to 1.
+
+        """
+        with self._lock:
+            self.channels[slug] = {
+                'slug': slug,
+                'unit': unit,
+                'value_type': value_type,
+                'presence': presence,
+                'resource_uri': '{0}/channel/{1}'.format(API, slug),
+            }
+
+    def add_channels(self, pattern, count, **kwargs):
+        """Serve pattern.format(n) for n in range(count), as add_channel."""
+        for n in range(count):
+            self.add_channel(pattern.format(n), **kwargs)
+
+    def _matching(self, query):
+        """Channels matching the slug filters of a list request."""
+        with self._lock:
+            channels = list(self.channels.values())
+        if 'slug' in query:
+            slugs = set(query['slug'])
+        elif 'slug__in' in query:
+            slugs = set(query['slug__in'][0].split(','))
+        else:
+            slugs = None
+        prefix = query.get('slug__startswith', [''])[0]
+        return [
+            ch for ch in channels
+            if (slugs is None or ch['slug'] in slugs) and
+            ch['slug'].startswith(prefix)
+        ]
+
+    def list_channels(self, path, query):
+        """Body of a channel list request."""
+        channels = self._matching(query)
+        limit = int(query.get('limit', [self.page_limit])[0])
+        limit = min(limit or self.max_limit, self.max_limit)
+        offset = int(query.get('offset', ['0'])[0])
+        page = channels[offset:offset + limit]
+        meta = {
+            'limit': limit,
+            'offset': offset,
+            'total_count': len(channels),
+            'next': None,
+            'previous': None,
+        }
+        if offset + limit < len(channels):
+            params = dict(query, limit=[limit], offset=[offset + limit])
+            meta['next'] = '{0}?{1}'.format(
+                path, urlencode(sorted(params.items()), doseq=True))
+
+        user = query.get('user', [None])[0]
+        if user is not None:
+            meta['user'] = user
+        if 'values__earliest' not in query:
+            return meta, [self._public(ch, user) for ch in page]
+
+        earliest = to_epoch(parse_timestamp(query['values__earliest'][0]))
+        latest = to_epoch(parse_timestamp(query['values__latest'][0]))
+        resolution = int(query.get('resolution', ['1800'])[0])
+        # Like the API, units are one comma-separated parameter.
+        units = query['units'][0].split(',') if 'units' in query else None
+        if units:
+            meta['units'] = units
+        meta['values__earliest'] = query['values__earliest'][0]
+        meta['values__latest'] = query['values__latest'][0]
+        objects = []
+        for ch in page:
+            obj = self._public(ch, user)
+            if query.get('qa_only'):
+                obj['quality_assurance'] = [
+                    [from_epoch(earliest).isoformat(), [ch['presence']]]]
+            else:
+                value_type = query.get('value_type', [ch['value_type']])[0]
+                obj['values'] = self.values(
+                    ch['slug'], earliest, latest, resolution, value_type,
+                    units or [ch['unit']])
+            objects.append(obj)
+        return meta, objects
+
+    def _public(self, channel, user=None):
+        """A channel as listed, with user's permissions on it if given."""
+        obj = dict((k, v) for k, v in channel.items() if k != 'presence')
+        if user is not None:
+            with self._lock:
+                obj['permissions'] = list(
+                    self.permissions.get((user, channel['slug']), []))
+        return obj
+
+    def values(self, slug, earliest, latest, resolution, value_type, units):
+        """Synthetic values of a channel, as the API returns them.
+
+        Accumulations start from 0 at earliest; usage is given at the end of
+        each period, so starts a period after earliest.
+
+        """
+        factors = [UNIT_FACTORS.get(unit, 1.0) for unit in units]
+        values = []
+        total = 0.0
+        ts = earliest if value_type == 'accum' else earliest + resolution
+        when = from_epoch(ts)
+        step = timedelta(seconds=resolution)
+        while ts <= latest:
+            if value_type == 'accum':
+                if ts > earliest:
+                    total += usage(slug, ts, resolution)
+                value = total
+            else:
+                value = usage(slug, ts, resolution)
+            if len(factors) > 1:
+                value = [value * factor for factor in factors]
+            else:
+                value = value * factors[0]
+            values.append([when.isoformat(), value])
+            ts += resolution
+            when += step
+        return values
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _make_handler(fake):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately; don't let the body wait
+        # for the client to acknowledge the headers.
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_document(self, status, body, values=False, etag=False):
+            """Send body in the format asked for, CSV only if values.
+
+            If etag, tag the body, and answer 304 Not Modified instead if
+            If-None-Match has the same tag.
+            """
+            content_type = self.negotiate(values)
+            if content_type == CSV:
+                units = body['meta'].get('units') or [
+                    ch['unit'] for ch in body['objects'][:1]] or ['kWh']
+                content = CSVCodec.encode_values(units, body['objects'])
+            else:
+                content = codec_for(content_type).encode(body)
+            tag = None
+            if etag and status == 200:
+                tag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+                if self.headers.get('If-None-Match') == tag:
+                    status, content = 304, b''
+            self.send_response(status)
+            if tag is not None:
+                self.send_header('ETag', tag)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def negotiate(self, values):
+            """The most wanted of the server's formats in the Accept header.
+            """
+            wanted = []
+            for ix, part in enumerate(
+                    (self.headers.get('Accept') or JSON).split(',')):
+                fields = part.strip().split(';')
+                q = 1.0
+                for param in fields[1:]:
+                    name, _, value = param.strip().partition('=')
+                    if name == 'q':
+                        q = float(value)
+                wanted.append((-q, ix, fields[0].strip()))
+            for _, _, content_type in sorted(wanted):
+                if content_type in fake.formats and codec_for(content_type) \
+                        and (values or content_type != CSV):
+                    return content_type
+            return JSON
+
+        def read_document(self):
+            """The body of a write, or None if it isn't in a format the
+            server takes."""
+            content_type = self.headers.get('Content-Type') or JSON
+            length = int(self.headers.get('Content-Length') or 0)
+            content = self.rfile.read(length)
+            codec = codec_for(content_type)
+            if content_type not in fake.formats or codec is None or \
+                    not codec.can_encode:
+                return None
+            return codec.decode(content)
+
+        def begin(self):
+            with fake._lock:
+                fake.requests += 1
+            if fake.latency:
+                time.sleep(fake.latency)
+            url = urlparse(self.path)
+            return url.path.rstrip('/'), url.path, parse_qs(url.query)
+
+        def do_GET(self):
+            path, raw_path, query = self.begin()
+            if path == API:
+                return self.send_document(200, {
+                    'channel': {'list_endpoint': API + '/channel/'},
+                    'datauser': {'list_endpoint': API + '/datauser/'},
+                }, etag=True)
+            if path == API + '/channel':
+                meta, objects = fake.list_channels(raw_path, query)
+                values = 'values__earliest' in query
+                return self.send_document(
+                    200, {'meta': meta, 'objects': objects},
+                    values=values and not query.get('qa_only'),
+                    etag=not values)
+            if path == API + '/datauser':
+                with fake._lock:
+                    users = list(fake.datausers.values())
+                return self.send_document(200, {
+                    'meta': {'next': None, 'total_count': len(users)},
+                    'objects': users,
+                }, etag=True)
+            if path.startswith(API + '/datauser/'):
+                user = fake.datausers.get(unquote(path.rsplit('/', 1)[1]))
+                if user is None:
+                    return self.send_document(404, {'error': 'No such user'})
+                return self.send_document(200, user, etag=True)
+            self.send_document(404, {'error': 'Not found'})
+
+        def do_PATCH(self):
+            path, _, _ = self.begin()
+            slug = path[len(API + '/channel/'):]
+            body = self.read_document()
+            if body is None:
+                return self.send_document(415, {'error': 'Unsupported format'})
+            if slug not in fake.channels:
+                return self.send_document(404, {'error': 'No such channel'})
+            with fake._lock:
+                if 'permissions' in body:
+                    fake.permissions[(body['user'], slug)] = list(
+                        body['permissions'])
+                else:
+                    fake.written[slug] = (
+                        fake.written.get(slug, 0) + len(body['values']))
+            self.send_document(202, {})
+
+        def do_POST(self):
+            path, _, _ = self.begin()
+            body = self.read_document()
+            if body is None:
+                return self.send_document(415, {'error': 'Unsupported format'})
+            if path == API + '/channel':
+                if body.get('slug') in fake.channels:
+                    return self.send_document(400, {'error': 'Slug exists'})
+                fake.add_channel(body['slug'], **dict(
+                    (k, body[k]) for k in ['unit', 'value_type'] if k in body))
+                return self.send_document(201, {})
+            if path == API + '/datauser':
+                with fake._lock:
+                    fake.datausers[body['access_name']] = body
+                return self.send_document(201, {})
+            self.send_document(404, {'error': 'Not found'})
+
+    return Handler
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Column-oriented container for channel values, backed by numpy arrays."""
+import calendar
+from collections import OrderedDict
+from datetime import datetime
+
+import pytz
+
+from xylem.timestamps import parse_epochs
+
+
+def _numpy():
+    """Import numpy, which is only needed once a TimeSeries is built."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "TimeSeries requires numpy: pip install xylem[numpy]")
+    return numpy
+
+
+def to_epoch(ts):
+    """Seconds since the epoch of an aware datetime.
+
+    :param datetime ts: timezone-aware timestamp.
+    :rtype int:
+
+    """
+    return calendar.timegm(ts.utctimetuple())
+
+
+def from_epoch(seconds):
+    """UTC datetime for seconds since the epoch.
+
+    :param int seconds: seconds since the epoch.
+    :rtype datetime:
+
+    """
+    return datetime.utcfromtimestamp(seconds).replace(tzinfo=pytz.utc)
+
+
+class TimeSeries(object):
+    """Channel values held as one array of timestamps and one per unit.
+
+    Timestamps are int64 seconds since the epoch, values are float64 with
+    missing values as NaN. Slicing returns views on the same arrays.
+
+    """
+
+    def __init__(self, timestamps, columns, value_type=None):
+        """
+        :param sequence timestamps: seconds since the epoch, ascending.
+        :param columns: (unit, values) pairs, or a dict of values by unit,
+            each as long as timestamps.
+        :param str value_type: e.g. 'accum' or 'usage', if known.
+
+        """
+        np = _numpy()
+        self.timestamps = np.asarray(timestamps, dtype='int64')
+        if isinstance(columns, dict):
+            columns = columns.items()
+        self.columns = OrderedDict(
+            (unit, np.asarray(values, dtype='float64'))
+            for unit, values in columns
+        )
+        for unit, values in self.columns.items():
+            if values.shape != self.timestamps.shape:
+                raise ValueError(
+                    "Column {0} has {1} values for {2} timestamps".format(
+                        unit, len(values), len(self.timestamps)))
+        self.value_type = value_type
+
+    @classmethod
+    def from_values(cls, values, units, value_type=None, resolution=None):
+        """Build from a channel's values as returned by the API.
+
+        :param list values: [(iso timestamp, value or [value per unit]), ...]
+        :param list units: units of the values, in order.
+        :param str value_type: e.g. 'accum' or 'usage', if known.
+        :param int resolution: seconds between points, if requested at a
+            resolution (see xylem.timestamps.parse_epochs).
+
+        """
+        np = _numpy()
+        timestamps = np.array(
+            parse_epochs([x[0] for x in values], resolution), dtype='int64')
+        data = np.array(
+            [x[1] if len(units) > 1 else [x[1]] for x in values],
+            dtype='float64').reshape(len(values), len(units))
+        return cls(
+            timestamps,
+            [(unit, data[:, ix]) for ix, unit in enumerate(units)],
+            value_type,
+        )
+
+    @classmethod
+    def from_dict(cls, results, value_type=None):
+        """Build from read_channel_values' dict of values by timestamp.
+
+        :param dict results: {timestamp: {unit: value}}
+        :param str value_type: e.g. 'accum' or 'usage', if known.
+
+        """
+        stamps = sorted(results)
+        units = list(results[stamps[0]]) if stamps else []
+        return cls(
+            [to_epoch(ts) for ts in stamps],
+            [
+                (unit, [results[ts][unit] for ts in stamps])
+                for unit in units
+            ],
+            value_type,
+        )
+
+    @classmethod
+    def stitch(cls, parts):
+        """Join series read window by window as if read in one request.
+
+        See xylem.connection.stitch_windows for the rules applied at window
+        boundaries.
+
+        :param list parts: [(value type, TimeSeries), ...] in window order.
+
+        """
+        np = _numpy()
+        pieces = []
+        last = None
+        # Last non-missing value of each unit, to offset accumulations by.
+        totals = {}
+        value_type = None
+        for value_type, series in parts:
+            if last is not None:
+                series = series[np.searchsorted(
+                    series.timestamps, last, side='right'):]
+                if value_type == 'accum':
+                    series = series._with_columns(
+                        (unit, values + totals.get(unit, 0))
+                        for unit, values in series.columns.items()
+                    )
+            if len(series):
+                last = series.timestamps[-1]
+                for unit, values in series.columns.items():
+                    present = values[~np.isnan(values)]
+                    if len(present):
+                        totals[unit] = present[-1]
+                pieces.append(series)
+        if not pieces:
+            return cls([], {}, value_type)
+        units = list(pieces[0].columns)
+        return cls(
+            np.concatenate([p.timestamps for p in pieces]),
+            [
+                (unit, np.concatenate([p.columns[unit] for p in pieces]))
+                for unit in units
+            ],
+            value_type,
+        )
+
+    def _with_columns(self, columns, timestamps=None, value_type=None):
+        return TimeSeries(
+            self.timestamps if timestamps is None else timestamps,
+            columns,
+            value_type or self.value_type,
+        )
+
+    @property
+    def units(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def __getitem__(self, key):
+        """Index by unit for a column, or by position or slice for points.
+
+        A slice may also be given as datetimes, see between().
+
+        """
+        if isinstance(key, slice):
+            if isinstance(key.start, datetime) or \
+                    isinstance(key.stop, datetime):
+                return self.between(key.start, key.stop)
+            return self._with_columns(
+                ((unit, values[key]) for unit, values in self.columns.items()),
+                self.timestamps[key],
+            )
+        if key in self.columns:
+            return self.columns[key]
+        return (
+            from_epoch(self.timestamps[key]),
+            dict(
+                (unit, _scalar(values[key]))
+                for unit, values in self.columns.items()
+            ),
+        )
+
+    def __repr__(self):
+        return '<TimeSeries {0} points of {1} ({2})>'.format(
+            len(self), ', '.join(self.units), self.value_type)
+
+    def between(self, earliest=None, latest=None):
+        """Points from earliest to latest, inclusive, as a view.
+
+        :param datetime earliest: Default None, from the first point.
+        :param datetime latest: Default None, up to the last point.
+        :rtype TimeSeries:
+
+        """
+        np = _numpy()
+        start = 0
+        stop = len(self)
+        if earliest is not None:
+            start = np.searchsorted(self.timestamps, to_epoch(earliest))
+        if latest is not None:
+            stop = np.searchsorted(
+                self.timestamps, to_epoch(latest), side='right')
+        return self[start:stop]
+
+    def datetimes(self):
+        """The timestamps as a list of UTC datetimes."""
+        return [from_epoch(ts) for ts in self.timestamps.tolist()]
+
+    def to_dict(self):
+        """The legacy read_channel_values view: {timestamp: {unit: value}}.
+        """
+        np = _numpy()
+        columns = [
+            (unit, [None if np.isnan(v) else v for v in values.tolist()])
+            for unit, values in self.columns.items()
+        ]
+        return dict(
+            (ts, dict((unit, values[ix]) for unit, values in columns))
+            for ix, ts in enumerate(self.datetimes())
+        )
+
+    def to_numpy(self):
+        """Timestamps and a (points, units) array of values, in unit order.
+
+        :rtype (numpy.ndarray, numpy.ndarray):
+
+        """
+        np = _numpy()
+        if not self.columns:
+            return self.timestamps, np.empty((len(self), 0))
+        return self.timestamps, np.column_stack(list(self.columns.values()))
+
+    def to_usage(self):
+        """Usage over each period, from accumulated values.
+
+        The first point is the origin of the accumulation, so has no usage
+        and is dropped, just as when reading with value_type='usage'.
+
+        :rtype TimeSeries:
+
+        """
+        np = _numpy()
+        if self.value_type == 'usage':
+            return self
+        return self._with_columns(
+            ((unit, np.diff(values)) for unit, values in self.columns.items()),
+            self.timestamps[1:],
+            'usage',
+        )
+
+    def to_accum(self, resolution=None):
+        """Accumulated values, from usage over each period.
+
+        An origin point of 0 is added one period before the first point,
+        just as when reading with value_type='accum'. Missing usage adds
+        nothing to the accumulation, and stays missing.
+
+        :param int resolution: seconds per period; defaults to the spacing of
+            the first two points.
+        :rtype TimeSeries:
+
+        """
+        np = _numpy()
+        if self.value_type == 'accum':
+            return self
+        if not len(self):
+            return self._with_columns(self.columns.items(), None, 'accum')
+        if resolution is None:
+            if len(self) < 2:
+                raise ValueError("Need a resolution for a single point")
+            resolution = self.timestamps[1] - self.timestamps[0]
+        columns = []
+        for unit, values in self.columns.items():
+            accum = np.cumsum(np.nan_to_num(values))
+            accum[np.isnan(values)] = np.nan
+            columns.append((unit, np.concatenate([[0.0], accum])))
+        return self._with_columns(
+            columns,
+            np.concatenate(
+                [[self.timestamps[0] - resolution], self.timestamps]),
+            'accum',
+        )
+
+    def resample(self, resolution, tz=None):
+        """Roll up into coarser periods, see xylem.resample.resample.
+
+        :param resolution: seconds per period, or 'day', 'week' or 'month'.
+        :param tz: Default None, timezone (or its name) whose calendar the
+            periods follow.
+        :rtype TimeSeries:
+
+        """
+        from xylem.resample import resample
+        return resample(self, resolution, tz)
+
+
+def _scalar(value):
+    """A numpy float as a plain float, or None for NaN."""
+    value = float(value)
+    return None if value != value else value